@@ -0,0 +1,49 @@
+"""
+Gunicorn configuration for production serving
+Run with: gunicorn -c gunicorn.conf.py src.backend.main:app
+
+The app is preloaded in the master, so HUP only restarts the workers with the
+code already in memory (it does re-read this file). To deploy new code:
+  OLD=$(cat /tmp/wcah-backend.pid)
+  kill -USR2 $OLD   # new master (pid in /tmp/wcah-backend.pid.2) and workers on the new code
+  kill -TERM $OLD   # once they're up, stop the old master; the new one takes over the pidfile
+or stop and start the server.
+"""
+import os
+import multiprocessing
+
+bind = os.getenv("WCAH_BIND", "0.0.0.0:8000")
+workers = int(os.getenv("WCAH_WORKERS", multiprocessing.cpu_count()))
+# UvicornWorker uses uvloop and httptools when installed (uvicorn[standard])
+worker_class = "uvicorn.workers.UvicornWorker"
+
+# Import the app once in the master so workers fork with it already loaded.
+# This is why HUP can't pick up new code; see the module docstring.
+preload_app = True
+
+keepalive = int(os.getenv("WCAH_KEEPALIVE", "5"))
+backlog = int(os.getenv("WCAH_BACKLOG", "2048"))
+timeout = int(os.getenv("WCAH_WORKER_TIMEOUT", "30"))
+graceful_timeout = int(os.getenv("WCAH_GRACEFUL_TIMEOUT", "30"))
+# Recycle workers periodically, jittered so they don't all restart at once
+max_requests = int(os.getenv("WCAH_MAX_REQUESTS", "10000"))
+max_requests_jitter = max_requests // 10
+
+pidfile = os.getenv("WCAH_PIDFILE", "/tmp/wcah-backend.pid")
+# The app writes its own structured access log (src/backend/logs.py) unless WCAH_LOG_ENABLED=0
+accesslog = None if os.getenv("WCAH_LOG_ENABLED", "1") == "1" else "-"
+errorlog = "-"
+
+
+def on_starting(server):
+    """Create the schema once in the master, before any worker races to do it"""
+    from src.backend.database import init_db
+
+    init_db()
+
+
+def post_fork(server, worker):
+    """Give each worker its own SQLite connections instead of the master's"""
+    from src.backend.database import dispose_engine
+
+    dispose_engine()
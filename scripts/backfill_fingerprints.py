@@ -0,0 +1,71 @@
+"""
+Fingerprint existing notes for duplicate detection
+Fingerprints are computed in parallel worker processes and written in batches
+"""
+import sys
+import time
+import argparse
+from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor
+
+sys.path.append(str(Path(__file__).parent.parent))
+
+from src.backend.database import SessionLocal
+from src.backend.models import StudyNote, NoteFingerprint
+from src.backend.dedup import compute_fingerprint, find_duplicate, index_note
+
+
+def backfill(batch_size: int, workers: int, link: bool):
+    db = SessionLocal()
+    indexed = linked = 0
+    start = time.perf_counter()
+    try:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            last_id = 0
+            while True:
+                notes = db.query(StudyNote).outerjoin(
+                    NoteFingerprint, NoteFingerprint.note_id == StudyNote.id
+                ).filter(
+                    NoteFingerprint.note_id.is_(None),
+                    StudyNote.id > last_id
+                ).order_by(StudyNote.id).limit(batch_size).all()
+                if not notes:
+                    break
+
+                contents = [note.content for note in notes]
+                chunksize = max(1, len(contents) // (workers * 4))
+                fingerprints = executor.map(compute_fingerprint, contents, chunksize=chunksize)
+                for note, fingerprint in zip(notes, fingerprints):
+                    duplicate = None
+                    if link:
+                        # Oldest note wins, since notes are processed in id order
+                        db.flush()
+                        duplicate = find_duplicate(db, note.topic_id, fingerprint)
+                        linked += duplicate is not None
+                    index_note(db, note.id, note.topic_id, fingerprint, duplicate[0] if duplicate else None)
+                db.commit()
+                indexed += len(notes)
+                last_id = notes[-1].id
+                print(f"   ... {indexed} notes fingerprinted")
+    finally:
+        db.close()
+
+    elapsed = time.perf_counter() - start
+    print(f"✅ Fingerprinted {indexed} notes in {elapsed:.1f}s")
+    if link:
+        print(f"🔗 Linked {linked} duplicates to their originals")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fingerprint existing notes for duplicate detection")
+    parser.add_argument("--batch-size", type=int, default=500)
+    parser.add_argument("--workers", type=int, default=None, help="Worker processes (default: CPU count)")
+    parser.add_argument("--link", action="store_true", help="Also link existing duplicates to the oldest matching note")
+    args = parser.parse_args()
+
+    print("🔍 Fingerprinting notes without a fingerprint...")
+    backfill(args.batch_size, args.workers, args.link)
+
+
+if __name__ == "__main__":
+    main()
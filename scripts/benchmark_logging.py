@@ -0,0 +1,83 @@
+"""
+Access logging overhead benchmark
+Measures the per-request cost of the structured access log middleware around a
+trivial ASGI app, with records written to a scratch file by the listener thread
+"""
+import os
+import sys
+import time
+import asyncio
+import shutil
+import argparse
+import tempfile
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).parent.parent))
+
+SCRATCH_DIR = tempfile.mkdtemp()
+os.environ["WCAH_LOG_FILE"] = str(Path(SCRATCH_DIR) / "access.log")
+
+from src.backend.logs import AccessLogMiddleware, log_pipeline
+
+
+async def plain_app(scope, receive, send):
+    await send({"type": "http.response.start", "status": 200, "headers": [(b"content-type", b"application/json")]})
+    await send({"type": "http.response.body", "body": b"{}"})
+
+
+async def receive():
+    return {"type": "http.request", "body": b""}
+
+
+async def discard(message):
+    pass
+
+
+async def time_requests(app, requests: int) -> float:
+    """Mean microseconds per request"""
+    start = time.perf_counter()
+    for _ in range(requests):
+        scope = {
+            "type": "http", "method": "GET", "path": "/api/notes/topic/1", "query_string": b"",
+            "headers": [(b"authorization", b"Bearer token")], "client": ("127.0.0.1", 50000),
+        }
+        await app(scope, receive, discard)
+    return (time.perf_counter() - start) / requests * 1e6
+
+
+async def run(requests: int, sample_rates):
+    log_pipeline.start()
+    try:
+        baseline = min([await time_requests(plain_app, requests) for _ in range(3)])
+        results = []
+        for rate in sample_rates:
+            app = AccessLogMiddleware(plain_app, sample_rate=rate)
+            results.append((rate, min([await time_requests(app, requests) for _ in range(3)]) - baseline))
+        return results
+    finally:
+        log_pipeline.stop()
+
+
+def main():
+    """Main benchmark function"""
+    parser = argparse.ArgumentParser(description="Benchmark access logging overhead")
+    parser.add_argument("--requests", type=int, default=20000)
+    parser.add_argument("--request-ms", type=float, default=3.0, help="typical request latency to compare against")
+    args = parser.parse_args()
+
+    try:
+        results = asyncio.run(run(args.requests, [1.0, 0.1, 0.01]))
+    finally:
+        shutil.rmtree(SCRATCH_DIR, ignore_errors=True)
+
+    print(f"\n🪵 Access log overhead over {args.requests} requests")
+    print("-" * 60)
+    for rate, overhead_us in results:
+        share = overhead_us / (args.request_ms * 1000) * 100
+        status = "✅" if share < 2 else "⚠️ "
+        print(f"  {status} sample rate {rate:<5} {overhead_us:>7.1f} µs/request  ({share:.1f}% of a {args.request_ms:g} ms request)")
+    print()
+
+
+if __name__ == "__main__":
+    main()
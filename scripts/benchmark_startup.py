@@ -0,0 +1,73 @@
+"""
+Startup benchmark
+Measures the import time of the backend app with `python -X importtime`
+and fails if it exceeds the budget or eagerly imports deferred modules
+"""
+import sys
+import argparse
+import statistics
+import subprocess
+from pathlib import Path
+
+PROJECT_ROOT = Path(__file__).parent.parent
+TARGET_MODULE = "src.backend.main"
+
+# Modules that must only be imported on first use
+DEFERRED_MODULES = ("jose", "passlib", "alembic", "numpy", "scipy")
+
+
+def run_importtime() -> dict:
+    """Import the app in a fresh interpreter and return cumulative import time (us) per module"""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {TARGET_MODULE}"],
+        cwd=PROJECT_ROOT,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    timings = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative_us, name = line[len("import time:"):].split("|")
+        timings[name.strip()] = int(cumulative_us)
+    return timings
+
+
+def main():
+    """Main benchmark function"""
+    parser = argparse.ArgumentParser(description="Benchmark backend import time")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--budget-ms", type=float, default=1500.0, help="median import time budget")
+    parser.add_argument("--top", type=int, default=10, help="show the N slowest top-level imports")
+    args = parser.parse_args()
+
+    runs = [run_importtime() for _ in range(args.runs)]
+    totals_ms = [run[TARGET_MODULE] / 1000 for run in runs]
+    median_ms = statistics.median(totals_ms)
+
+    print(f"\n⏱️  Import time for {TARGET_MODULE} ({args.runs} runs)")
+    print("-" * 60)
+    print(f"  Median: {median_ms:.1f} ms   Min: {min(totals_ms):.1f} ms   Max: {max(totals_ms):.1f} ms")
+
+    print(f"\n  Slowest modules (last run):")
+    slowest = sorted(runs[-1].items(), key=lambda item: item[1], reverse=True)
+    for name, cumulative_us in slowest[1:args.top + 1]:
+        print(f"    {name:.<45} {cumulative_us / 1000:>8.1f} ms")
+
+    failed = False
+    eager = sorted({name for name in runs[-1] if name.split(".")[0] in DEFERRED_MODULES})
+    if eager:
+        print(f"\n❌ Deferred modules imported at startup: {', '.join(eager)}")
+        failed = True
+    if median_ms > args.budget_ms:
+        print(f"\n❌ Median {median_ms:.1f} ms exceeds budget of {args.budget_ms:.0f} ms")
+        failed = True
+
+    if failed:
+        sys.exit(1)
+    print(f"\n✅ Within budget of {args.budget_ms:.0f} ms\n")
+
+
+if __name__ == "__main__":
+    main()
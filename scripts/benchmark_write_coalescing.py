@@ -0,0 +1,114 @@
+"""
+Write coalescing benchmark
+Compares comment throughput with one commit per write against batched commits,
+using a scratch copy of the schema so the real database is untouched
+"""
+import sys
+import time
+import asyncio
+import argparse
+import tempfile
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).parent.parent))
+
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import sessionmaker
+from src.backend.database import Base, set_sqlite_pragmas
+from src.backend.models import User, Course, Topic, StudyNote, Comment, NoteType
+from src.backend.writebatch import WriteCoalescer
+
+
+def make_session_factory(db_path: Path):
+    """Create a scratch database with one note to comment on"""
+    engine = create_engine(f"sqlite:///{db_path}", connect_args={"check_same_thread": False})
+    event.listen(engine, "connect", set_sqlite_pragmas)
+    Base.metadata.create_all(bind=engine)
+    Session = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+    db = Session()
+    user = User(username="bench", email="bench@example.com", password_hash="x", identity="professor")
+    db.add(user)
+    db.flush()
+    course = Course(course_code="BENCH101", course_name="Bench", creator_id=user.id)
+    db.add(course)
+    db.flush()
+    topic = Topic(title="Bench", course_id=course.id)
+    db.add(topic)
+    db.flush()
+    note = StudyNote(title="Bench", content="x", note_type=NoteType.Other, topic_id=topic.id, author_id=user.id)
+    db.add(note)
+    db.commit()
+    ids = (user.id, note.id)
+    db.close()
+    return Session, ids
+
+
+def comment_op(user_id: int, note_id: int):
+    def apply(db):
+        db.add(Comment(note_id=note_id, user_id=user_id, content="benchmark comment"))
+        return True
+    return apply
+
+
+async def run_individual(Session, ids, writes: int, concurrency: int) -> float:
+    """Each write in its own session and commit, as the routes do without coalescing"""
+    loop = asyncio.get_running_loop()
+    semaphore = asyncio.Semaphore(concurrency)
+
+    def write_one():
+        db = Session()
+        try:
+            comment_op(*ids)(db)
+            db.commit()
+        finally:
+            db.close()
+
+    async def worker():
+        async with semaphore:
+            await loop.run_in_executor(None, write_one)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(writes)))
+    return time.perf_counter() - start
+
+
+async def run_coalesced(Session, ids, writes: int, concurrency: int) -> float:
+    """All writes submitted concurrently through the coalescer"""
+    coalescer = WriteCoalescer(session_factory=Session, queue_size=max(writes, 1))
+    coalescer.start()
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def worker():
+        async with semaphore:
+            await coalescer.submit(comment_op(*ids))
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(writes)))
+    elapsed = time.perf_counter() - start
+    await coalescer.stop()
+    return elapsed
+
+
+def main():
+    """Main benchmark function"""
+    parser = argparse.ArgumentParser(description="Benchmark write coalescing")
+    parser.add_argument("--writes", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=200, help="in-flight writes")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        Session, ids = make_session_factory(Path(tmp) / "individual.db")
+        individual = asyncio.run(run_individual(Session, ids, args.writes, args.concurrency))
+        Session, ids = make_session_factory(Path(tmp) / "coalesced.db")
+        coalesced = asyncio.run(run_coalesced(Session, ids, args.writes, args.concurrency))
+
+    print(f"\n📝 {args.writes} comment writes, {args.concurrency} in flight")
+    print("-" * 60)
+    print(f"  One commit per write: {args.writes / individual:>10.0f} writes/s")
+    print(f"  Coalesced batches:    {args.writes / coalesced:>10.0f} writes/s")
+    print(f"  Speedup:              {individual / coalesced:>10.1f}x\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,39 @@
+"""
+Build or update the read-only snapshot served in exam mode (WCAH_SNAPSHOT_MODE=1)
+Only courses whose content changed since the last build are re-rendered; running
+workers pick up the new manifest within WCAH_SNAPSHOT_RELOAD_SECONDS.
+"""
+import sys
+import time
+import argparse
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).parent.parent))
+
+from src.backend.database import SessionLocal, init_db
+from src.backend.snapshot import build_snapshot, SNAPSHOT_DIR
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build or update the exam-mode snapshot")
+    parser.add_argument("--dir", type=Path, default=SNAPSHOT_DIR, help=f"Snapshot directory (default {SNAPSHOT_DIR})")
+    parser.add_argument("--full", action="store_true", help="Re-render every course, changed or not")
+    parser.add_argument("--quiet", action="store_true", help="Only print the summary")
+    args = parser.parse_args()
+
+    print(f"📸 Building snapshot in {args.dir}...")
+    init_db()
+    db = SessionLocal()
+    start = time.perf_counter()
+    try:
+        result = build_snapshot(db, args.dir, args.full, progress=(lambda _: None) if args.quiet else (lambda line: print(f"   ... {line}")))
+    finally:
+        db.close()
+
+    elapsed = time.perf_counter() - start
+    print(f"✅ Rebuilt {result['rebuilt']} of {result['courses']} courses in {elapsed:.1f}s "
+          f"({result['bytes'] / 1024 / 1024:.1f} MB, {result['removed']} stale files removed)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,125 @@
+"""
+Password hash calibration utility
+Finds the highest cost parameter whose verify latency stays within a target budget
+on the current machine, and prints the environment settings to use it
+"""
+import sys
+import os
+import time
+import argparse
+import statistics
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.append(str(Path(__file__).parent.parent))
+
+from src.backend.auth import build_pwd_context, ARGON2_MEMORY_COST, ARGON2_PARALLELISM
+
+SAMPLE_PASSWORD = "calibration-password-123"
+
+# Cost ranges to search, lowest first
+BCRYPT_ROUNDS_RANGE = range(4, 17)
+ARGON2_TIME_COST_RANGE = range(1, 11)
+
+
+def measure_verify(context, samples: int, concurrency: int) -> dict:
+    """Measure verify latency (ms) for a context, optionally under concurrent load"""
+    hashed = context.hash(SAMPLE_PASSWORD)
+
+    def timed_verify(_):
+        start = time.perf_counter()
+        context.verify(SAMPLE_PASSWORD, hashed)
+        return (time.perf_counter() - start) * 1000
+
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        timings = sorted(pool.map(timed_verify, range(samples)))
+
+    p99_index = min(len(timings) - 1, int(len(timings) * 0.99))
+    return {
+        "median": statistics.median(timings),
+        "p99": timings[p99_index],
+    }
+
+
+def calibrate_bcrypt(target_ms: float, samples: int, concurrency: int):
+    """Return the highest bcrypt rounds whose p99 verify stays within target"""
+    best = None
+    for rounds in BCRYPT_ROUNDS_RANGE:
+        context = build_pwd_context(schemes=["bcrypt"], bcrypt_rounds=rounds)
+        result = measure_verify(context, samples, concurrency)
+        print(f"  bcrypt rounds={rounds:<3} median={result['median']:8.1f} ms  p99={result['p99']:8.1f} ms")
+        if result["p99"] > target_ms:
+            break
+        best = rounds
+    return best
+
+
+def calibrate_argon2(target_ms: float, samples: int, concurrency: int, memory_cost: int, parallelism: int):
+    """Return the highest argon2 time cost whose p99 verify stays within target"""
+    best = None
+    for time_cost in ARGON2_TIME_COST_RANGE:
+        context = build_pwd_context(
+            schemes=["argon2"],
+            argon2_time_cost=time_cost,
+            argon2_memory_cost=memory_cost,
+            argon2_parallelism=parallelism,
+        )
+        result = measure_verify(context, samples, concurrency)
+        print(f"  argon2 time_cost={time_cost:<3} median={result['median']:8.1f} ms  p99={result['p99']:8.1f} ms")
+        if result["p99"] > target_ms:
+            break
+        best = time_cost
+    return best
+
+
+def main():
+    """Main calibration function"""
+    parser = argparse.ArgumentParser(description="Calibrate password hash cost to a verify latency budget")
+    parser.add_argument("--scheme", choices=["bcrypt", "argon2"], default="bcrypt")
+    parser.add_argument("--target-ms", type=float, default=250.0, help="p99 verify latency budget in milliseconds")
+    parser.add_argument("--samples", type=int, default=20, help="verifications per cost level")
+    parser.add_argument(
+        "--concurrency",
+        type=int,
+        default=os.cpu_count() or 1,
+        help="concurrent verifications (defaults to the CPU count, to model a loaded box)",
+    )
+    parser.add_argument("--argon2-memory-cost", type=int, default=ARGON2_MEMORY_COST, help="argon2 memory in KiB")
+    parser.add_argument("--argon2-parallelism", type=int, default=ARGON2_PARALLELISM)
+    args = parser.parse_args()
+
+    print(f"\n🔐 Calibrating {args.scheme} for p99 <= {args.target_ms:.0f} ms "
+          f"({args.concurrency} concurrent, {args.samples} samples per level)")
+    print("-" * 60)
+
+    try:
+        if args.scheme == "bcrypt":
+            best = calibrate_bcrypt(args.target_ms, args.samples, args.concurrency)
+        else:
+            best = calibrate_argon2(
+                args.target_ms, args.samples, args.concurrency,
+                args.argon2_memory_cost, args.argon2_parallelism,
+            )
+    except Exception as e:
+        print(f"❌ Calibration failed: {e}")
+        sys.exit(1)
+
+    print("-" * 60)
+    if best is None:
+        print("❌ Even the lowest cost exceeds the budget; raise --target-ms or lower --concurrency")
+        sys.exit(1)
+
+    print("✅ Recommended settings:")
+    if args.scheme == "bcrypt":
+        print("   WCAH_PASSWORD_SCHEMES=bcrypt")
+        print(f"   WCAH_BCRYPT_ROUNDS={best}")
+    else:
+        print("   WCAH_PASSWORD_SCHEMES=argon2,bcrypt")
+        print(f"   WCAH_ARGON2_TIME_COST={best}")
+        print(f"   WCAH_ARGON2_MEMORY_COST={args.argon2_memory_cost}")
+        print(f"   WCAH_ARGON2_PARALLELISM={args.argon2_parallelism}")
+    print("   Existing hashes are upgraded on each user's next login.\n")
+
+
+if __name__ == "__main__":
+    main()
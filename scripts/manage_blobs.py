@@ -0,0 +1,71 @@
+"""
+Blob store maintenance
+  offload: move existing note bodies above the size threshold into the blob store
+  gc:      delete blobs no longer referenced by any note or attachment
+"""
+import sys
+import argparse
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).parent.parent))
+
+from sqlalchemy import func
+
+from src.backend.database import SessionLocal
+from src.backend.models import StudyNote
+from src.backend.blobstore import (
+    blob_store, collect_garbage, BODY_REF_PREFIX, NOTE_BODY_OFFLOAD_BYTES
+)
+
+
+def offload_note_bodies(batch_size: int):
+    if not NOTE_BODY_OFFLOAD_BYTES:
+        print("❌ WCAH_NOTE_BODY_OFFLOAD_BYTES is 0; offloading is disabled")
+        return
+
+    db = SessionLocal()
+    moved = 0
+    try:
+        last_id = 0
+        while True:
+            # length() counts characters, so this may include a few bodies that stay inline
+            notes = db.query(StudyNote).filter(
+                StudyNote.id > last_id,
+                func.length(StudyNote._content) > NOTE_BODY_OFFLOAD_BYTES // 4,
+                ~StudyNote._content.like(BODY_REF_PREFIX + "%")
+            ).order_by(StudyNote.id).limit(batch_size).all()
+            if not notes:
+                break
+            for note in notes:
+                note.content = note.content
+                moved += note._content.startswith(BODY_REF_PREFIX)
+            last_id = notes[-1].id
+            db.commit()
+    finally:
+        db.close()
+    print(f"✅ Offloaded {moved} note bodies to {blob_store.root}")
+
+
+def garbage_collect():
+    db = SessionLocal()
+    try:
+        removed = collect_garbage(db)
+    finally:
+        db.close()
+    print(f"🧹 Removed {removed} unreferenced blobs from {blob_store.root}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Blob store maintenance")
+    parser.add_argument("command", choices=["offload", "gc"])
+    parser.add_argument("--batch-size", type=int, default=200)
+    args = parser.parse_args()
+
+    if args.command == "offload":
+        offload_note_bodies(args.batch_size)
+    else:
+        garbage_collect()
+
+
+if __name__ == "__main__":
+    main()
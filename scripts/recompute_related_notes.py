@@ -0,0 +1,38 @@
+"""
+Recompute related-note recommendations for every note
+Refreshes the IDF snapshot and all term vectors, then the top-k neighbours, a chunk
+at a time so memory stays bounded. Uses NumPy/SciPy sparse products when installed.
+"""
+import sys
+import time
+import argparse
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).parent.parent))
+
+from src.backend.database import SessionLocal, init_db
+from src.backend.related import recompute, np, RELATED_CACHE_TERMS
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Recompute related-note recommendations")
+    parser.add_argument("--chunk-size", type=int, default=5000, help="Notes per block (memory grows with it)")
+    parser.add_argument("--cache-terms", type=int, default=RELATED_CACHE_TERMS, help="Vector nonzeros to keep in memory between blocks")
+    parser.add_argument("--quiet", action="store_true", help="Only print the summary")
+    args = parser.parse_args()
+
+    print(f"🔗 Recomputing related notes ({'NumPy/SciPy' if np is not None else 'pure Python'})...")
+    init_db()
+    db = SessionLocal()
+    start = time.perf_counter()
+    try:
+        result = recompute(db, args.chunk_size, args.cache_terms, progress=(lambda _: None) if args.quiet else (lambda line: print(f"   ... {line}")))
+    finally:
+        db.close()
+
+    elapsed = time.perf_counter() - start
+    print(f"✅ Recomputed {result['notes']} notes in {result['chunks']} chunks in {elapsed:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
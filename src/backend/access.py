@@ -0,0 +1,150 @@
+"""
+Course-level authorization for content endpoints
+
+Professors can see every course; students only the courses they are
+enrolled in. Every note, topic and comment endpoint checks access through
+the shared `access_control` instance, which keeps two caches per worker,
+both LRU-bounded with a TTL:
+  * user id -> sorted array of enrolled course ids
+  * topic id -> course id (topics never move between courses)
+Notes are resolved through their topic, and the note row is usually loaded
+by the endpoint anyway, so with warm caches a check runs no queries. A "not
+enrolled" answer is always re-checked against the database before denying,
+so an enrollment made through another worker is honoured immediately; only
+a removed enrollment can be served from cache, and for at most the TTL.
+"""
+import os
+import time
+import bisect
+import threading
+from array import array
+from collections import OrderedDict
+from typing import List, Optional
+
+from fastapi import HTTPException, status
+from sqlalchemy.orm import Session
+
+from .models import User, StudyNote, Topic, user_courses
+
+ENROLLMENT_CACHE_SECONDS = float(os.getenv("WCAH_ENROLLMENT_CACHE_SECONDS", "60"))
+ENROLLMENT_CACHE_SIZE = int(os.getenv("WCAH_ENROLLMENT_CACHE_SIZE", "10000"))
+TOPIC_CACHE_SIZE = int(os.getenv("WCAH_TOPIC_CACHE_SIZE", "100000"))
+
+
+class TtlLruCache:
+    """Small thread-safe LRU map whose entries expire after `ttl` seconds"""
+
+    def __init__(self, max_size: int, ttl: float):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.items: OrderedDict = OrderedDict()  # key -> (expires, value)
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            entry = self.items.get(key)
+            if entry is None or entry[0] <= time.monotonic():
+                return None
+            self.items.move_to_end(key)
+            return entry[1]
+
+    def put(self, key, value):
+        with self.lock:
+            self.items[key] = (time.monotonic() + self.ttl, value)
+            self.items.move_to_end(key)
+            while len(self.items) > self.max_size:
+                self.items.popitem(last=False)
+
+    def pop(self, key):
+        with self.lock:
+            self.items.pop(key, None)
+
+    def clear(self):
+        with self.lock:
+            self.items.clear()
+
+
+class AccessControl:
+    """Resolves content to its course and checks the user may see that course"""
+
+    def __init__(self, ttl: float = ENROLLMENT_CACHE_SECONDS):
+        self.enrollments = TtlLruCache(ENROLLMENT_CACHE_SIZE, ttl)  # user id -> array of course ids
+        self.topic_courses = TtlLruCache(TOPIC_CACHE_SIZE, ttl)  # topic id -> course id
+
+    def load_course_ids(self, db: Session, user_id: int) -> array:
+        course_ids = array("l", sorted(
+            row.course_id for row in db.query(user_courses.c.course_id).filter(user_courses.c.user_id == user_id)
+        ))
+        self.enrollments.put(user_id, course_ids)
+        return course_ids
+
+    def course_ids(self, db: Session, user_id: int) -> array:
+        """Sorted ids of the courses a user is enrolled in"""
+        cached = self.enrollments.get(user_id)
+        return cached if cached is not None else self.load_course_ids(db, user_id)
+
+    @staticmethod
+    def _contains(course_ids: array, course_id: int) -> bool:
+        position = bisect.bisect_left(course_ids, course_id)
+        return position < len(course_ids) and course_ids[position] == course_id
+
+    def is_enrolled(self, db: Session, user_id: int, course_id: int) -> bool:
+        if self._contains(self.course_ids(db, user_id), course_id):
+            return True
+        # Maybe enrolled since the cache was filled (possibly via another worker)
+        return self._contains(self.load_course_ids(db, user_id), course_id)
+
+    def can_access_course(self, db: Session, user: User, course_id: int) -> bool:
+        return user.identity == "professor" or self.is_enrolled(db, user.id, course_id)
+
+    def require_course(self, db: Session, user: User, course_id: int):
+        if not self.can_access_course(db, user, course_id):
+            raise HTTPException(
+                status_code=status.HTTP_403_FORBIDDEN,
+                detail="You must be enrolled in this course to view its content"
+            )
+
+    def topic_course_id(self, db: Session, topic_id: int) -> Optional[int]:
+        course_id = self.topic_courses.get(topic_id)
+        if course_id is None:
+            course_id = db.query(Topic.course_id).filter(Topic.id == topic_id).scalar()
+            if course_id is not None:
+                self.topic_courses.put(topic_id, course_id)
+        return course_id
+
+    def require_topic(self, db: Session, user: User, topic_id: int) -> int:
+        """Check access to a topic's course; returns the course id (404 if the topic doesn't exist)"""
+        course_id = self.topic_course_id(db, topic_id)
+        if course_id is None:
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Topic not found")
+        self.require_course(db, user, course_id)
+        return course_id
+
+    def require_note(self, db: Session, user: User, note: StudyNote) -> int:
+        """Check access to a loaded note's course; returns the course id"""
+        course_id = self.topic_course_id(db, note.topic_id)
+        if course_id is None:
+            # Its course was deleted and the note is waiting for the delete_topics job
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Note not found")
+        self.require_course(db, user, course_id)
+        return course_id
+
+    def visible_course_ids(self, db: Session, user: User) -> Optional[List[int]]:
+        """Courses whose content the user may list, or None for all of them"""
+        return None if user.identity == "professor" else list(self.course_ids(db, user.id))
+
+    def invalidate_user(self, user_id: int):
+        """Call after a user's enrollments change"""
+        self.enrollments.pop(user_id)
+
+    def invalidate_topic(self, topic_id: int):
+        """Call after a topic is deleted (its id may be reused)"""
+        self.topic_courses.pop(topic_id)
+
+    def invalidate_course(self, course_id: int):
+        """Call after a course is deleted; its topics and enrollments go with it"""
+        self.enrollments.clear()
+        self.topic_courses.clear()
+
+
+access_control = AccessControl()
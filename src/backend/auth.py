@@ -1,47 +1,199 @@
 """
 Authentication utilities: password hashing, JWT tokens
 """
+import os
+import uuid
 from datetime import datetime, timedelta
-from typing import Optional
-from jose import JWTError, jwt
-from passlib.context import CryptContext
+from typing import Dict, Optional, TYPE_CHECKING
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
 from sqlalchemy.orm import Session
 
-from .database import get_db
+from .database import get_db, SessionLocal
 from .models import User
+from .revocation import revocation_list, session_expiry
+
+# jose and passlib pull in the crypto backends, which dominate import time,
+# so they are imported on first use rather than at module load
+if TYPE_CHECKING:
+    from passlib.context import CryptContext
 
 # Security configuration
-SECRET_KEY = "your-secret-key-change-this-in-production"  # TODO: Move to environment variable
 ALGORITHM = "HS256"
-ACCESS_TOKEN_EXPIRE_MINUTES = 60 * 24  # 24 hours
+ACCESS_TOKEN_EXPIRE_MINUTES = int(os.getenv("WCAH_ACCESS_TOKEN_MINUTES", "15"))
+REFRESH_TOKEN_EXPIRE_DAYS = int(os.getenv("WCAH_REFRESH_TOKEN_DAYS", "14"))
+# Tickets only open an event stream, so an access token never has to go in a URL
+STREAM_TICKET_SECONDS = int(os.getenv("WCAH_STREAM_TICKET_SECONDS", "30"))
+DEV_SECRET_KEY = "your-secret-key-change-this-in-production"
+
+
+def load_signing_keys(spec: str = os.getenv("WCAH_JWT_KEYS", "")) -> Dict[str, str]:
+    """
+    Parse "kid:secret,kid:secret". Every key verifies tokens carrying its kid;
+    WCAH_JWT_ACTIVE_KID (default: the first) signs new ones. To rotate, add
+    the new key, make it active, and drop the old one after the refresh lifetime.
+    """
+    keys = {}
+    for item in spec.split(","):
+        kid, _, secret = item.strip().partition(":")
+        if kid and secret:
+            keys[kid] = secret
+    return keys or {"default": os.getenv("WCAH_SECRET_KEY", DEV_SECRET_KEY)}
+
+
+SIGNING_KEYS = load_signing_keys()
+ACTIVE_KID = os.getenv("WCAH_JWT_ACTIVE_KID") or next(iter(SIGNING_KEYS))
+if ACTIVE_KID not in SIGNING_KEYS:
+    raise RuntimeError(f"WCAH_JWT_ACTIVE_KID={ACTIVE_KID!r} is not in WCAH_JWT_KEYS")
+
+# Password hashing configuration
+# The first scheme is used for new hashes; the rest are still accepted on verify
+# and are upgraded transparently on the next successful login.
+# argon2 requires the optional argon2-cffi package.
+PASSWORD_SCHEMES = [s.strip() for s in os.getenv("WCAH_PASSWORD_SCHEMES", "bcrypt").split(",") if s.strip()]
+BCRYPT_ROUNDS = int(os.getenv("WCAH_BCRYPT_ROUNDS", "12"))
+ARGON2_TIME_COST = int(os.getenv("WCAH_ARGON2_TIME_COST", "3"))
+ARGON2_MEMORY_COST = int(os.getenv("WCAH_ARGON2_MEMORY_COST", "65536"))  # KiB
+ARGON2_PARALLELISM = int(os.getenv("WCAH_ARGON2_PARALLELISM", "4"))
+
+
+def build_pwd_context(
+    schemes: Optional[list] = None,
+    bcrypt_rounds: int = BCRYPT_ROUNDS,
+    argon2_time_cost: int = ARGON2_TIME_COST,
+    argon2_memory_cost: int = ARGON2_MEMORY_COST,
+    argon2_parallelism: int = ARGON2_PARALLELISM,
+) -> "CryptContext":
+    """Build a CryptContext for the given schemes and cost parameters"""
+    from passlib.context import CryptContext
+
+    return CryptContext(
+        schemes=schemes or PASSWORD_SCHEMES,
+        deprecated="auto",
+        bcrypt__rounds=bcrypt_rounds,
+        argon2__time_cost=argon2_time_cost,
+        argon2__memory_cost=argon2_memory_cost,
+        argon2__parallelism=argon2_parallelism,
+    )
+
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+pwd_context: Optional["CryptContext"] = None
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/api/auth/login")
 
 
+def get_pwd_context() -> "CryptContext":
+    """Get the shared password context, building it on first use"""
+    global pwd_context
+    if pwd_context is None:
+        pwd_context = build_pwd_context()
+    return pwd_context
+
+
+def preload_auth_backends() -> None:
+    """Import the JWT and hashing backends ahead of the first request"""
+    import jose.jwt  # noqa: F401
+
+    get_pwd_context().handler().get_backend()
+
+
 def verify_password(plain_password: str, hashed_password: str) -> bool:
     """Verify a password against its hash"""
-    return pwd_context.verify(plain_password, hashed_password)
+    return get_pwd_context().verify(plain_password, hashed_password)
 
 
 def get_password_hash(password: str) -> str:
     """Hash a password"""
-    return pwd_context.hash(password)
+    return get_pwd_context().hash(password)
 
 
-def create_access_token(data: dict, expires_delta: Optional[timedelta] = None) -> str:
-    """Create a JWT access token"""
-    to_encode = data.copy()
-    if expires_delta:
-        expire = datetime.utcnow() + expires_delta
-    else:
-        expire = datetime.utcnow() + timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
-    
-    to_encode.update({"exp": expire})
-    encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
-    return encoded_jwt
+def password_needs_update(hashed_password: str) -> bool:
+    """Check if a hash uses a deprecated scheme or outdated cost parameters"""
+    return get_pwd_context().needs_update(hashed_password)
+
+
+def upgrade_password_hash(user_id: int, plain_password: str) -> None:
+    """
+    Rehash a user's password with the current scheme and cost.
+    Runs as a background task after a successful login, so it opens its own session.
+    """
+    db = SessionLocal()
+    try:
+        user = db.query(User).filter(User.id == user_id).first()
+        if user is None or not password_needs_update(user.password_hash):
+            return
+        user.password_hash = get_password_hash(plain_password)
+        db.commit()
+    finally:
+        db.close()
+
+
+def create_token(username: str, session_id: str, token_type: str, expires_delta: timedelta) -> str:
+    """Sign a JWT with the active key; the kid header says which key verifies it"""
+    from jose import jwt
+
+    now = datetime.utcnow()
+    claims = {
+        "sub": username,
+        "sid": session_id,
+        "jti": uuid.uuid4().hex,
+        "typ": token_type,
+        "iat": now,
+        "exp": now + expires_delta,
+    }
+    return jwt.encode(claims, SIGNING_KEYS[ACTIVE_KID], algorithm=ALGORITHM, headers={"kid": ACTIVE_KID})
+
+
+def create_access_token(username: str, session_id: str, expires_delta: Optional[timedelta] = None) -> str:
+    """Create a short-lived JWT access token"""
+    return create_token(username, session_id, "access", expires_delta or timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES))
+
+
+def create_token_pair(username: str, session_id: Optional[str] = None) -> dict:
+    """
+    Access and refresh tokens for a login session; pass the session id to
+    refresh an existing session rather than start a new one
+    """
+    session_id = session_id or uuid.uuid4().hex
+    return {
+        "access_token": create_access_token(username, session_id),
+        "refresh_token": create_token(username, session_id, "refresh", timedelta(days=REFRESH_TOKEN_EXPIRE_DAYS)),
+        "token_type": "bearer",
+        "expires_in": ACCESS_TOKEN_EXPIRE_MINUTES * 60,
+    }
+
+
+def decode_token(token: str, token_type: str = "access", verify_exp: bool = True) -> Optional[dict]:
+    """Verify a token's signature (by its kid), expiry and type; None if any check fails"""
+    from jose import JWTError, jwt
+
+    try:
+        key = SIGNING_KEYS.get(jwt.get_unverified_header(token).get("kid"))
+        if key is None:
+            return None
+        payload = jwt.decode(token, key, algorithms=[ALGORITHM], options={"verify_exp": verify_exp})
+    except JWTError:
+        return None
+    if payload.get("typ") != token_type or not payload.get("sub") or not payload.get("sid"):
+        return None
+    return payload
+
+
+def revoke_session(db: Session, session_id: str):
+    """Invalidate every access and refresh token of a login session"""
+    revocation_list.revoke(db, session_id, session_expiry(timedelta(days=REFRESH_TOKEN_EXPIRE_DAYS)))
+
+
+def create_stream_ticket(username: str, session_id: str) -> str:
+    """Short-lived token accepted only by the event stream, in its session"""
+    return create_token(username, session_id, "stream", timedelta(seconds=STREAM_TICKET_SECONDS))
+
+
+def get_user_from_token(token: str, db: Session, token_type: str = "access") -> Optional[User]:
+    """Resolve a token to its user, or None if the token is invalid or revoked"""
+    payload = decode_token(token, token_type)
+    if payload is None or revocation_list.is_revoked(payload["sid"], db):
+        return None
+    return db.query(User).filter(User.username == payload["sub"]).first()
 
 
 def get_current_user(
@@ -55,15 +207,7 @@ def get_current_user(
         headers={"WWW-Authenticate": "Bearer"},
     )
     
-    try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        username: str = payload.get("sub")
-        if username is None:
-            raise credentials_exception
-    except JWTError:
-        raise credentials_exception
-    
-    user = db.query(User).filter(User.username == username).first()
+    user = get_user_from_token(token, db)
     if user is None:
         raise credentials_exception
     
@@ -0,0 +1,156 @@
+"""
+Content-addressed blob store for large note bodies and attachments
+
+Blobs live under WCAH_BLOB_DIR, one file per SHA-256 digest (fanned out as
+ab/cd/<digest>), so identical uploads are stored once. Note bodies larger than
+WCAH_NOTE_BODY_OFFLOAD_BYTES are written here and study_notes.content keeps
+only a short reference, which keeps rows in the hot table small.
+Blobs no longer referenced by a note or attachment are removed by collect_garbage().
+"""
+import os
+import re
+import time
+import hashlib
+import tempfile
+from functools import lru_cache
+from pathlib import Path
+from typing import BinaryIO, Iterable, Iterator, Optional, Set, Tuple
+
+BLOB_DIR = os.getenv("WCAH_BLOB_DIR", "./blobs")
+NOTE_BODY_OFFLOAD_BYTES = int(os.getenv("WCAH_NOTE_BODY_OFFLOAD_BYTES", "65536"))
+BODY_CACHE_SIZE = int(os.getenv("WCAH_BLOB_BODY_CACHE_SIZE", "32"))
+# Blobs younger than this are never collected, so in-flight uploads are safe
+GC_GRACE_SECONDS = float(os.getenv("WCAH_BLOB_GC_GRACE_SECONDS", "3600"))
+CHUNK_SIZE = 1024 * 1024
+
+BODY_REF_PREFIX = "wcah-blob:sha256:"
+DIGEST_PATTERN = re.compile(r"^[0-9a-f]{64}$")
+
+
+class BlobTooLarge(Exception):
+    pass
+
+
+class LocalBlobStore:
+    """Blobs as files on the local filesystem, written atomically via a temp file and rename"""
+
+    def __init__(self, root: str):
+        self.root = Path(root)
+
+    def path(self, digest: str) -> Path:
+        if not DIGEST_PATTERN.match(digest):
+            raise ValueError(f"Invalid blob digest: {digest!r}")
+        return self.root / digest[:2] / digest[2:4] / digest
+
+    def exists(self, digest: str) -> bool:
+        return self.path(digest).is_file()
+
+    def put_stream(self, chunks: Iterable[bytes], max_bytes: Optional[int] = None) -> Tuple[str, int]:
+        """Store a stream of chunks, hashing as it is written. Returns (digest, size)."""
+        self.root.mkdir(parents=True, exist_ok=True)
+        hasher = hashlib.sha256()
+        size = 0
+        fd, temp_path = tempfile.mkstemp(dir=self.root, prefix=".upload-")
+        try:
+            with os.fdopen(fd, "wb") as temp_file:
+                for chunk in chunks:
+                    size += len(chunk)
+                    if max_bytes is not None and size > max_bytes:
+                        raise BlobTooLarge(f"Blob exceeds {max_bytes} bytes")
+                    hasher.update(chunk)
+                    temp_file.write(chunk)
+            digest = hasher.hexdigest()
+            target = self.path(digest)
+            if target.exists():
+                # Already stored; refresh its mtime so a concurrent collect_garbage() skips it
+                os.unlink(temp_path)
+                os.utime(target)
+            else:
+                target.parent.mkdir(parents=True, exist_ok=True)
+                os.replace(temp_path, target)
+        except BaseException:
+            if os.path.exists(temp_path):
+                os.unlink(temp_path)
+            raise
+        return digest, size
+
+    def put_file(self, file: BinaryIO, max_bytes: Optional[int] = None) -> Tuple[str, int]:
+        return self.put_stream(iter(lambda: file.read(CHUNK_SIZE), b""), max_bytes)
+
+    def put_bytes(self, data: bytes) -> str:
+        digest = hashlib.sha256(data).hexdigest()
+        if self.exists(digest):
+            os.utime(self.path(digest))
+            return digest
+        return self.put_stream([data])[0]
+
+    def read_bytes(self, digest: str) -> bytes:
+        return self.path(digest).read_bytes()
+
+    def delete(self, digest: str):
+        try:
+            self.path(digest).unlink()
+        except FileNotFoundError:
+            pass
+
+    def iter_blobs(self) -> Iterator[Tuple[str, float]]:
+        """Yield (digest, mtime) for every stored blob"""
+        if not self.root.exists():
+            return
+        for path in self.root.glob("??/??/*"):
+            if DIGEST_PATTERN.match(path.name):
+                yield path.name, path.stat().st_mtime
+
+
+def create_blob_store(root: str = BLOB_DIR) -> LocalBlobStore:
+    """Create the blob store (only the local filesystem backend exists so far)"""
+    return LocalBlobStore(root)
+
+
+blob_store = create_blob_store()
+
+
+def store_note_body(content: str) -> str:
+    """Value to keep in study_notes.content: the text itself, or a reference to an offloaded blob"""
+    if content is None:
+        return content
+    data = content.encode()
+    # Text that looks like a reference is always offloaded, so inline bodies are never ambiguous
+    if (NOTE_BODY_OFFLOAD_BYTES and len(data) > NOTE_BODY_OFFLOAD_BYTES) or content.startswith(BODY_REF_PREFIX):
+        return BODY_REF_PREFIX + blob_store.put_bytes(data)
+    return content
+
+
+def load_note_body(stored: Optional[str]) -> Optional[str]:
+    """Inverse of store_note_body"""
+    if stored and stored.startswith(BODY_REF_PREFIX):
+        return read_blob_text(stored[len(BODY_REF_PREFIX):])
+    return stored
+
+
+@lru_cache(maxsize=BODY_CACHE_SIZE)
+def read_blob_text(digest: str) -> str:
+    # Blobs are immutable, so caching by digest never goes stale
+    return blob_store.read_bytes(digest).decode()
+
+
+def referenced_digests(db) -> Set[str]:
+    """Digests still referenced by note bodies or attachments"""
+    from .models import StudyNote, NoteAttachment
+
+    digests = {row.sha256 for row in db.query(NoteAttachment.sha256)}
+    bodies = db.query(StudyNote._content).filter(StudyNote._content.like(BODY_REF_PREFIX + "%"))
+    digests.update(row[0][len(BODY_REF_PREFIX):] for row in bodies)
+    return digests
+
+
+def collect_garbage(db, now: Optional[float] = None) -> int:
+    """Delete blobs that nothing references any more. Returns the number removed."""
+    now = now if now is not None else time.time()
+    referenced = referenced_digests(db)
+    removed = 0
+    for digest, mtime in list(blob_store.iter_blobs()):
+        if digest not in referenced and now - mtime > GC_GRACE_SECONDS:
+            blob_store.delete(digest)
+            removed += 1
+    return removed
@@ -1,35 +1,197 @@
 """
 Database configuration and session management
 """
-from sqlalchemy import create_engine
+import os
+import time
+import itertools
+from pathlib import Path
+from typing import Optional
+from fastapi import Request
+from sqlalchemy import create_engine, event, text
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 
 # SQLite database URL
 SQLALCHEMY_DATABASE_URL = "sqlite:///./wcah.db"
 
+# How long a connection waits on another process's write lock before failing
+SQLITE_BUSY_TIMEOUT_MS = int(os.getenv("WCAH_SQLITE_BUSY_TIMEOUT_MS", "5000"))
+
 # Create engine
 engine = create_engine(
     SQLALCHEMY_DATABASE_URL,
     connect_args={"check_same_thread": False}  # Needed for SQLite
 )
 
+
+@event.listens_for(engine, "connect")
+def set_sqlite_pragmas(dbapi_connection, connection_record):
+    """
+    Make SQLite safe to share between worker processes:
+    WAL lets readers run alongside the single writer, and busy_timeout
+    makes writers queue on the lock instead of failing with "database is locked"
+    """
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute(f"PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT_MS}")
+    cursor.execute("PRAGMA synchronous=NORMAL")
+    cursor.close()
+
 # Create SessionLocal class
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+# Read-only engines that GET requests are routed to, e.g. replica URLs for Postgres,
+# or "sqlite:///./wcah.db" again for extra query-only connections to the WAL database
+READ_DATABASE_URLS = [url.strip() for url in os.getenv("WCAH_READ_DATABASE_URLS", "").split(",") if url.strip()]
+# After a caller writes, their reads stay on the primary this long (read-your-writes)
+READ_STICKY_SECONDS = float(os.getenv("WCAH_READ_STICKY_SECONDS", "5"))
+READ_METHODS = {"GET", "HEAD"}
+
+
+def set_read_only_pragmas(dbapi_connection, connection_record):
+    """Reject writes on read connections and wait on locks like the primary does"""
+    cursor = dbapi_connection.cursor()
+    cursor.execute(f"PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT_MS}")
+    cursor.execute("PRAGMA query_only=ON")
+    cursor.close()
+
+
+def create_read_engine(url: str):
+    """Create an engine for read-only traffic"""
+    if not url.startswith("sqlite"):
+        return create_engine(url, pool_pre_ping=True)
+    read_engine = create_engine(url, connect_args={"check_same_thread": False})
+    event.listen(read_engine, "connect", set_read_only_pragmas)
+    return read_engine
+
+
+read_engines = [create_read_engine(url) for url in READ_DATABASE_URLS]
+ReadSessionLocals = [
+    sessionmaker(autocommit=False, autoflush=False, bind=read_engine)
+    for read_engine in read_engines
+]
+_read_session_cycle = itertools.cycle(ReadSessionLocals) if ReadSessionLocals else None
+
+# Caller key -> monotonic time until which their reads go to the primary
+_sticky_until: dict = {}
+
 # Create Base class
 Base = declarative_base()
 
+ALEMBIC_INI_PATH = Path(__file__).resolve().parents[2] / "alembic.ini"
+
+
+def get_alembic_head() -> Optional[str]:
+    """Get the head revision of the migration scripts, or None if unavailable"""
+    # Imported here: alembic is only needed when the schema must be checked
+    from alembic.config import Config
+    from alembic.script import ScriptDirectory
+
+    if not ALEMBIC_INI_PATH.exists():
+        return None
+    config = Config(str(ALEMBIC_INI_PATH))
+    return ScriptDirectory.from_config(config).get_current_head()
+
+
+def schema_is_current() -> bool:
+    """
+    Check whether the database is stamped with the Alembic head revision and
+    has every table of the ORM metadata (a head that predates a model doesn't count)
+    """
+    with engine.connect() as conn:
+        tables = {
+            row[0] for row in conn.execute(text("SELECT name FROM sqlite_master WHERE type = 'table'"))
+        }
+        if "alembic_version" not in tables or not tables.issuperset(Base.metadata.tables):
+            return False
+        current = conn.execute(text("SELECT version_num FROM alembic_version")).scalar()
+    try:
+        head = get_alembic_head()
+    except Exception:
+        return False
+    return head is not None and current == head
+
 
 def init_db():
-    """Initialize database tables"""
+    """Initialize database tables, skipping the schema scan when already at head"""
+    if schema_is_current():
+        return
     Base.metadata.create_all(bind=engine)
 
 
-def get_db():
-    """Dependency to get database session"""
-    db = SessionLocal()
+def dispose_engine():
+    """Drop pooled connections inherited from a parent process after fork"""
+    engine.dispose(close=False)
+    for read_engine in read_engines:
+        read_engine.dispose(close=False)
+
+
+def check_database() -> bool:
+    """Check that the database answers a trivial query"""
+    try:
+        with engine.connect() as conn:
+            conn.execute(text("SELECT 1"))
+        return True
+    except Exception:
+        return False
+
+
+def warm_connection_pool():
+    """Open the pools' connections up front so the first requests don't pay for them"""
+    for pool_engine in [engine, *read_engines]:
+        size = pool_engine.pool.size() if hasattr(pool_engine.pool, "size") else 1
+        connections = []
+        try:
+            for _ in range(size):
+                conn = pool_engine.connect()
+                conn.execute(text("SELECT 1"))
+                connections.append(conn)
+        finally:
+            for conn in connections:
+                conn.close()
+
+
+def caller_key(request: Request) -> str:
+    """Identify the caller for read-your-writes: their bearer token, else their IP"""
+    authorization = request.headers.get("authorization")
+    if authorization:
+        return authorization
+    return request.client.host if request.client else "unknown"
+
+
+def mark_primary_sticky(key: str):
+    """Keep a caller's reads on the primary for the sticky window"""
+    now = time.monotonic()
+    if len(_sticky_until) > 10_000:
+        for stale in [k for k, until in _sticky_until.items() if until <= now]:
+            del _sticky_until[stale]
+    _sticky_until[key] = now + READ_STICKY_SECONDS
+
+
+def use_read_session(request: Optional[Request]) -> bool:
+    """Route to a read engine for reads, unless the caller wrote recently"""
+    if _read_session_cycle is None or request is None or request.method not in READ_METHODS:
+        return False
+    return _sticky_until.get(caller_key(request), 0) <= time.monotonic()
+
+
+def get_db(request: Request = None):
+    """
+    Dependency to get database session.
+    GET requests use a read engine when any are configured; everything else uses the primary.
+    """
+    read_only = use_read_session(request)
+    is_write = (
+        _read_session_cycle is not None and request is not None and request.method not in READ_METHODS
+    )
+    if is_write:
+        mark_primary_sticky(caller_key(request))
+
+    db = next(_read_session_cycle)() if read_only else SessionLocal()
     try:
         yield db
     finally:
         db.close()
+        # Renew from the end of the request, which may have outlasted the window
+        if is_write:
+            mark_primary_sticky(caller_key(request))
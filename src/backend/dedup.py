@@ -0,0 +1,283 @@
+"""
+Exact and near-duplicate detection for notes within a topic
+
+Each note gets a fingerprint: a SHA-256 of its normalized text for exact
+matches, and a MinHash signature over word 3-shingles for near matches.
+Signatures are built with one-permutation hashing (each shingle hash lands
+in one of NUM_PERM bins, keeping the minimum per bin), so fingerprinting is
+a single pass over the text. The signature is split into LSH bands whose
+hashes are indexed by (topic_id, bucket); a lookup only compares signatures
+of notes sharing at least one band.
+"""
+import os
+import re
+import struct
+import hashlib
+from collections import defaultdict
+from typing import Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+from sqlalchemy import exists, or_, update
+from sqlalchemy.orm import Session
+
+from .models import StudyNote, NoteFingerprint, NoteLshBucket
+
+DUPLICATE_POLICY = os.getenv("WCAH_DUPLICATE_POLICY", "link")  # "link", "reject" or "off"
+NEAR_DUPLICATE_THRESHOLD = float(os.getenv("WCAH_NEAR_DUPLICATE_THRESHOLD", "0.85"))
+
+NUM_PERM = 64
+BANDS = 16
+ROWS_PER_BAND = NUM_PERM // BANDS
+SHINGLE_SIZE = 3
+# Shorter texts only get exact matching; their MinHash estimates are too noisy
+MIN_SHINGLES = 8
+DENSIFY_OFFSET = 0x9E3779B1
+
+TOKEN_PATTERN = re.compile(r"\w+")
+SIGNATURE_FORMAT = f"<{NUM_PERM}I"
+
+
+class Fingerprint(NamedTuple):
+    content_hash: str
+    signature: Optional[List[int]]  # None when the text is too short for near matching
+
+
+def normalize(text: str) -> List[str]:
+    return TOKEN_PATTERN.findall(text.lower())
+
+
+def shingle_hashes(tokens: List[str]) -> Iterable[int]:
+    for i in range(len(tokens) - SHINGLE_SIZE + 1):
+        shingle = " ".join(tokens[i:i + SHINGLE_SIZE]).encode()
+        yield int.from_bytes(hashlib.blake2b(shingle, digest_size=8).digest(), "little")
+
+
+def minhash_signature(hashes: Iterable[int]) -> Optional[List[int]]:
+    """One-permutation MinHash: low bits pick the bin, high 32 bits are the value"""
+    bins: List[Optional[int]] = [None] * NUM_PERM
+    count = 0
+    for h in hashes:
+        count += 1
+        index = h % NUM_PERM
+        value = h >> 32
+        if bins[index] is None or value < bins[index]:
+            bins[index] = value
+    if count < MIN_SHINGLES:
+        return None
+
+    # Densify: an empty bin borrows the next filled bin's value, offset by the distance
+    signature = []
+    for i in range(NUM_PERM):
+        distance = 0
+        while bins[(i + distance) % NUM_PERM] is None:
+            distance += 1
+        signature.append((bins[(i + distance) % NUM_PERM] + distance * DENSIFY_OFFSET) & 0xFFFFFFFF)
+    return signature
+
+
+def compute_fingerprint(content: str) -> Fingerprint:
+    tokens = normalize(content)
+    content_hash = hashlib.sha256(" ".join(tokens).encode()).hexdigest()
+    return Fingerprint(content_hash, minhash_signature(shingle_hashes(tokens)))
+
+
+def band_buckets(signature: List[int]) -> List[int]:
+    """One signed 64-bit bucket key per band (the band index is part of the key)"""
+    buckets = []
+    for band in range(BANDS):
+        rows = signature[band * ROWS_PER_BAND:(band + 1) * ROWS_PER_BAND]
+        data = struct.pack(f"<B{ROWS_PER_BAND}I", band, *rows)
+        buckets.append(int.from_bytes(hashlib.blake2b(data, digest_size=8).digest(), "little", signed=True))
+    return buckets
+
+
+def similarity(a: List[int], b: List[int]) -> float:
+    """Estimated Jaccard similarity of two signatures"""
+    return sum(x == y for x, y in zip(a, b)) / NUM_PERM
+
+
+def pack_signature(signature: Optional[List[int]]) -> Optional[bytes]:
+    return struct.pack(SIGNATURE_FORMAT, *signature) if signature else None
+
+
+def unpack_signature(data: Optional[bytes]) -> Optional[List[int]]:
+    return list(struct.unpack(SIGNATURE_FORMAT, data)) if data else None
+
+
+def find_duplicate(
+    db: Session, topic_id: int, fingerprint: Fingerprint, exclude_note_id: Optional[int] = None
+) -> Optional[Tuple[int, float]]:
+    """
+    Return (original note id, similarity) for the best match in the topic, if any.
+    exclude_note_id leaves out a note being re-checked and the duplicates linked to it.
+    """
+    exact_query = db.query(NoteFingerprint.note_id, NoteFingerprint.duplicate_of).filter(
+        NoteFingerprint.topic_id == topic_id,
+        NoteFingerprint.content_hash == fingerprint.content_hash
+    )
+    if exclude_note_id is not None:
+        exact_query = exact_query.filter(
+            NoteFingerprint.note_id != exclude_note_id,
+            or_(NoteFingerprint.duplicate_of.is_(None), NoteFingerprint.duplicate_of != exclude_note_id),
+        )
+    exact = exact_query.order_by(NoteFingerprint.note_id).first()
+    if exact:
+        return exact.duplicate_of or exact.note_id, 1.0
+    if fingerprint.signature is None:
+        return None
+
+    candidates = db.query(NoteFingerprint).filter(
+        NoteFingerprint.note_id.in_(
+            db.query(NoteLshBucket.note_id).filter(
+                NoteLshBucket.topic_id == topic_id,
+                NoteLshBucket.bucket.in_(band_buckets(fingerprint.signature))
+            )
+        )
+    ).all()
+    best = None
+    for candidate in candidates:
+        original = candidate.duplicate_of or candidate.note_id
+        if exclude_note_id is not None and exclude_note_id in (candidate.note_id, original):
+            continue
+        score = similarity(fingerprint.signature, unpack_signature(candidate.signature) or [])
+        if score >= NEAR_DUPLICATE_THRESHOLD and (best is None or score > best[1]):
+            best = (original, score)
+    return best
+
+
+def index_note(db: Session, note_id: int, topic_id: int, fingerprint: Fingerprint, duplicate_of: Optional[int] = None):
+    """Store a note's fingerprint and LSH buckets (call in the transaction that writes the note)"""
+    db.add(NoteFingerprint(
+        note_id=note_id,
+        topic_id=topic_id,
+        content_hash=fingerprint.content_hash,
+        signature=pack_signature(fingerprint.signature),
+        duplicate_of=duplicate_of,
+    ))
+    if fingerprint.signature is not None:
+        db.add_all(
+            NoteLshBucket(note_id=note_id, topic_id=topic_id, bucket=bucket)
+            for bucket in set(band_buckets(fingerprint.signature))
+        )
+
+
+def index_notes(db: Session, entries: List[Tuple[int, int, Fingerprint]], detect: bool = True) -> Dict[int, int]:
+    """
+    index_note for many new notes at once, e.g. a bulk import. The touched topics' fingerprints
+    and buckets are loaded in two queries and matched in memory, so notes are also compared
+    with the ones before them in `entries`. Returns {note id: original id} for duplicates.
+    """
+    topic_ids = {topic_id for _, topic_id, _ in entries}
+    originals: Dict[Tuple[int, str], int] = {}  # (topic id, content hash) -> original id
+    signatures: Dict[int, Tuple[List[int], int]] = {}  # note id -> (signature, original id)
+    buckets: Dict[Tuple[int, int], List[int]] = defaultdict(list)  # (topic id, bucket) -> note ids
+    if detect and topic_ids:
+        for row in db.query(NoteFingerprint).filter(
+            NoteFingerprint.topic_id.in_(topic_ids)
+        ).order_by(NoteFingerprint.note_id):
+            originals.setdefault((row.topic_id, row.content_hash), row.duplicate_of or row.note_id)
+            if row.signature:
+                signatures[row.note_id] = (unpack_signature(row.signature), row.duplicate_of or row.note_id)
+        for row in db.query(NoteLshBucket.note_id, NoteLshBucket.topic_id, NoteLshBucket.bucket).filter(
+            NoteLshBucket.topic_id.in_(topic_ids)
+        ):
+            buckets[(row.topic_id, row.bucket)].append(row.note_id)
+
+    duplicates: Dict[int, int] = {}
+    fingerprint_rows = []
+    bucket_rows = []
+    for note_id, topic_id, fingerprint in entries:
+        note_buckets = set(band_buckets(fingerprint.signature)) if fingerprint.signature is not None else set()
+        duplicate_of = None
+        if detect:
+            duplicate_of = originals.get((topic_id, fingerprint.content_hash))
+            if duplicate_of is None and note_buckets:
+                best = 0.0
+                candidates = {note for bucket in note_buckets for note in buckets.get((topic_id, bucket), ())}
+                for candidate in candidates:
+                    signature, original = signatures[candidate]
+                    score = similarity(fingerprint.signature, signature)
+                    if score >= NEAR_DUPLICATE_THRESHOLD and score > best:
+                        best, duplicate_of = score, original
+            original = duplicate_of or note_id
+            originals.setdefault((topic_id, fingerprint.content_hash), original)
+            if note_buckets:
+                signatures[note_id] = (fingerprint.signature, original)
+                for bucket in note_buckets:
+                    buckets[(topic_id, bucket)].append(note_id)
+            if duplicate_of:
+                duplicates[note_id] = duplicate_of
+        fingerprint_rows.append({
+            "note_id": note_id,
+            "topic_id": topic_id,
+            "content_hash": fingerprint.content_hash,
+            "signature": pack_signature(fingerprint.signature),
+            "duplicate_of": duplicate_of,
+        })
+        bucket_rows.extend({"note_id": note_id, "topic_id": topic_id, "bucket": bucket} for bucket in note_buckets)
+
+    if fingerprint_rows:
+        db.execute(NoteFingerprint.__table__.insert(), fingerprint_rows)
+    if bucket_rows:
+        db.execute(NoteLshBucket.__table__.insert(), bucket_rows)
+    return duplicates
+
+
+def reindex_note(db: Session, note: StudyNote):
+    """
+    Refresh an edited note's fingerprint and re-check its duplicate link against the new
+    content: an edited duplicate that no longer matches becomes an original again, and an
+    edit that copies another note gets linked to it. A note that is itself the original
+    of other notes stays one, so links never chain.
+    """
+    fingerprint = compute_fingerprint(note.content)
+    existing = db.query(NoteFingerprint).filter(NoteFingerprint.note_id == note.id).first()
+    is_original = db.query(
+        db.query(NoteFingerprint).filter(NoteFingerprint.duplicate_of == note.id).exists()
+    ).scalar()
+    duplicate_of = None
+    if DUPLICATE_POLICY != "off" and not is_original:
+        duplicate = find_duplicate(db, note.topic_id, fingerprint, exclude_note_id=note.id)
+        duplicate_of = duplicate[0] if duplicate else None
+    if existing is None:
+        index_note(db, note.id, note.topic_id, fingerprint, duplicate_of)
+        return
+
+    existing.content_hash = fingerprint.content_hash
+    existing.signature = pack_signature(fingerprint.signature)
+    existing.duplicate_of = duplicate_of
+    db.query(NoteLshBucket).filter(NoteLshBucket.note_id == note.id).delete(synchronize_session=False)
+    if fingerprint.signature is not None:
+        db.add_all(
+            NoteLshBucket(note_id=note.id, topic_id=note.topic_id, bucket=bucket)
+            for bucket in set(band_buckets(fingerprint.signature))
+        )
+
+
+def forget_note(db: Session, note_id: int):
+    """Before deleting an original, make its oldest duplicate the new original"""
+    duplicates = [
+        row.note_id for row in db.query(NoteFingerprint.note_id).filter(
+            NoteFingerprint.duplicate_of == note_id
+        ).order_by(NoteFingerprint.note_id)
+    ]
+    if not duplicates:
+        return
+    db.execute(
+        update(NoteFingerprint)
+        .where(NoteFingerprint.note_id == duplicates[0])
+        .values(duplicate_of=None)
+    )
+    if len(duplicates) > 1:
+        db.execute(
+            update(NoteFingerprint)
+            .where(NoteFingerprint.note_id.in_(duplicates[1:]))
+            .values(duplicate_of=duplicates[0])
+        )
+
+
+def not_a_duplicate():
+    """Filter clause excluding notes linked to an original"""
+    return ~exists().where(
+        NoteFingerprint.note_id == StudyNote.id,
+        NoteFingerprint.duplicate_of.isnot(None)
+    )
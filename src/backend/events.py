@@ -0,0 +1,143 @@
+"""
+In-process pub/sub for real-time note, topic and course updates
+
+Routes publish events to channels such as "note:3", "topic:1" or "course:2"
+after their write commits. Each subscriber (one per open event stream) has a
+bounded buffer; when a slow client falls behind, its oldest events are dropped
+and it is told to refetch. A Redis backend relays events between workers.
+"""
+import os
+import json
+import asyncio
+from typing import Dict, Iterable, Optional, Set
+
+EVENT_BACKEND = os.getenv("WCAH_EVENT_BACKEND", "memory")
+SUBSCRIBER_BUFFER_SIZE = int(os.getenv("WCAH_EVENT_BUFFER_SIZE", "100"))
+HEARTBEAT_SECONDS = float(os.getenv("WCAH_EVENT_HEARTBEAT_SECONDS", "15"))
+
+
+def note_channels(note_id: int, topic_id: Optional[int] = None, course_id: Optional[int] = None) -> list:
+    """Channels an event about a note is delivered to"""
+    channels = [f"note:{note_id}"]
+    if topic_id is not None:
+        channels.append(f"topic:{topic_id}")
+    if course_id is not None:
+        channels.append(f"course:{course_id}")
+    return channels
+
+
+class Subscription:
+    """A subscriber's bounded event buffer"""
+
+    def __init__(self, channels: Iterable[str], buffer_size: int = SUBSCRIBER_BUFFER_SIZE):
+        self.channels = set(channels)
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=buffer_size)
+        self.lagged = False
+
+    def deliver(self, message: str):
+        """Queue a serialized event, dropping the oldest one if the buffer is full"""
+        if self.queue.full():
+            self.queue.get_nowait()
+            self.lagged = True
+        self.queue.put_nowait(message)
+
+    async def next(self, timeout: float) -> Optional[str]:
+        """Wait for the next event, or return None after timeout (time for a heartbeat)"""
+        try:
+            return await asyncio.wait_for(self.queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+
+class EventBroker:
+    """Fans events out to the subscriptions of this worker"""
+
+    def __init__(self):
+        self.subscriptions: Dict[str, Set[Subscription]] = {}
+
+    def subscribe(self, channels: Iterable[str]) -> Subscription:
+        subscription = Subscription(channels)
+        for channel in subscription.channels:
+            self.subscriptions.setdefault(channel, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription):
+        for channel in subscription.channels:
+            subscribers = self.subscriptions.get(channel)
+            if subscribers is None:
+                continue
+            subscribers.discard(subscription)
+            if not subscribers:
+                del self.subscriptions[channel]
+
+    @property
+    def connection_count(self) -> int:
+        return len({sub for subs in self.subscriptions.values() for sub in subs})
+
+    def deliver_local(self, channels: Iterable[str], message: str):
+        """Deliver to local subscribers, once each even if they watch several channels"""
+        recipients = set()
+        for channel in channels:
+            recipients.update(self.subscriptions.get(channel, ()))
+        for subscription in recipients:
+            subscription.deliver(message)
+
+    def publish(self, channels: Iterable[str], event_type: str, data: dict):
+        """Publish an event; call only after the write it describes has committed"""
+        channels = list(channels)
+        message = json.dumps({"type": event_type, "channels": channels, "data": data}, default=str)
+        self.deliver_local(channels, message)
+
+    async def start(self):
+        pass
+
+    async def stop(self):
+        pass
+
+
+class RedisEventBroker(EventBroker):
+    """
+    Relays events through Redis pub/sub so subscribers on every worker receive them.
+    Requires the optional redis package.
+    """
+
+    def __init__(self, url: str, redis_channel: str = "wcah:events"):
+        super().__init__()
+        import redis.asyncio as redis
+
+        self.client = redis.from_url(url)
+        self.redis_channel = redis_channel
+        self.listener: Optional[asyncio.Task] = None
+
+    def publish(self, channels: Iterable[str], event_type: str, data: dict):
+        channels = list(channels)
+        message = json.dumps({"type": event_type, "channels": channels, "data": data}, default=str)
+        # Local delivery happens when the message comes back from Redis
+        asyncio.get_running_loop().create_task(self.client.publish(self.redis_channel, message))
+
+    async def start(self):
+        self.listener = asyncio.create_task(self._listen())
+
+    async def stop(self):
+        if self.listener is not None:
+            self.listener.cancel()
+        await self.client.aclose()
+
+    async def _listen(self):
+        pubsub = self.client.pubsub()
+        await pubsub.subscribe(self.redis_channel)
+        async for item in pubsub.listen():
+            if item.get("type") != "message":
+                continue
+            message = item["data"].decode() if isinstance(item["data"], bytes) else item["data"]
+            self.deliver_local(json.loads(message)["channels"], message)
+
+
+def create_broker(spec: str = EVENT_BACKEND) -> EventBroker:
+    """Create the broker named by WCAH_EVENT_BACKEND ("memory" or a redis:// URL)"""
+    if spec.startswith(("redis://", "rediss://", "unix://")):
+        return RedisEventBroker(spec)
+    return EventBroker()
+
+
+broker = create_broker()
@@ -0,0 +1,209 @@
+"""
+Dashboard feed: recent notes and comments across a user's enrolled courses
+
+Writes append to course_activity. Reads fan out over the user's courses:
+each course's newest items are cached per worker, and the feed is a k-way
+merge of those per-course lists (newest first). One grouped MAX(id) query
+per request tells us which course caches are stale; they are refreshed
+incrementally, and a user's first page is cached against those versions.
+"""
+import os
+import heapq
+import itertools
+from collections import OrderedDict
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+from .models import CourseActivity, StudyNote, Comment
+
+RECENT_PER_COURSE = int(os.getenv("WCAH_FEED_RECENT_PER_COURSE", "200"))
+USER_CACHE_SIZE = int(os.getenv("WCAH_FEED_USER_CACHE_SIZE", "10000"))
+EXCERPT_LENGTH = 300
+
+FEED_KINDS = ("note", "comment")
+
+
+def record_note_created(db: Session, note: StudyNote, course_id: int):
+    """Add a new note to its course's feed (call in the creating transaction, after flush)"""
+    db.add(CourseActivity(
+        course_id=course_id,
+        topic_id=note.topic_id,
+        note_id=note.id,
+        kind="note",
+        author_id=note.author_id,
+        title=note.title,
+        excerpt=(note.summary or note.content or "")[:EXCERPT_LENGTH],
+    ))
+
+
+def record_comment_added(db: Session, comment: Comment, note_title: str, topic_id: int, course_id: int):
+    """Add a new comment to its course's feed (call in the creating transaction, after flush)"""
+    db.add(CourseActivity(
+        course_id=course_id,
+        topic_id=topic_id,
+        note_id=comment.note_id,
+        comment_id=comment.id,
+        kind="comment",
+        author_id=comment.user_id,
+        title=note_title,
+        excerpt=comment.content[:EXCERPT_LENGTH],
+    ))
+
+
+def record_note_deleted(db: Session, note: StudyNote, course_id: int):
+    """Drop a note and its comments from the feed by appending a tombstone"""
+    db.query(CourseActivity).filter(CourseActivity.note_id == note.id).delete(synchronize_session=False)
+    db.add(CourseActivity(
+        course_id=course_id,
+        topic_id=note.topic_id,
+        note_id=note.id,
+        kind="note_deleted",
+        author_id=note.author_id,
+        title=note.title,
+    ))
+
+
+def activity_to_dict(activity: CourseActivity) -> dict:
+    return {
+        "id": activity.id,
+        "kind": activity.kind,
+        "course_id": activity.course_id,
+        "topic_id": activity.topic_id,
+        "note_id": activity.note_id,
+        "comment_id": activity.comment_id,
+        "author_id": activity.author_id,
+        "title": activity.title,
+        "excerpt": activity.excerpt,
+        "created_at": activity.created_at,
+    }
+
+
+class CourseRecentCache:
+    """A course's newest feed items, newest first, plus the newest activity id seen"""
+
+    def __init__(self):
+        self.version = 0
+        self.items: List[dict] = []
+        # False once older items exist that aren't cached
+        self.complete = True
+
+    @property
+    def cutoff(self) -> int:
+        """Ids at or above this are fully covered by the cache"""
+        if self.complete:
+            return 0
+        return self.items[-1]["id"] if self.items else self.version + 1
+
+    def apply(self, activities: Sequence[CourseActivity]):
+        """Fold newer activities (oldest first) into the cached list"""
+        for activity in activities:
+            if activity.kind == "note_deleted":
+                self.items = [item for item in self.items if item["note_id"] != activity.note_id]
+            elif activity.kind in FEED_KINDS:
+                self.items.insert(0, activity_to_dict(activity))
+            self.version = max(self.version, activity.id)
+        if len(self.items) > RECENT_PER_COURSE:
+            del self.items[RECENT_PER_COURSE:]
+            self.complete = False
+
+
+class FeedCache:
+    """Per-worker caches for per-course recent items and users' first pages"""
+
+    def __init__(self):
+        self.courses: Dict[int, CourseRecentCache] = {}
+        self.user_pages: "OrderedDict[Tuple[int, int], Tuple[tuple, dict]]" = OrderedDict()
+
+    def course_versions(self, db: Session, course_ids: Sequence[int]) -> Dict[int, int]:
+        """Newest activity id per course, read off the (course_id, id) index"""
+        rows = db.query(CourseActivity.course_id, func.max(CourseActivity.id)).filter(
+            CourseActivity.course_id.in_(course_ids)
+        ).group_by(CourseActivity.course_id).all()
+        versions = {course_id: 0 for course_id in course_ids}
+        versions.update(dict(rows))
+        return versions
+
+    def refresh_course(self, db: Session, course_id: int, version: int) -> CourseRecentCache:
+        """Bring a course's cache up to the given version, loading only what's new"""
+        cache = self.courses.get(course_id)
+        if cache is not None and version < cache.version:
+            # The course was deleted and its activity cleared; start over
+            cache = None
+        if cache is None:
+            cache = CourseRecentCache()
+            self.courses[course_id] = cache
+            newer = db.query(CourseActivity).filter(
+                CourseActivity.course_id == course_id,
+                CourseActivity.kind.in_(FEED_KINDS),
+            ).order_by(CourseActivity.id.desc()).limit(RECENT_PER_COURSE).all()
+            newer.reverse()
+            cache.apply(newer)
+            cache.complete = len(newer) < RECENT_PER_COURSE
+            cache.version = version
+        elif cache.version < version:
+            newer = db.query(CourseActivity).filter(
+                CourseActivity.course_id == course_id,
+                CourseActivity.id > cache.version,
+            ).order_by(CourseActivity.id).all()
+            cache.apply(newer)
+        return cache
+
+    def older_items(self, db: Session, course_ids: Sequence[int], before: int, limit: int) -> List[dict]:
+        """Items past the cached depth come straight from the database"""
+        rows = db.query(CourseActivity).filter(
+            CourseActivity.course_id.in_(course_ids),
+            CourseActivity.kind.in_(FEED_KINDS),
+            CourseActivity.id < before,
+        ).order_by(CourseActivity.id.desc()).limit(limit).all()
+        return [activity_to_dict(row) for row in rows]
+
+    def get_feed(
+        self,
+        db: Session,
+        user_id: int,
+        course_ids: Sequence[int],
+        limit: int = 20,
+        before: Optional[int] = None,
+    ) -> dict:
+        """A page of the merged feed, newest first, optionally before an activity id"""
+        if not course_ids:
+            return {"items": [], "next_before": None}
+
+        versions = self.course_versions(db, course_ids)
+        version_key = tuple(sorted(versions.items()))
+        page_key = (user_id, limit)
+        if before is None:
+            cached = self.user_pages.get(page_key)
+            if cached is not None and cached[0] == version_key:
+                self.user_pages.move_to_end(page_key)
+                return cached[1]
+
+        caches = [self.refresh_course(db, course_id, version) for course_id, version in versions.items()]
+
+        # k-way merge of the per-course lists, each already newest first
+        merged = heapq.merge(*(cache.items for cache in caches), key=lambda item: item["id"], reverse=True)
+        if before is not None:
+            merged = itertools.dropwhile(lambda item: item["id"] >= before, merged)
+
+        # Caches only hold each course's newest items, so the merge is exact down to the
+        # highest cutoff; the rest of the page comes from the (course_id, id) index
+        boundary = max(cache.cutoff for cache in caches)
+        items = list(itertools.islice(itertools.takewhile(lambda item: item["id"] >= boundary, merged), limit))
+        if len(items) < limit and boundary:
+            cursor = boundary if before is None else min(before, boundary)
+            items += self.older_items(db, course_ids, cursor, limit - len(items))
+
+        page = {
+            "items": items,
+            "next_before": items[-1]["id"] if len(items) == limit else None,
+        }
+        if before is None:
+            self.user_pages[page_key] = (version_key, page)
+            while len(self.user_pages) > USER_CACHE_SIZE:
+                self.user_pages.popitem(last=False)
+        return page
+
+
+feed_cache = FeedCache()
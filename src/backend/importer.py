@@ -0,0 +1,263 @@
+"""
+Bulk note import from Markdown archives
+
+A zip or tar (optionally gzip/bzip2/xz compressed) of Markdown files becomes
+notes in a course: each file's directory names its topic (an existing topic
+with that title, or a new one), and optional YAML-style front matter sets
+the title, summary and note type:
+
+    ---
+    title: Recursion
+    summary: Base cases and the call stack
+    type: Lecture
+    ---
+
+Members are read one at a time straight from the uploaded file, so the
+archive is never decompressed in memory as a whole. Notes are inserted in
+batched transactions with their feed entries; hot-score rows and duplicate
+fingerprints are built in one pass at the end instead of per note. Imported
+duplicates are linked to their original (the notes already exist by then),
+even under WCAH_DUPLICATE_POLICY=reject.
+"""
+import os
+import tarfile
+import zipfile
+import posixpath
+from typing import BinaryIO, Callable, Dict, Iterator, List, Optional, Tuple
+
+from sqlalchemy.orm import Session
+
+from .database import SessionLocal
+from .models import Topic, StudyNote, NoteType
+from .feed import record_note_created
+from .ranking import backfill_rankings
+from .dedup import DUPLICATE_POLICY, Fingerprint, compute_fingerprint, index_notes
+from .jobs import enqueue
+
+IMPORT_BATCH_SIZE = int(os.getenv("WCAH_IMPORT_BATCH_SIZE", "200"))
+IMPORT_MAX_FILES = int(os.getenv("WCAH_IMPORT_MAX_FILES", "5000"))
+IMPORT_MAX_FILE_BYTES = int(os.getenv("WCAH_IMPORT_MAX_FILE_BYTES", str(2 * 1024 * 1024)))
+IMPORT_MAX_BYTES = int(os.getenv("WCAH_IMPORT_MAX_BYTES", str(100 * 1024 * 1024)))
+
+MARKDOWN_EXTENSIONS = (".md", ".markdown")
+DEFAULT_TOPIC = "General"
+DEFAULT_NOTE_TYPE = NoteType.Lecture
+TITLE_LENGTH = 200
+SUMMARY_LENGTH = 500
+
+
+class ArchiveError(Exception):
+    pass
+
+
+class ArchiveTooLarge(ArchiveError):
+    pass
+
+
+class MemberTooLarge(Exception):
+    pass
+
+
+def read_member(stream: BinaryIO, limit: int = IMPORT_MAX_FILE_BYTES) -> bytes:
+    """Read a member, refusing to decompress more than `limit` bytes"""
+    data = stream.read(limit + 1)
+    if len(data) > limit:
+        raise MemberTooLarge(f"larger than {limit} bytes")
+    return data
+
+
+def archive_members(fileobj: BinaryIO) -> Iterator[Tuple[str, Callable[[], bytes]]]:
+    """Yield (path, reader) for each regular file in a zip or tar archive"""
+    if zipfile.is_zipfile(fileobj):
+        fileobj.seek(0)
+        with zipfile.ZipFile(fileobj) as archive:
+            for info in archive.infolist():
+                if not info.is_dir():
+                    yield info.filename, lambda info=info: read_member(archive.open(info))
+        return
+    fileobj.seek(0)
+    try:
+        # "r|*" reads the tar as a stream, member by member, with any compression
+        archive = tarfile.open(fileobj=fileobj, mode="r|*")
+    except tarfile.ReadError:
+        raise ArchiveError("Upload a .zip or .tar(.gz/.bz2/.xz) archive")
+    with archive:
+        for member in archive:
+            if member.isfile():
+                yield member.name, lambda member=member: read_member(archive.extractfile(member))
+
+
+def parse_front_matter(text: str) -> Tuple[Dict[str, str], str]:
+    """Split `key: value` front matter between --- lines from the body"""
+    lines = text.splitlines(keepends=True)
+    if not lines or lines[0].strip() != "---":
+        return {}, text
+    for end in range(1, len(lines)):
+        if lines[end].strip() in ("---", "..."):
+            break
+    else:
+        return {}, text
+    fields = {}
+    for line in lines[1:end]:
+        key, separator, value = line.partition(":")
+        if separator and key.strip():
+            fields[key.strip().lower()] = value.strip().strip("'\"")
+    return fields, "".join(lines[end + 1:]).lstrip("\n")
+
+
+def parse_note_type(value: Optional[str]) -> Optional[NoteType]:
+    if not value:
+        return DEFAULT_NOTE_TYPE
+    for note_type in NoteType:
+        if note_type.value.lower() == value.lower():
+            return note_type
+    return None
+
+
+def first_heading(body: str) -> Optional[str]:
+    for line in body.splitlines():
+        if line.startswith("# "):
+            return line[2:].strip()
+        if line.strip():
+            return None
+    return None
+
+
+def topic_title(path: str) -> str:
+    directory = posixpath.dirname(path.strip("/"))
+    return " / ".join(part for part in directory.split("/") if part)[:TITLE_LENGTH] or DEFAULT_TOPIC
+
+
+def should_skip(path: str) -> bool:
+    parts = path.strip("/").split("/")
+    return any(part.startswith(".") or part == "__MACOSX" for part in parts) or not path.lower().endswith(MARKDOWN_EXTENSIONS)
+
+
+class NoteImport:
+    """Imports one archive into a course, committing every IMPORT_BATCH_SIZE notes"""
+
+    def __init__(self, db: Session, course_id: int, author_id: int, progress: Callable[[dict], None] = lambda _: None):
+        self.db = db
+        self.course_id = course_id
+        self.author_id = author_id
+        self.progress = progress
+        self.topics: Dict[str, int] = {
+            topic.title: topic.id for topic in db.query(Topic.id, Topic.title).filter(Topic.course_id == course_id)
+        }
+        self.created_topics: List[int] = []
+        self.files: List[dict] = []
+        self.markdown_files = 0
+        self.pending: List[Tuple[StudyNote, dict]] = []
+        # Fingerprinted as each batch is flushed, so note bodies aren't held until the end
+        self.imported: List[Tuple[int, int, Fingerprint]] = []  # (note id, topic id, fingerprint)
+
+    def topic_id(self, title: str) -> int:
+        if title not in self.topics:
+            topic = Topic(title=title, course_id=self.course_id)
+            self.db.add(topic)
+            self.db.flush()
+            self.topics[title] = topic.id
+            self.created_topics.append(topic.id)
+        return self.topics[title]
+
+    def add_file(self, path: str, read: Callable[[], bytes]):
+        if should_skip(path):
+            self.files.append({"path": path, "status": "skipped", "detail": "not a Markdown file"})
+            return
+        self.markdown_files += 1
+        if self.markdown_files > IMPORT_MAX_FILES:
+            self.files.append({"path": path, "status": "skipped", "detail": f"over the {IMPORT_MAX_FILES} file limit"})
+            return
+        entry = {"path": path}
+        try:
+            text = read().decode("utf-8-sig", errors="replace")
+        except MemberTooLarge as exc:
+            self.files.append({**entry, "status": "error", "detail": str(exc)})
+            return
+        fields, body = parse_front_matter(text)
+        note_type = parse_note_type(fields.get("type") or fields.get("note_type"))
+        if note_type is None:
+            valid = ", ".join(t.value for t in NoteType)
+            self.files.append({**entry, "status": "error", "detail": f"unknown type (use one of {valid})"})
+            return
+        if not body.strip():
+            self.files.append({**entry, "status": "error", "detail": "empty note"})
+            return
+        title = fields.get("title") or first_heading(body) or posixpath.splitext(posixpath.basename(path))[0]
+        topic = fields.get("topic") or topic_title(path)
+        note = StudyNote(
+            topic_id=self.topic_id(topic[:TITLE_LENGTH]),
+            author_id=self.author_id,
+            title=title[:TITLE_LENGTH],
+            content=body,
+            summary=fields.get("summary", "")[:SUMMARY_LENGTH] or None,
+            note_type=note_type,
+        )
+        entry.update(status="imported", topic=topic)
+        self.files.append(entry)
+        self.pending.append((note, entry))
+        if len(self.pending) >= IMPORT_BATCH_SIZE:
+            self.flush()
+
+    def flush(self):
+        """Insert the pending notes and their feed entries in one transaction"""
+        if not self.pending:
+            return
+        batch, self.pending = self.pending, []
+        self.db.add_all(note for note, _ in batch)
+        self.db.flush()
+        for note, entry in batch:
+            entry["note_id"] = note.id
+            record_note_created(self.db, note, self.course_id)
+            self.imported.append((note.id, note.topic_id, compute_fingerprint(note.content)))
+        self.db.commit()
+        self.progress({"stage": "notes", "imported": len(self.imported), "files": len(self.files)})
+
+    def finish(self) -> dict:
+        """Flush the last batch, then build hot scores and index the fingerprints in one pass"""
+        self.flush()
+        self.progress({"stage": "indexing", "imported": len(self.imported), "files": len(self.files)})
+        backfill_rankings(self.db)
+        duplicates = index_notes(self.db, self.imported, detect=DUPLICATE_POLICY != "off")
+        # Related notes are found in the background, a few hundred notes per job
+        note_ids = [note_id for note_id, _, _ in self.imported]
+        for start in range(0, len(note_ids), IMPORT_BATCH_SIZE):
+            enqueue(self.db, "index_related_notes", {"note_ids": note_ids[start:start + IMPORT_BATCH_SIZE]})
+        self.db.commit()
+        for entry in self.files:
+            if entry.get("note_id") in duplicates:
+                entry["duplicate_of"] = duplicates[entry["note_id"]]
+
+        counts: Dict[str, int] = {}
+        for entry in self.files:
+            counts[entry["status"]] = counts.get(entry["status"], 0) + 1
+        report = {
+            "course_id": self.course_id,
+            "counts": counts,
+            "created_topics": self.created_topics,
+            "files": self.files,
+        }
+        self.progress({"stage": "done", "imported": len(self.imported), "files": len(self.files)})
+        return report
+
+
+def import_archive(fileobj: BinaryIO, course_id: int, author_id: int, progress: Callable[[dict], None]) -> dict:
+    """Run a whole import with its own session (called in a worker thread)"""
+    fileobj.seek(0, os.SEEK_END)
+    if fileobj.tell() > IMPORT_MAX_BYTES:
+        raise ArchiveTooLarge(f"Archives are limited to {IMPORT_MAX_BYTES} bytes")
+    db = SessionLocal()
+    try:
+        note_import = NoteImport(db, course_id, author_id, progress)
+        try:
+            for path, read in archive_members(fileobj):
+                note_import.add_file(path, read)
+        except (zipfile.BadZipFile, tarfile.TarError, EOFError) as exc:
+            # Batches already committed still get indexed before reporting the failure
+            db.rollback()
+            note_import.pending = []
+            note_import.finish()
+            raise ArchiveError(f"Could not read the archive after importing {len(note_import.imported)} notes: {exc}")
+        return note_import.finish()
+    finally:
+        db.close()
@@ -0,0 +1,277 @@
+"""
+Durable background jobs
+
+Work that doesn't need to finish before the response goes out is enqueued as
+a row in the jobs table, in the same transaction as the write that needs it,
+so a job exists exactly when its write committed. Worker threads started from
+main.lifespan claim jobs with a conditional UPDATE, which is atomic across
+threads and worker processes sharing the database:
+  * highest priority first, then oldest;
+  * at most `concurrency` running jobs of a type, counted in the table;
+  * a failed attempt is retried with exponential backoff until max_attempts;
+  * a job whose worker died is requeued once its lease expires.
+Handlers are registered with @job_handler and must be idempotent, because a
+job can run again after a crash or a retry.
+"""
+import os
+import json
+import socket
+import logging
+import threading
+import traceback
+from datetime import datetime, timedelta
+from typing import Callable, Dict, List, NamedTuple, Optional
+
+from sqlalchemy import func, insert, select, update
+from sqlalchemy.orm import Session, aliased
+
+from .database import SessionLocal
+from .models import Job
+
+JOB_WORKERS = int(os.getenv("WCAH_JOB_WORKERS", "2"))
+JOB_POLL_SECONDS = float(os.getenv("WCAH_JOB_POLL_SECONDS", "1"))
+# A running job not finished within this long is assumed orphaned and requeued
+JOB_LEASE_SECONDS = float(os.getenv("WCAH_JOB_LEASE_SECONDS", "600"))
+JOB_RETRY_BASE_SECONDS = float(os.getenv("WCAH_JOB_RETRY_BASE_SECONDS", "5"))
+JOB_RETENTION_HOURS = float(os.getenv("WCAH_JOB_RETENTION_HOURS", "72"))
+MAINTENANCE_INTERVAL_SECONDS = 60
+CLAIM_CANDIDATES = 20
+
+logger = logging.getLogger("wcah.jobs")
+
+
+class JobType(NamedTuple):
+    handler: Callable[[Session, dict], None]
+    concurrency: int
+    max_attempts: int
+
+
+job_types: Dict[str, JobType] = {}
+
+
+def job_handler(job_type: str, concurrency: int = 1, max_attempts: int = 3):
+    """Register fn(db, payload) as the handler for a job type; it commits its own work"""
+    def register(fn):
+        job_types[job_type] = JobType(fn, concurrency, max_attempts)
+        return fn
+    return register
+
+
+def enqueue(
+    db: Session,
+    job_type: str,
+    payload: Optional[dict] = None,
+    priority: int = 0,
+    idempotency_key: Optional[str] = None,
+    delay_seconds: float = 0,
+) -> int:
+    """
+    Add a job in the caller's transaction (it runs only if that commits). With an
+    idempotency key, a job already enqueued under that key is returned instead.
+    Call job_runner.notify() after committing to start it without waiting for a poll.
+    """
+    values = {
+        "job_type": job_type,
+        "payload": json.dumps(payload or {}),
+        "priority": priority,
+        "idempotency_key": idempotency_key,
+        "max_attempts": job_types[job_type].max_attempts if job_type in job_types else 3,
+        "run_after": datetime.utcnow() + timedelta(seconds=delay_seconds),
+        "created_at": datetime.utcnow(),
+    }
+    if idempotency_key is None:
+        return db.execute(insert(Job).values(values)).inserted_primary_key[0]
+    db.execute(insert(Job).prefix_with("OR IGNORE").values(values))
+    return db.query(Job.id).filter(Job.idempotency_key == idempotency_key).scalar()
+
+
+def retry_job(db: Session, job: Job):
+    """Queue a failed job again with a fresh set of attempts (commits)"""
+    job.status = "queued"
+    job.attempts = 0
+    job.run_after = datetime.utcnow()
+    job.finished_at = None
+    db.commit()
+
+
+def retry_delay(attempts: int) -> timedelta:
+    return timedelta(seconds=JOB_RETRY_BASE_SECONDS * 2 ** (attempts - 1))
+
+
+def job_to_dict(job: Job) -> dict:
+    return {
+        "id": job.id,
+        "job_type": job.job_type,
+        "status": job.status,
+        "priority": job.priority,
+        "attempts": job.attempts,
+        "max_attempts": job.max_attempts,
+        "idempotency_key": job.idempotency_key,
+        "run_after": job.run_after,
+        "locked_by": job.locked_by,
+        "last_error": job.last_error,
+        "created_at": job.created_at,
+        "finished_at": job.finished_at,
+    }
+
+
+class JobRunner:
+    """Pool of worker threads executing jobs from the jobs table"""
+
+    def __init__(self, workers: int = JOB_WORKERS, poll_seconds: float = JOB_POLL_SECONDS):
+        self.workers = workers
+        self.poll_seconds = poll_seconds
+        self.name = f"{socket.gethostname()}:{os.getpid()}"
+        self.threads: List[threading.Thread] = []
+        self.wakeup = threading.Event()
+        self.stopping = threading.Event()
+        self.maintenance_lock = threading.Lock()
+        self.last_maintenance = datetime.min
+
+    def start(self):
+        if self.threads:
+            return
+        self.stopping.clear()
+        for index in range(self.workers):
+            thread = threading.Thread(target=self._work, args=(f"{self.name}:{index}",), name=f"wcah-job-{index}", daemon=True)
+            thread.start()
+            self.threads.append(thread)
+
+    def stop(self, timeout: float = 10):
+        """Let running jobs finish (up to timeout); blocking, so run it in an executor"""
+        self.stopping.set()
+        self.wakeup.set()
+        for thread in self.threads:
+            thread.join(timeout)
+        self.threads = []
+
+    def notify(self):
+        """Wake idle workers (call after committing an enqueue)"""
+        self.wakeup.set()
+
+    def _work(self, worker: str):
+        while not self.stopping.is_set():
+            self.wakeup.clear()
+            try:
+                self._maintain()
+                if self.run_one(worker):
+                    continue
+            except Exception:
+                logger.exception("Job worker %s failed", worker)
+            self.wakeup.wait(self.poll_seconds)
+
+    def claim(self, db: Session, worker: str) -> Optional[Job]:
+        """Atomically mark the best runnable job as ours, respecting per-type limits"""
+        now = datetime.utcnow()
+        candidates = db.query(Job.id, Job.job_type).filter(
+            Job.status == "queued",
+            Job.run_after <= now,
+            Job.job_type.in_(job_types)
+        ).order_by(Job.priority.desc(), Job.id).limit(CLAIM_CANDIDATES).all()
+        full = set()
+        for job_id, job_type in candidates:
+            if job_type in full:
+                continue
+            other = aliased(Job)
+            running = select(func.count()).select_from(other).where(
+                other.job_type == job_type, other.status == "running"
+            ).scalar_subquery()
+            claimed = db.execute(
+                update(Job)
+                .where(Job.id == job_id, Job.status == "queued", running < job_types[job_type].concurrency)
+                .values(status="running", attempts=Job.attempts + 1, locked_by=worker, locked_at=now)
+            ).rowcount
+            db.commit()
+            if claimed:
+                return db.query(Job).filter(Job.id == job_id).first()
+            full.add(job_type)  # Taken by someone else, or the type is at its limit
+        return None
+
+    def run_one(self, worker: str) -> bool:
+        """Claim and run one job; False if there was nothing to run"""
+        db = SessionLocal()
+        try:
+            job = self.claim(db, worker)
+            if job is None:
+                return False
+            job_id, job_type, attempts = job.id, job.job_type, job.attempts
+            try:
+                job_types[job_type].handler(db, json.loads(job.payload))
+            except Exception as exc:
+                db.rollback()
+                logger.warning("Job %s (%s) attempt %s failed: %s", job_id, job_type, attempts, exc)
+                job = db.query(Job).filter(Job.id == job_id).first()
+                job.last_error = "".join(traceback.format_exception(exc))[-4000:]
+                job.locked_by = job.locked_at = None
+                if attempts < job.max_attempts:
+                    job.status = "queued"
+                    job.run_after = datetime.utcnow() + retry_delay(attempts)
+                else:
+                    job.status = "failed"
+                    job.finished_at = datetime.utcnow()
+                db.commit()
+                return True
+            db.execute(
+                update(Job).where(Job.id == job_id).values(
+                    status="done", locked_by=None, locked_at=None, finished_at=datetime.utcnow()
+                )
+            )
+            db.commit()
+            return True
+        finally:
+            db.close()
+
+    def _maintain(self):
+        """Requeue jobs with expired leases and purge old finished jobs, once a minute per process"""
+        now = datetime.utcnow()
+        with self.maintenance_lock:
+            if (now - self.last_maintenance).total_seconds() < MAINTENANCE_INTERVAL_SECONDS:
+                return
+            self.last_maintenance = now
+        db = SessionLocal()
+        try:
+            expired = db.execute(
+                update(Job)
+                .where(Job.status == "running", Job.locked_at < now - timedelta(seconds=JOB_LEASE_SECONDS))
+                .values(status="queued", locked_by=None, locked_at=None, last_error="Lease expired")
+            ).rowcount
+            db.query(Job).filter(
+                Job.status.in_(("done", "failed")),
+                Job.finished_at < now - timedelta(hours=JOB_RETENTION_HOURS)
+            ).delete(synchronize_session=False)
+            db.commit()
+            if expired:
+                logger.warning("Requeued %s jobs whose worker stopped responding", expired)
+        finally:
+            db.close()
+
+    def status(self, db: Session, recent: int, job_status: Optional[str] = None) -> dict:
+        """Per-type counts by status, queue age and the most recent jobs (optionally of one status)"""
+        counts: Dict[str, Dict[str, int]] = {
+            job_type: {"queued": 0, "running": 0, "done": 0, "failed": 0} for job_type in job_types
+        }
+        for job_type, status_name, count in db.query(Job.job_type, Job.status, func.count()).group_by(
+            Job.job_type, Job.status
+        ):
+            counts.setdefault(job_type, {"queued": 0, "running": 0, "done": 0, "failed": 0})[status_name] = count
+        oldest = db.query(func.min(Job.created_at)).filter(Job.status == "queued").scalar()
+        jobs = db.query(Job)
+        if job_status is not None:
+            jobs = jobs.filter(Job.status == job_status)
+        jobs = jobs.order_by(Job.id.desc()).limit(recent).all()
+        return {
+            "workers": len([thread for thread in self.threads if thread.is_alive()]),
+            "types": [
+                {
+                    "job_type": job_type,
+                    "concurrency": job_types[job_type].concurrency if job_type in job_types else None,
+                    **by_status,
+                }
+                for job_type, by_status in sorted(counts.items())
+            ],
+            "oldest_queued_seconds": (datetime.utcnow() - oldest).total_seconds() if oldest else None,
+            "recent": [job_to_dict(job) for job in jobs],
+        }
+
+
+job_runner = JobRunner()
@@ -0,0 +1,252 @@
+"""
+Structured JSON logging with request IDs and sampled access logs
+
+Application and access records go onto a bounded in-memory queue through a
+QueueHandler; a QueueListener thread formats them as JSON lines and writes
+them to a size-rotated file (or stdout), so request handlers never block on
+log I/O. Every record carries the request ID of the request that emitted it.
+Successful, fast requests are sampled; errors and slow requests are always logged.
+"""
+import os
+import re
+import sys
+import json
+import time
+import uuid
+import queue
+import random
+import logging
+import logging.handlers
+from contextvars import ContextVar
+from typing import List, Optional
+
+LOG_ENABLED = os.getenv("WCAH_LOG_ENABLED", "1") == "1"
+LOG_LEVEL = os.getenv("WCAH_LOG_LEVEL", "INFO")
+# Empty for stdout, or a path for a size-rotated JSON lines file
+LOG_FILE = os.getenv("WCAH_LOG_FILE", "")
+LOG_MAX_BYTES = int(os.getenv("WCAH_LOG_MAX_BYTES", str(20 * 1024 * 1024)))
+LOG_BACKUP_COUNT = int(os.getenv("WCAH_LOG_BACKUP_COUNT", "5"))
+LOG_QUEUE_SIZE = int(os.getenv("WCAH_LOG_QUEUE_SIZE", "10000"))
+# Share of successful, fast requests written to the access log
+ACCESS_LOG_SAMPLE_RATE = float(os.getenv("WCAH_ACCESS_LOG_SAMPLE_RATE", "1.0"))
+SLOW_REQUEST_MS = float(os.getenv("WCAH_SLOW_REQUEST_MS", "500"))
+
+REQUEST_ID_HEADER = b"x-request-id"
+REQUEST_ID_PATTERN = re.compile(r"^[A-Za-z0-9._-]{1,64}$")
+# Credentials that can appear in a query string are never written to the log
+SECRET_QUERY_PATTERN = re.compile(r"(?i)((?:^|&)(?:token|ticket|access_token|refresh_token)=)[^&]*")
+
+# (request id, method, path) of the request being handled, if any
+request_context: ContextVar[Optional[tuple]] = ContextVar("request_context", default=None)
+
+access_logger = logging.getLogger("wcah.access")
+
+
+def redact_query(query: str) -> str:
+    """Blank out credential values in a query string"""
+    return SECRET_QUERY_PATTERN.sub(r"\1[REDACTED]", query)
+
+
+def current_request_id() -> Optional[str]:
+    context = request_context.get()
+    return context[0] if context else None
+
+
+class RequestIdFilter(logging.Filter):
+    """Stamp each record with the current request ID, in the thread that emitted it"""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if not hasattr(record, "request_id"):
+            record.request_id = current_request_id()
+        return True
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line; fields passed as extra={"fields": {...}} are merged in"""
+
+    def __init__(self):
+        super().__init__()
+        self.cached_second = None
+        self.cached_prefix = ""
+
+    def timestamp(self, created: float) -> str:
+        """UTC ISO 8601 with milliseconds; the date part is reused within the same second"""
+        second = int(created)
+        if second != self.cached_second:
+            self.cached_second = second
+            self.cached_prefix = time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime(second))
+        return f"{self.cached_prefix}.{int((created - second) * 1000):03d}Z"
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": self.timestamp(record.created),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        request_id = getattr(record, "request_id", None)
+        if request_id:
+            entry["request_id"] = request_id
+        fields = getattr(record, "fields", None)
+        if fields:
+            entry.update(fields)
+        if record.exc_text:
+            entry["exc"] = record.exc_text
+        elif record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    """
+    Hands records to the listener thread. Formatting is left to the listener;
+    when the queue is full the record is dropped and counted instead of blocking.
+    """
+
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Resolve anything that can't safely be read later from another thread
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+def create_target_handler() -> logging.Handler:
+    if LOG_FILE:
+        handler = logging.handlers.RotatingFileHandler(
+            LOG_FILE, maxBytes=LOG_MAX_BYTES, backupCount=LOG_BACKUP_COUNT, encoding="utf-8"
+        )
+    else:
+        handler = logging.StreamHandler(sys.stdout)
+    handler.setFormatter(JsonFormatter())
+    return handler
+
+
+class LogPipeline:
+    """Installs the queue handler on the root logger and runs the listener thread"""
+
+    def __init__(self):
+        self.queue_handler: Optional[DroppingQueueHandler] = None
+        self.listener: Optional[logging.handlers.QueueListener] = None
+        self.extra_handlers: List[logging.Handler] = []
+
+    def add_handler(self, handler: logging.Handler):
+        """Another output for the listener thread (register before start); filter it to the records it wants"""
+        if LOG_ENABLED:
+            self.extra_handlers.append(handler)
+        else:
+            logging.getLogger().addHandler(handler)
+
+    def start(self):
+        if not LOG_ENABLED or self.listener is not None:
+            return
+        log_queue = queue.Queue(maxsize=LOG_QUEUE_SIZE)
+        self.queue_handler = DroppingQueueHandler(log_queue)
+        self.queue_handler.addFilter(RequestIdFilter())
+        self.listener = logging.handlers.QueueListener(
+            log_queue, create_target_handler(), *self.extra_handlers, respect_handler_level=True
+        )
+
+        root = logging.getLogger()
+        root.addHandler(self.queue_handler)
+        root.setLevel(LOG_LEVEL)
+        self.listener.start()
+
+    def stop(self):
+        """Flush queued records and detach; called on shutdown"""
+        if self.listener is None:
+            return
+        logging.getLogger().removeHandler(self.queue_handler)
+        self.listener.stop()
+        self.listener = None
+
+
+log_pipeline = LogPipeline()
+
+
+class AccessLogMiddleware:
+    """
+    ASGI middleware assigning each request an ID (reusing a valid incoming X-Request-ID),
+    echoing it in the response, and writing a sampled access log entry
+    """
+
+    def __init__(self, app, sample_rate: float = ACCESS_LOG_SAMPLE_RATE, slow_ms: float = SLOW_REQUEST_MS):
+        self.app = app
+        self.sample_rate = sample_rate
+        self.slow_ms = slow_ms
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        request_id = None
+        for name, value in scope["headers"]:
+            if name == REQUEST_ID_HEADER:
+                candidate = value.decode("latin-1")
+                if REQUEST_ID_PATTERN.match(candidate):
+                    request_id = candidate
+                break
+        request_id = request_id or uuid.uuid4().hex
+        scope.setdefault("state", {})["request_id"] = request_id
+        token = request_context.set((request_id, scope["method"], scope["path"]))
+
+        start = time.perf_counter()
+        status_code = 500
+        response_bytes = 0
+
+        async def send_with_request_id(message):
+            nonlocal status_code, response_bytes
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                message["headers"] = [*message.get("headers", []), (REQUEST_ID_HEADER, request_id.encode())]
+            elif message["type"] == "http.response.body":
+                response_bytes += len(message.get("body", b""))
+            await send(message)
+
+        error = None
+        try:
+            await self.app(scope, receive, send_with_request_id)
+        except Exception as exc:
+            error = exc
+            raise
+        finally:
+            duration_ms = (time.perf_counter() - start) * 1000
+            keep = (
+                error is not None
+                or status_code >= 400
+                or duration_ms >= self.slow_ms
+                or self.sample_rate >= 1.0
+                or random.random() < self.sample_rate
+            )
+            if keep and access_logger.isEnabledFor(logging.INFO):
+                client = scope.get("client")
+                access_logger.log(
+                    logging.ERROR if error is not None or status_code >= 500 else logging.INFO,
+                    "%s %s %s", scope["method"], scope["path"], status_code,
+                    exc_info=error,
+                    extra={"request_id": request_id, "fields": {
+                        "method": scope["method"],
+                        "path": scope["path"],
+                        "query": redact_query(scope.get("query_string", b"").decode("latin-1")) or None,
+                        "status": status_code,
+                        "duration_ms": round(duration_ms, 2),
+                        "bytes": response_bytes,
+                        "client": client[0] if client else None,
+                        "slow": duration_ms >= self.slow_ms,
+                        "sample_rate": self.sample_rate,
+                    }},
+                )
+            request_context.reset(token)
@@ -1,19 +1,69 @@
 """
 FastAPI main application for Waterloo CS Assignment Hub
 """
-from fastapi import FastAPI
+import asyncio
+from fastapi import FastAPI, Response, status
 from fastapi.middleware.cors import CORSMiddleware
 from contextlib import asynccontextmanager
 
-from .database import init_db
-from .routes import auth, courses, topics, notes
+from .logs import log_pipeline, AccessLogMiddleware, LOG_ENABLED
+from .database import engine, read_engines, init_db, warm_connection_pool, check_database
+from .querylog import install_slow_query_log
+from .profiling import RequestProfilerMiddleware, PROFILE_SECRET
+from .auth import preload_auth_backends
+from .ratelimit import RateLimitMiddleware, RATE_LIMIT_ENABLED
+from .writebatch import write_coalescer, WRITE_COALESCING_ENABLED
+from .events import broker
+from .ranking import ranking_maintenance_loop
+from .search import warm_course_index
+from .revocation import run_revocation_sync, revocation_sync_loop
+from .watchdog import loop_watchdog, LOOP_WATCHDOG_ENABLED
+from .jobs import job_runner
+from .viewstats import view_flush_loop, run_view_flush
+from .snapshot import SnapshotMiddleware, snapshot_store, SNAPSHOT_MODE
+from .routes import auth, courses, topics, notes, attachments, events, feed, admin
+
+# Time every statement; slow ones are kept with their query plans
+install_slow_query_log([engine, *read_engines])
 
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    """Initialize database on startup"""
+    """Initialize database and warm connections on startup"""
+    log_pipeline.start()
     init_db()
+    warm_connection_pool()
+    # Load crypto backends off the startup path; the first login picks them up if still pending
+    asyncio.get_running_loop().run_in_executor(None, preload_auth_backends)
+    asyncio.get_running_loop().run_in_executor(None, warm_course_index)
+    # Revoked sessions must be known before the first request is authenticated
+    await asyncio.get_running_loop().run_in_executor(None, run_revocation_sync, True)
+    if SNAPSHOT_MODE:
+        await asyncio.get_running_loop().run_in_executor(None, snapshot_store.refresh)
+    if WRITE_COALESCING_ENABLED:
+        write_coalescer.start()
+    await broker.start()
+    ranking_task = asyncio.create_task(ranking_maintenance_loop())
+    revocation_task = asyncio.create_task(revocation_sync_loop())
+    view_task = asyncio.create_task(view_flush_loop())
+    if LOOP_WATCHDOG_ENABLED:
+        loop_watchdog.start()
+    job_runner.start()
+    app.state.ready = True
     yield
+    app.state.ready = False
+    ranking_task.cancel()
+    revocation_task.cancel()
+    view_task.cancel()
+    # Write out views counted since the last flush
+    await asyncio.get_running_loop().run_in_executor(None, run_view_flush)
+    await loop_watchdog.stop()
+    # Let jobs in progress finish; queued ones wait in the table for the next start
+    await asyncio.get_running_loop().run_in_executor(None, job_runner.stop)
+    # Commit any likes/comments still waiting in the batch queue
+    await write_coalescer.stop()
+    await broker.stop()
+    log_pipeline.stop()
 
 
 app = FastAPI(
@@ -23,6 +73,16 @@ app = FastAPI(
     lifespan=lifespan
 )
 
+# Exam-week read-only mode: serves content reads from the pre-rendered snapshot, rejects writes
+# Added first so rate limiting, CORS and access logging still wrap it
+if SNAPSHOT_MODE:
+    app.add_middleware(SnapshotMiddleware)
+
+# Rate limiting and write admission control
+# Added before CORS so CORS wraps it and 429 responses still carry CORS headers
+if RATE_LIMIT_ENABLED:
+    app.add_middleware(RateLimitMiddleware)
+
 # CORS middleware for frontend communication
 app.add_middleware(
     CORSMiddleware,
@@ -30,13 +90,26 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Request-ID", "X-Duplicate-Of", "X-Profile-ID"],
 )
 
+# cProfile for requests carrying a signed X-Profile header; inside the access log so the request ID is set
+if PROFILE_SECRET:
+    app.add_middleware(RequestProfilerMiddleware)
+
+# Request IDs and access logging; added last so it is outermost and times everything
+if LOG_ENABLED:
+    app.add_middleware(AccessLogMiddleware)
+
 # Include routers
 app.include_router(auth.router, prefix="/api/auth", tags=["Authentication"])
 app.include_router(courses.router, prefix="/api/courses", tags=["Courses"])
 app.include_router(topics.router, prefix="/api/topics", tags=["Topics"])
 app.include_router(notes.router, prefix="/api/notes", tags=["Notes"])
+app.include_router(attachments.router, prefix="/api/notes", tags=["Attachments"])
+app.include_router(events.router, prefix="/api/events", tags=["Events"])
+app.include_router(feed.router, prefix="/api/feed", tags=["Feed"])
+app.include_router(admin.router, prefix="/api/admin", tags=["Admin"])
 
 
 @app.get("/")
@@ -53,3 +126,11 @@ async def health_check():
     """Health check endpoint for monitoring"""
     return {"status": "healthy", "service": "wcah-backend"}
 
+
+@app.get("/api/ready")
+async def readiness_check(response: Response):
+    """Readiness probe: startup finished and the database is reachable"""
+    if not getattr(app.state, "ready", False) or not check_database():
+        response.status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+        return {"status": "starting", "service": "wcah-backend"}
+    return {"status": "ready", "service": "wcah-backend"}
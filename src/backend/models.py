@@ -1,12 +1,13 @@
 """
 Database models for Waterloo CS Study Note Hub
 """
-from sqlalchemy import Column, Integer, String, Text, ForeignKey, Table, DateTime, Boolean, Enum
+from sqlalchemy import Column, Integer, String, Text, ForeignKey, Table, DateTime, Boolean, Enum, Float, Index, LargeBinary, UniqueConstraint, BigInteger
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 from datetime import datetime
 import enum
 from .database import Base
+from .blobstore import store_note_body, load_note_body
 
 
 # Enum for note type
@@ -80,13 +81,20 @@ class Topic(Base):
     course = relationship("Course", back_populates="topics")
     notes = relationship("StudyNote", back_populates="topic", cascade="all, delete-orphan")
 
+    __table_args__ = (
+        # Ids must never be reused: a deleted course's notes keep their topic id until
+        # the delete_topics job removes them, and must not turn up in a new topic
+        {'sqlite_autoincrement': True},
+    )
+
 
 class StudyNote(Base):
     __tablename__ = "study_notes"
 
     id = Column(Integer, primary_key=True, index=True)
     title = Column(String(200), nullable=False)
-    content = Column(Text, nullable=False)  # Markdown content
+    # Markdown content, or a reference to the blob store for large bodies (use .content)
+    _content = Column("content", Text, nullable=False)
     summary = Column(String(500), nullable=True)
     note_type = Column(Enum(NoteType), nullable=False)
     
@@ -101,6 +109,21 @@ class StudyNote(Base):
     author = relationship("User", back_populates="notes")
     comments = relationship("Comment", back_populates="note", cascade="all, delete-orphan")
     liked_by_users = relationship("User", secondary=user_note_likes, back_populates="liked_notes")
+    ranking = relationship("NoteRanking", back_populates="note", uselist=False, cascade="all, delete-orphan")
+    revisions = relationship("NoteRevision", back_populates="note", cascade="all, delete-orphan")
+    attachments = relationship("NoteAttachment", back_populates="note", cascade="all, delete-orphan")
+    fingerprint = relationship("NoteFingerprint", uselist=False, cascade="all, delete-orphan")
+    lsh_buckets = relationship("NoteLshBucket", cascade="all, delete-orphan")
+    related_terms = relationship("NoteTerm", cascade="all, delete-orphan")
+    related_notes = relationship("RelatedNote", foreign_keys="RelatedNote.note_id", cascade="all, delete-orphan")
+
+    @property
+    def content(self) -> str:
+        return load_note_body(self._content)
+
+    @content.setter
+    def content(self, value: str):
+        self._content = store_note_body(value)
 
 
 class Comment(Base):
@@ -115,3 +138,260 @@ class Comment(Base):
     # Relationships
     note = relationship("StudyNote", back_populates="comments")
     user = relationship("User")
+
+
+class NoteRanking(Base):
+    """
+    Time-decayed hotness per note, kept out of study_notes so ranking scans stay small.
+    topic_id and course_id are copied here so each ranking query is a single index range.
+    """
+    __tablename__ = "note_rankings"
+
+    note_id = Column(Integer, ForeignKey('study_notes.id', ondelete='CASCADE'), primary_key=True)
+    topic_id = Column(Integer, nullable=False)
+    course_id = Column(Integer, nullable=False)
+    hot_score = Column(Float, nullable=False, default=0.0)
+
+    __table_args__ = (
+        Index('ix_note_rankings_topic_hot', 'topic_id', 'hot_score'),
+        Index('ix_note_rankings_course_hot', 'course_id', 'hot_score'),
+        Index('ix_note_rankings_hot', 'hot_score'),
+    )
+
+    # Relationships
+    note = relationship("StudyNote", back_populates="ranking")
+
+
+class RankingState(Base):
+    """Single-row table recording when hot scores were last decayed"""
+    __tablename__ = "ranking_state"
+
+    id = Column(Integer, primary_key=True)
+    last_decay_at = Column(Float, nullable=False)  # Unix timestamp
+
+
+class CourseActivity(Base):
+    """
+    Append-only log of new notes and comments per course, read by the dashboard feed.
+    Deleting a note appends a "note_deleted" tombstone rather than rewriting history,
+    so a course's newest id doubles as its feed version.
+    """
+    __tablename__ = "course_activity"
+
+    id = Column(Integer, primary_key=True)
+    course_id = Column(Integer, nullable=False)
+    topic_id = Column(Integer, nullable=False)
+    note_id = Column(Integer, nullable=False)
+    comment_id = Column(Integer, nullable=True)
+    kind = Column(String(20), nullable=False)  # "note", "comment" or "note_deleted"
+    author_id = Column(Integer, nullable=False)
+    title = Column(String(200), nullable=False)  # The note's title
+    excerpt = Column(String(300), nullable=True)  # Note summary or start of the comment
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+    __table_args__ = (
+        Index('ix_course_activity_course_id_id', 'course_id', 'id'),
+        # Ids must never be reused after a delete, since they act as versions
+        {'sqlite_autoincrement': True},
+    )
+
+
+class NoteRevision(Base):
+    """
+    One version of a note. data holds the zlib-compressed full content for snapshots,
+    or a compressed line delta against the previous revision otherwise.
+    """
+    __tablename__ = "note_revisions"
+
+    id = Column(Integer, primary_key=True)
+    note_id = Column(Integer, ForeignKey('study_notes.id', ondelete='CASCADE'), nullable=False)
+    revision = Column(Integer, nullable=False)  # 1 is the original text
+    is_snapshot = Column(Boolean, nullable=False, default=False)
+    data = Column(LargeBinary, nullable=False)
+    content_size = Column(Integer, nullable=False)  # Length of the full content
+    title = Column(String(200), nullable=False)
+    summary = Column(String(500), nullable=True)
+    note_type = Column(Enum(NoteType), nullable=False)
+    editor_id = Column(Integer, ForeignKey('users.id'), nullable=False)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+    __table_args__ = (
+        UniqueConstraint('note_id', 'revision', name='uq_note_revisions_note_revision'),
+    )
+
+    # Relationships
+    note = relationship("StudyNote", back_populates="revisions")
+
+
+class NoteAttachment(Base):
+    """A file attached to a note; the bytes live in the blob store under sha256"""
+    __tablename__ = "note_attachments"
+
+    id = Column(Integer, primary_key=True, index=True)
+    note_id = Column(Integer, ForeignKey('study_notes.id', ondelete='CASCADE'), nullable=False, index=True)
+    filename = Column(String(255), nullable=False)
+    content_type = Column(String(100), nullable=False)
+    size = Column(Integer, nullable=False)
+    sha256 = Column(String(64), nullable=False, index=True)
+    uploader_id = Column(Integer, ForeignKey('users.id'), nullable=False)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+    # Relationships
+    note = relationship("StudyNote", back_populates="attachments")
+
+
+class NoteFingerprint(Base):
+    """Content fingerprints for duplicate detection within a topic"""
+    __tablename__ = "note_fingerprints"
+
+    note_id = Column(Integer, ForeignKey('study_notes.id', ondelete='CASCADE'), primary_key=True)
+    topic_id = Column(Integer, nullable=False)
+    content_hash = Column(String(64), nullable=False)  # SHA-256 of the normalized text
+    signature = Column(LargeBinary, nullable=True)  # Packed MinHash; null for very short notes
+    duplicate_of = Column(Integer, nullable=True, index=True)  # Original note, if linked as a duplicate
+
+    __table_args__ = (
+        Index('ix_note_fingerprints_topic_hash', 'topic_id', 'content_hash'),
+    )
+
+
+class NoteLshBucket(Base):
+    """One row per (note, MinHash band); notes sharing a bucket are near-duplicate candidates"""
+    __tablename__ = "note_lsh_buckets"
+
+    note_id = Column(Integer, ForeignKey('study_notes.id', ondelete='CASCADE'), primary_key=True)
+    bucket = Column(BigInteger().with_variant(Integer, "sqlite"), primary_key=True)
+    topic_id = Column(Integer, nullable=False)
+
+    __table_args__ = (
+        Index('ix_note_lsh_buckets_topic_bucket', 'topic_id', 'bucket'),
+    )
+
+
+class CourseChange(Base):
+    """
+    Append-only log of course creates, edits and deletes. Each worker's course search
+    index applies rows newer than the last id it saw.
+    """
+    __tablename__ = "course_changes"
+
+    id = Column(Integer, primary_key=True)
+    course_id = Column(Integer, nullable=False)
+    changed_at = Column(DateTime(timezone=True), server_default=func.now())
+
+    __table_args__ = (
+        {'sqlite_autoincrement': True},
+    )
+
+
+class RevokedSession(Base):
+    """
+    Append-only list of revoked login sessions (every access and refresh token
+    issued from one login shares a session id). Each worker mirrors it in a
+    Bloom filter; rows are purged once every token of the session has expired.
+    """
+    __tablename__ = "revoked_sessions"
+
+    id = Column(Integer, primary_key=True)
+    session_id = Column(String(32), nullable=False, index=True)
+    expires_at = Column(DateTime, nullable=False, index=True)  # UTC; no token of the session outlives it
+    revoked_at = Column(DateTime(timezone=True), server_default=func.now())
+
+    __table_args__ = (
+        {'sqlite_autoincrement': True},
+    )
+
+
+class UsedRefreshToken(Base):
+    """
+    Refresh tokens already exchanged, by jti. Each refresh token works once;
+    presenting one again means it was copied, so its session is revoked.
+    Rows are purged with revoked sessions once the token has expired.
+    """
+    __tablename__ = "used_refresh_tokens"
+
+    jti = Column(String(32), primary_key=True)
+    session_id = Column(String(32), nullable=False)
+    expires_at = Column(DateTime, nullable=False, index=True)  # UTC expiry of the token
+
+
+class Job(Base):
+    """
+    Durable background job. Workers claim queued rows whose run_after has passed,
+    highest priority first; a failed attempt is retried with backoff until
+    max_attempts. idempotency_key, when set, makes enqueueing the same work twice a no-op.
+    """
+    __tablename__ = "jobs"
+
+    id = Column(Integer, primary_key=True)
+    job_type = Column(String(50), nullable=False)
+    payload = Column(Text, nullable=False, default="{}")  # JSON
+    priority = Column(Integer, nullable=False, default=0)  # Higher runs first
+    status = Column(String(20), nullable=False, default="queued")  # queued, running, done or failed
+    idempotency_key = Column(String(200), nullable=True, unique=True)
+    attempts = Column(Integer, nullable=False, default=0)
+    max_attempts = Column(Integer, nullable=False, default=3)
+    run_after = Column(DateTime, nullable=False, default=datetime.utcnow)  # UTC
+    locked_by = Column(String(64), nullable=True)  # Worker running it
+    locked_at = Column(DateTime, nullable=True)
+    last_error = Column(Text, nullable=True)
+    created_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+    finished_at = Column(DateTime, nullable=True)
+
+    __table_args__ = (
+        Index('ix_jobs_status_priority', 'status', 'priority', 'id'),
+        Index('ix_jobs_type_status', 'job_type', 'status'),
+        {'sqlite_autoincrement': True},
+    )
+
+
+class ViewSketch(Base):
+    """
+    View analytics for a note, topic or course: the raw view count and a HyperLogLog
+    sketch of the students who viewed it, with its estimate precomputed. Written only
+    by the buffered flush in viewstats.py.
+    """
+    __tablename__ = "view_sketches"
+
+    scope = Column(String(10), primary_key=True)  # "note", "topic" or "course"
+    scope_id = Column(Integer, primary_key=True)
+    views = Column(Integer, nullable=False, default=0)
+    unique_viewers = Column(Integer, nullable=False, default=0)  # Estimate from the sketch
+    sketch = Column(LargeBinary, nullable=False)  # One byte per HLL register
+    updated_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+
+
+class NoteTerm(Base):
+    """A note's TF-IDF vector for related-note recommendations: its strongest hashed terms, L2-normalized"""
+    __tablename__ = "note_terms"
+
+    note_id = Column(Integer, ForeignKey('study_notes.id', ondelete='CASCADE'), primary_key=True)
+    feature = Column(Integer, primary_key=True)  # Hashed term
+    weight = Column(Float, nullable=False)
+
+    __table_args__ = (
+        Index('ix_note_terms_feature', 'feature'),
+    )
+
+
+class RelatedNote(Base):
+    """Precomputed nearest neighbours of a note by cosine similarity of their term vectors"""
+    __tablename__ = "related_notes"
+
+    note_id = Column(Integer, ForeignKey('study_notes.id', ondelete='CASCADE'), primary_key=True)
+    related_id = Column(Integer, ForeignKey('study_notes.id', ondelete='CASCADE'), primary_key=True)
+    score = Column(Float, nullable=False)
+
+    __table_args__ = (
+        Index('ix_related_notes_related', 'related_id'),
+    )
+
+
+class RelatedState(Base):
+    """Single row: document frequencies from the last full recompute, used as the IDF for new notes"""
+    __tablename__ = "related_state"
+
+    id = Column(Integer, primary_key=True)
+    document_count = Column(Integer, nullable=False)
+    document_frequencies = Column(LargeBinary, nullable=False)  # uint32 per hashed feature
+    updated_at = Column(DateTime, nullable=False, default=datetime.utcnow)
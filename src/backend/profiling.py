@@ -0,0 +1,234 @@
+"""
+On-demand profiling
+
+Two tools for finding out where a slow endpoint spends its time in production:
+  * A sampling profiler: a background thread that snapshots every thread's
+    stack at a fixed interval and, when stopped, writes the counts as
+    collapsed stacks (one "frame;frame;frame count" line per stack), the input
+    format of flamegraph.pl and speedscope. Nothing runs while it is off.
+  * Per-request cProfile: a request carrying a valid signed X-Profile header
+    is run under cProfile and the stats are saved to a bounded directory.
+    The signature covers the path and an expiry, so a leaked header can't be
+    replayed against other endpoints or forever.
+Both write into WCAH_PROFILE_DIR and only affect the worker that handled the
+admin request or the profiled request.
+"""
+import os
+import re
+import sys
+import hmac
+import time
+import pstats
+import hashlib
+import cProfile
+import threading
+from collections import Counter
+from pathlib import Path
+from typing import List, Optional
+
+from .logs import current_request_id
+
+PROFILE_DIR = Path(os.getenv("WCAH_PROFILE_DIR", "./profiles"))
+# Secret for X-Profile signatures; per-request profiling is off without one
+PROFILE_SECRET = os.getenv("WCAH_PROFILE_SECRET", "")
+PROFILE_MAX_FILES = int(os.getenv("WCAH_PROFILE_MAX_FILES", "50"))
+SAMPLE_INTERVAL_MS = float(os.getenv("WCAH_PROFILE_SAMPLE_INTERVAL_MS", "5"))
+# A forgotten sampling run stops itself after this long
+SAMPLE_MAX_SECONDS = float(os.getenv("WCAH_PROFILE_MAX_SECONDS", "300"))
+
+PROFILE_HEADER = b"x-profile"
+PROFILE_ID_HEADER = b"x-profile-id"
+PROFILE_NAME_PATTERN = re.compile(r"^[A-Za-z0-9._-]+\.(collapsed|prof)$")
+MAX_STACK_DEPTH = 128
+
+
+def prune_profiles(keep: int = PROFILE_MAX_FILES):
+    """Delete the oldest profile files beyond the newest `keep`"""
+    files = sorted(list_profiles(), key=lambda info: info["modified"], reverse=True)
+    for info in files[keep:]:
+        try:
+            (PROFILE_DIR / info["name"]).unlink()
+        except FileNotFoundError:
+            pass
+
+
+def list_profiles() -> List[dict]:
+    if not PROFILE_DIR.is_dir():
+        return []
+    profiles = []
+    for path in PROFILE_DIR.iterdir():
+        if PROFILE_NAME_PATTERN.match(path.name):
+            stat = path.stat()
+            profiles.append({"name": path.name, "size": stat.st_size, "modified": stat.st_mtime})
+    return sorted(profiles, key=lambda info: info["modified"], reverse=True)
+
+
+def profile_path(name: str) -> Optional[Path]:
+    """Path of a stored profile, or None for names that aren't ours"""
+    if not PROFILE_NAME_PATTERN.match(name):
+        return None
+    path = PROFILE_DIR / name
+    return path if path.is_file() else None
+
+
+def new_profile_name(label: str, suffix: str) -> str:
+    slug = re.sub(r"[^A-Za-z0-9]+", "-", label).strip("-")[:60] or "root"
+    now = time.time()
+    return f"{time.strftime('%Y%m%d-%H%M%S', time.localtime(now))}{int(now % 1 * 1000):03d}-{slug}.{suffix}"
+
+
+def frame_label(code) -> str:
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+class SamplingProfiler:
+    """Statistical profiler over all threads of this worker"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.thread: Optional[threading.Thread] = None
+        self.stop_event = threading.Event()
+        self.counts: Counter = Counter()
+        self.samples = 0
+        self.started_at: Optional[float] = None
+        self.interval = SAMPLE_INTERVAL_MS / 1000
+
+    @property
+    def running(self) -> bool:
+        return self.thread is not None
+
+    def start(self, interval_ms: float = SAMPLE_INTERVAL_MS, max_seconds: float = SAMPLE_MAX_SECONDS) -> bool:
+        """Begin sampling; False if already running"""
+        with self.lock:
+            if self.thread is not None:
+                return False
+            self.counts = Counter()
+            self.samples = 0
+            self.interval = interval_ms / 1000
+            self.started_at = time.time()
+            self.stop_event.clear()
+            self.thread = threading.Thread(
+                target=self._run, args=(max_seconds,), name="wcah-sampling-profiler", daemon=True
+            )
+            self.thread.start()
+            return True
+
+    def stop(self) -> Optional[dict]:
+        """Stop sampling and write the collapsed stacks; None if it wasn't running"""
+        with self.lock:
+            thread = self.thread
+            if thread is None:
+                return None
+            self.stop_event.set()
+            thread.join()
+            self.thread = None
+            return self._write()
+
+    def status(self) -> dict:
+        return {
+            "running": self.running,
+            "started_at": self.started_at if self.running else None,
+            "interval_ms": self.interval * 1000,
+            "samples": self.samples,
+        }
+
+    def _run(self, max_seconds: float):
+        own_id = threading.get_ident()
+        deadline = time.monotonic() + max_seconds
+        while not self.stop_event.wait(self.interval):
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id:
+                    continue
+                stack = []
+                while frame is not None and len(stack) < MAX_STACK_DEPTH:
+                    stack.append(frame_label(frame.f_code))
+                    frame = frame.f_back
+                stack.append(names.get(thread_id, f"thread-{thread_id}"))
+                self.counts[";".join(reversed(stack))] += 1
+            self.samples += 1
+            if time.monotonic() >= deadline:
+                break
+        if not self.stop_event.is_set():
+            # Timed out rather than stopped: save what we have
+            threading.Thread(target=self.stop, daemon=True).start()
+
+    def _write(self) -> dict:
+        PROFILE_DIR.mkdir(parents=True, exist_ok=True)
+        name = new_profile_name("sampling", "collapsed")
+        with open(PROFILE_DIR / name, "w", encoding="utf-8") as f:
+            for stack, count in self.counts.most_common():
+                f.write(f"{stack} {count}\n")
+        prune_profiles()
+        return {"name": name, "samples": self.samples, "stacks": len(self.counts)}
+
+
+sampling_profiler = SamplingProfiler()
+
+
+def sign_profile_request(path: str, expires: int, secret: str = PROFILE_SECRET) -> str:
+    """Value for the X-Profile header: "<expires>.<hmac of expires and path>" """
+    mac = hmac.new(secret.encode(), f"{expires}:{path}".encode(), hashlib.sha256).hexdigest()
+    return f"{expires}.{mac}"
+
+
+def verify_profile_header(value: str, path: str, secret: str = PROFILE_SECRET) -> bool:
+    expires, _, _ = value.partition(".")
+    if not secret or not expires.isdigit() or int(expires) < time.time():
+        return False
+    return hmac.compare_digest(value, sign_profile_request(path, int(expires), secret))
+
+
+# cProfile can't nest, so at most one request is profiled at a time per worker
+request_profile_lock = threading.Lock()
+
+
+class RequestProfilerMiddleware:
+    """
+    ASGI middleware running requests that carry a valid X-Profile header under
+    cProfile. The profile covers the event loop thread while the request runs,
+    so other requests interleaving on the loop show up too; profile on a quiet
+    worker for clean numbers. The saved file's name is returned in X-Profile-ID.
+    """
+
+    def __init__(self, app, secret: str = PROFILE_SECRET):
+        self.app = app
+        self.secret = secret
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        header = None
+        for name, value in scope["headers"]:
+            if name == PROFILE_HEADER:
+                header = value.decode("latin-1")
+                break
+        if (
+            header is None
+            or not verify_profile_header(header, scope["path"], self.secret)
+            or not request_profile_lock.acquire(blocking=False)
+        ):
+            await self.app(scope, receive, send)
+            return
+
+        label = f"{scope['method']} {scope['path']} {current_request_id() or ''}"
+        profile_name = new_profile_name(label, "prof")
+
+        async def send_with_profile_id(message):
+            if message["type"] == "http.response.start":
+                message["headers"] = [*message.get("headers", []), (PROFILE_ID_HEADER, profile_name.encode())]
+            await send(message)
+
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+            try:
+                await self.app(scope, receive, send_with_profile_id)
+            finally:
+                profiler.disable()
+            PROFILE_DIR.mkdir(parents=True, exist_ok=True)
+            pstats.Stats(profiler).dump_stats(str(PROFILE_DIR / profile_name))
+            prune_profiles()
+        finally:
+            request_profile_lock.release()
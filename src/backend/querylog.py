@@ -0,0 +1,137 @@
+"""
+Slow-query log
+
+Cursor execute hooks time every statement. Statements slower than
+WCAH_SLOW_QUERY_MS are recorded with their parameters, the request that ran
+them and the database's query plan, in a ring buffer served to professors
+at /api/admin/slow-queries and logged to "wcah.slow_query" (optionally to
+its own file). Fast statements cost one timer read and one comparison.
+"""
+import os
+import time
+import logging
+import logging.handlers
+import threading
+from collections import OrderedDict, deque
+from typing import List, Optional
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from .logs import request_context, log_pipeline, JsonFormatter
+
+SLOW_QUERY_MS = float(os.getenv("WCAH_SLOW_QUERY_MS", "100"))  # 0 disables the hooks
+SLOW_QUERY_BUFFER_SIZE = int(os.getenv("WCAH_SLOW_QUERY_BUFFER_SIZE", "200"))
+SLOW_QUERY_EXPLAIN = os.getenv("WCAH_SLOW_QUERY_EXPLAIN", "1") == "1"
+# Also write slow queries as JSON lines to this file (size-rotated)
+SLOW_QUERY_LOG_FILE = os.getenv("WCAH_SLOW_QUERY_LOG_FILE", "")
+
+MAX_PARAM_LENGTH = 200
+PLAN_CACHE_SIZE = 256
+EXPLAINABLE = ("SELECT", "INSERT", "UPDATE", "DELETE", "WITH")
+
+logger = logging.getLogger("wcah.slow_query")
+
+
+def summarize_parameters(parameters) -> Optional[str]:
+    if parameters is None:
+        return None
+    if isinstance(parameters, list):
+        # executemany: show the first set and how many there were
+        return f"{summarize_parameters(parameters[0]) if parameters else '[]'} (x{len(parameters)})"
+    text = repr(tuple(
+        value[:MAX_PARAM_LENGTH] + "..." if isinstance(value, str) and len(value) > MAX_PARAM_LENGTH else value
+        for value in (parameters.values() if isinstance(parameters, dict) else parameters)
+    ))
+    return text[:MAX_PARAM_LENGTH * 4]
+
+
+class SlowQueryLog:
+    """Ring buffer of slow statements, with query plans cached per statement text"""
+
+    def __init__(self, threshold_ms: float = SLOW_QUERY_MS, buffer_size: int = SLOW_QUERY_BUFFER_SIZE):
+        self.threshold = threshold_ms / 1000
+        self.entries: deque = deque(maxlen=buffer_size)
+        self.plans: "OrderedDict[str, List[str]]" = OrderedDict()
+        self.lock = threading.Lock()
+
+    def before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        conn.info["wcah_query_start"] = time.perf_counter()
+
+    def after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - conn.info.get("wcah_query_start", time.perf_counter())
+        if elapsed < self.threshold:
+            return
+        self.record(conn, cursor, statement, parameters, elapsed, executemany)
+
+    def record(self, conn, cursor, statement, parameters, elapsed, executemany):
+        request = request_context.get()
+        entry = {
+            "at": time.time(),
+            "duration_ms": round(elapsed * 1000, 2),
+            "statement": statement,
+            "parameters": summarize_parameters(parameters),
+            "request_id": request[0] if request else None,
+            "route": f"{request[1]} {request[2]}" if request else None,
+            "plan": self.explain(conn, cursor, statement, parameters[0] if executemany and parameters else parameters),
+        }
+        self.entries.append(entry)
+        logger.warning("Slow query (%.1f ms)", entry["duration_ms"], extra={"fields": entry})
+
+    def explain(self, conn, cursor, statement: str, parameters) -> Optional[List[str]]:
+        if not SLOW_QUERY_EXPLAIN or not statement.lstrip().upper().startswith(EXPLAINABLE):
+            return None
+        with self.lock:
+            if statement in self.plans:
+                self.plans.move_to_end(statement)
+                return self.plans[statement]
+        sqlite = conn.dialect.name == "sqlite"
+        prefix = "EXPLAIN QUERY PLAN " if sqlite else "EXPLAIN "
+        try:
+            # A separate DBAPI cursor on the same connection, so the hooks don't fire again
+            explain_cursor = cursor.connection.cursor()
+            try:
+                explain_cursor.execute(prefix + statement, parameters or ())
+                # SQLite rows are (id, parent, notused, detail); the detail is what matters
+                plan = [
+                    str(row[-1]) if sqlite else " ".join(str(column) for column in row)
+                    for row in explain_cursor.fetchall()
+                ]
+            finally:
+                explain_cursor.close()
+        except Exception as exc:
+            plan = [f"EXPLAIN failed: {exc}"]
+        with self.lock:
+            self.plans[statement] = plan
+            while len(self.plans) > PLAN_CACHE_SIZE:
+                self.plans.popitem(last=False)
+        return plan
+
+    def recent(self, limit: int) -> List[dict]:
+        """Newest first"""
+        return list(self.entries)[::-1][:limit]
+
+    def clear(self):
+        self.entries.clear()
+
+    def install(self, engine: Engine):
+        event.listen(engine, "before_cursor_execute", self.before_cursor_execute)
+        event.listen(engine, "after_cursor_execute", self.after_cursor_execute)
+
+
+slow_query_log = SlowQueryLog()
+
+
+def install_slow_query_log(engines):
+    """Attach the hooks to every engine (primary and read engines)"""
+    if SLOW_QUERY_MS <= 0:
+        return
+    for engine in engines:
+        slow_query_log.install(engine)
+    if SLOW_QUERY_LOG_FILE:
+        handler = logging.handlers.RotatingFileHandler(
+            SLOW_QUERY_LOG_FILE, maxBytes=10 * 1024 * 1024, backupCount=3, encoding="utf-8"
+        )
+        handler.setFormatter(JsonFormatter())
+        handler.addFilter(logging.Filter(logger.name))
+        log_pipeline.add_handler(handler)
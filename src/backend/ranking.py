@@ -0,0 +1,154 @@
+"""
+Hot note ranking
+
+Each note has a hotness score in note_rankings. Likes, comments and creation add
+fixed weights to it with a single atomic UPDATE, and a periodic job multiplies
+every score by the decay factor for the elapsed time (exponential decay with a
+configurable half-life). Increments between decay runs are not pre-decayed;
+with the default 5 minute interval and 24 hour half-life that error is < 0.3%.
+
+Rankings are read straight off the (topic_id|course_id, hot_score) indexes,
+so a page costs O(page size) regardless of how many notes a topic has.
+"""
+import os
+import time
+import asyncio
+import logging
+from datetime import datetime, timezone
+from typing import List, Optional
+
+from sqlalchemy import update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+from sqlalchemy.sql.elements import ColumnElement
+
+from .database import SessionLocal
+from .models import StudyNote, Topic, NoteRanking, RankingState
+
+logger = logging.getLogger(__name__)
+
+HOT_HALF_LIFE_HOURS = float(os.getenv("WCAH_HOT_HALF_LIFE_HOURS", "24"))
+DECAY_INTERVAL_SECONDS = float(os.getenv("WCAH_HOT_DECAY_INTERVAL_SECONDS", "300"))
+
+CREATE_WEIGHT = 3.0
+LIKE_WEIGHT = 1.0
+COMMENT_WEIGHT = 2.0
+
+
+def decay_factor(elapsed_seconds: float) -> float:
+    """Multiplier that decays a score over the elapsed time"""
+    return 0.5 ** (max(0.0, elapsed_seconds) / (HOT_HALF_LIFE_HOURS * 3600))
+
+
+def add_note_ranking(db: Session, note_id: int, topic_id: int, course_id: int):
+    """Give a new note its initial score (call in the transaction that creates it)"""
+    db.add(NoteRanking(note_id=note_id, topic_id=topic_id, course_id=course_id, hot_score=CREATE_WEIGHT))
+
+
+def bump_hot_score(db: Session, note_id: int, weight: float):
+    """Add activity weight to a note's score (call in the transaction that records the activity)"""
+    db.execute(
+        update(NoteRanking)
+        .where(NoteRanking.note_id == note_id)
+        .values(hot_score=NoteRanking.hot_score + weight)
+    )
+
+
+def ranked_notes(
+    db: Session,
+    topic_id: Optional[int] = None,
+    course_id: Optional[int] = None,
+    limit: int = 20,
+    offset: int = 0,
+    where: Optional[ColumnElement] = None,
+) -> List[StudyNote]:
+    """Hottest notes in a topic, a course, or globally, with an optional extra filter"""
+    query = db.query(StudyNote).join(NoteRanking, NoteRanking.note_id == StudyNote.id)
+    if where is not None:
+        query = query.filter(where)
+    if topic_id is not None:
+        query = query.filter(NoteRanking.topic_id == topic_id)
+    if course_id is not None:
+        query = query.filter(NoteRanking.course_id == course_id)
+    query = query.order_by(NoteRanking.hot_score.desc(), NoteRanking.note_id.desc())
+    if limit is not None:
+        query = query.limit(limit)
+    return query.offset(offset).all()
+
+
+def backfill_rankings(db: Session) -> int:
+    """Create ranking rows for notes that don't have one yet (e.g. notes from before ranking existed)"""
+    missing = db.query(StudyNote.id, StudyNote.topic_id, Topic.course_id, StudyNote.likes, StudyNote.created_at).join(
+        Topic, StudyNote.topic_id == Topic.id
+    ).outerjoin(NoteRanking, NoteRanking.note_id == StudyNote.id).filter(NoteRanking.note_id.is_(None)).all()
+    if not missing:
+        return 0
+
+    now = datetime.now(timezone.utc)
+    rows = []
+    for note_id, topic_id, course_id, likes, created_at in missing:
+        if created_at is not None and created_at.tzinfo is None:
+            created_at = created_at.replace(tzinfo=timezone.utc)
+        age = (now - created_at).total_seconds() if created_at else 0.0
+        score = (CREATE_WEIGHT + (likes or 0) * LIKE_WEIGHT) * decay_factor(age)
+        rows.append({"note_id": note_id, "topic_id": topic_id, "course_id": course_id, "hot_score": score})
+    # Another worker may be backfilling at the same time
+    db.execute(NoteRanking.__table__.insert().prefix_with("OR IGNORE"), rows)
+    db.commit()
+    return len(rows)
+
+
+def decay_hot_scores(db: Session, now: Optional[float] = None) -> bool:
+    """
+    Decay every score by the time elapsed since the last run.
+    Safe to call from several workers: the run is claimed with a compare-and-swap
+    on ranking_state, so each interval is only applied once.
+    """
+    now = now if now is not None else time.time()
+    state = db.query(RankingState).filter(RankingState.id == 1).first()
+    if state is None:
+        try:
+            db.add(RankingState(id=1, last_decay_at=now))
+            db.commit()
+        except IntegrityError:
+            db.rollback()
+        return False
+
+    previous = state.last_decay_at
+    if now - previous < DECAY_INTERVAL_SECONDS / 2:
+        return False
+
+    claimed = db.execute(
+        update(RankingState)
+        .where(RankingState.id == 1, RankingState.last_decay_at == previous)
+        .values(last_decay_at=now)
+    ).rowcount
+    if not claimed:
+        db.rollback()
+        return False
+
+    db.execute(update(NoteRanking).values(hot_score=NoteRanking.hot_score * decay_factor(now - previous)))
+    db.commit()
+    return True
+
+
+def run_ranking_maintenance():
+    """Backfill missing rows and apply decay; runs in a worker thread"""
+    db = SessionLocal()
+    try:
+        backfill_rankings(db)
+        decay_hot_scores(db)
+    finally:
+        db.close()
+
+
+async def ranking_maintenance_loop():
+    """Periodic decay task started from main.lifespan"""
+    loop = asyncio.get_running_loop()
+    while True:
+        try:
+            await loop.run_in_executor(None, run_ranking_maintenance)
+        except Exception:
+            # Keep the loop alive; the next run applies the full elapsed decay
+            logger.exception("Hot score maintenance failed")
+        await asyncio.sleep(DECAY_INTERVAL_SECONDS)
@@ -0,0 +1,256 @@
+"""
+Rate limiting and admission control middleware
+
+Token buckets are keyed per route rule and per caller (user from the bearer
+token, or client IP when anonymous). Requests that write to the database also
+pass through a per-worker concurrency cap with a bounded, timed wait queue.
+Rejections are 429 responses with a Retry-After header.
+"""
+import os
+import re
+import json
+import math
+import time
+import asyncio
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass, replace
+from functools import lru_cache
+from typing import List, Optional, Tuple
+
+from .auth import decode_token
+
+WRITE_METHODS = {"POST", "PUT", "PATCH", "DELETE"}
+
+RATE_LIMIT_ENABLED = os.getenv("WCAH_RATE_LIMIT_ENABLED", "1") == "1"
+# "memory" for per-worker buckets, or a redis:// URL to share buckets across workers
+RATE_LIMIT_BACKEND = os.getenv("WCAH_RATE_LIMIT_BACKEND", "memory")
+# Per-route overrides, e.g. "login=20/10,like_note=120/40" (requests per minute / burst)
+RATE_LIMIT_OVERRIDES = os.getenv("WCAH_RATE_LIMITS", "")
+MAX_CONCURRENT_WRITES = int(os.getenv("WCAH_MAX_CONCURRENT_WRITES", "8"))
+WRITE_QUEUE_SIZE = int(os.getenv("WCAH_WRITE_QUEUE_SIZE", "64"))
+WRITE_QUEUE_TIMEOUT = float(os.getenv("WCAH_WRITE_QUEUE_TIMEOUT", "5"))
+
+
+@dataclass
+class RateLimitRule:
+    """A token bucket limit applied to requests matching a method and path pattern"""
+    name: str
+    method: str
+    path_pattern: str
+    per_minute: float
+    burst: int
+
+    def __post_init__(self):
+        self.regex = re.compile(self.path_pattern)
+
+    @property
+    def rate(self) -> float:
+        """Refill rate in tokens per second"""
+        return self.per_minute / 60.0
+
+    def matches(self, method: str, path: str) -> bool:
+        if self.method == "WRITE":
+            method_matches = method in WRITE_METHODS
+        else:
+            method_matches = self.method == method
+        return method_matches and self.regex.match(path) is not None
+
+
+# First matching rule wins, so specific routes come before the catch-all rules
+DEFAULT_RULES = [
+    RateLimitRule("signup", "POST", r"^/api/auth/signup/?$", per_minute=5, burst=5),
+    RateLimitRule("login", "POST", r"^/api/auth/login/?$", per_minute=10, burst=10),
+    RateLimitRule("create_note", "POST", r"^/api/notes/?$", per_minute=30, burst=10),
+    RateLimitRule("like_note", "POST", r"^/api/notes/\d+/like/?$", per_minute=60, burst=20),
+    RateLimitRule("add_comment", "POST", r"^/api/notes/\d+/comments/?$", per_minute=30, burst=10),
+    RateLimitRule("writes", "WRITE", r"^/api/", per_minute=120, burst=30),
+    RateLimitRule("reads", "GET", r"^/api/", per_minute=600, burst=100),
+]
+
+
+def load_rules(overrides: str = RATE_LIMIT_OVERRIDES) -> List[RateLimitRule]:
+    """Build the rule list, applying "name=per_minute/burst" overrides"""
+    rules = [replace(rule) for rule in DEFAULT_RULES]
+    by_name = {rule.name: rule for rule in rules}
+    for item in filter(None, (part.strip() for part in overrides.split(","))):
+        name, _, limit = item.partition("=")
+        per_minute, _, burst = limit.partition("/")
+        rule = by_name.get(name.strip())
+        if rule is None:
+            raise ValueError(f"Unknown rate limit rule: {name}")
+        rule.per_minute = float(per_minute)
+        rule.burst = int(burst) if burst else max(1, int(rule.per_minute))
+    return rules
+
+
+class MemoryBucketBackend:
+    """Token buckets held in this process; each worker limits independently"""
+
+    def __init__(self, max_keys: int = 100_000):
+        self.max_keys = max_keys
+        self.buckets: "OrderedDict[str, Tuple[float, float]]" = OrderedDict()
+        self.lock = threading.Lock()
+
+    async def consume(self, key: str, rate: float, burst: int) -> Tuple[bool, float]:
+        """Take one token; return (allowed, seconds until a token is available)"""
+        now = time.monotonic()
+        with self.lock:
+            tokens, updated = self.buckets.pop(key, (float(burst), now))
+            tokens = min(float(burst), tokens + (now - updated) * rate)
+            if tokens >= 1.0:
+                allowed, retry_after = True, 0.0
+                tokens -= 1.0
+            else:
+                allowed, retry_after = False, (1.0 - tokens) / rate
+            self.buckets[key] = (tokens, now)
+            # Least recently used buckets are full again by now, so dropping them is harmless
+            while len(self.buckets) > self.max_keys:
+                self.buckets.popitem(last=False)
+        return allowed, retry_after
+
+
+class RedisBucketBackend:
+    """
+    Token buckets in Redis (or any server speaking its protocol), shared by all workers.
+    Requires the optional redis package.
+    """
+
+    SCRIPT = """
+    local rate = tonumber(ARGV[1])
+    local burst = tonumber(ARGV[2])
+    local now = tonumber(ARGV[3])
+    local state = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+    local tokens = tonumber(state[1]) or burst
+    local ts = tonumber(state[2]) or now
+    tokens = math.min(burst, tokens + math.max(0, now - ts) * rate)
+    local allowed = 0
+    local retry_after = 0
+    if tokens >= 1 then
+        allowed = 1
+        tokens = tokens - 1
+    else
+        retry_after = (1 - tokens) / rate
+    end
+    redis.call('HSET', KEYS[1], 'tokens', tokens, 'ts', now)
+    redis.call('EXPIRE', KEYS[1], math.ceil(burst / rate) + 1)
+    return {allowed, tostring(retry_after)}
+    """
+
+    def __init__(self, url: str, prefix: str = "wcah:ratelimit:"):
+        import redis.asyncio as redis
+
+        self.client = redis.from_url(url)
+        self.prefix = prefix
+        self.script = self.client.register_script(self.SCRIPT)
+
+    async def consume(self, key: str, rate: float, burst: int) -> Tuple[bool, float]:
+        allowed, retry_after = await self.script(keys=[self.prefix + key], args=[rate, burst, time.time()])
+        return bool(allowed), float(retry_after)
+
+
+def create_backend(spec: str = RATE_LIMIT_BACKEND):
+    """Create the bucket backend named by WCAH_RATE_LIMIT_BACKEND"""
+    if spec.startswith(("redis://", "rediss://", "unix://")):
+        return RedisBucketBackend(spec)
+    return MemoryBucketBackend()
+
+
+@lru_cache(maxsize=4096)
+def user_from_token(token: str) -> Optional[str]:
+    """Get the username from a bearer token, or None if it doesn't verify"""
+    payload = decode_token(token)
+    return payload["sub"] if payload else None
+
+
+def caller_identity(scope) -> str:
+    """Identify the caller by authenticated user, falling back to client IP"""
+    for name, value in scope.get("headers", []):
+        if name == b"authorization":
+            scheme, _, token = value.decode("latin-1").partition(" ")
+            if scheme.lower() == "bearer" and token:
+                username = user_from_token(token)
+                if username:
+                    return f"user:{username}"
+            break
+    client = scope.get("client")
+    return f"ip:{client[0] if client else 'unknown'}"
+
+
+class RateLimitMiddleware:
+    """ASGI middleware enforcing per-route token buckets and a write concurrency cap"""
+
+    def __init__(
+        self,
+        app,
+        rules: Optional[List[RateLimitRule]] = None,
+        backend=None,
+        max_concurrent_writes: int = MAX_CONCURRENT_WRITES,
+        write_queue_size: int = WRITE_QUEUE_SIZE,
+        write_queue_timeout: float = WRITE_QUEUE_TIMEOUT,
+    ):
+        self.app = app
+        self.rules = rules if rules is not None else load_rules()
+        self.backend = backend if backend is not None else create_backend()
+        self.write_slots = asyncio.Semaphore(max_concurrent_writes)
+        self.write_queue_size = write_queue_size
+        self.write_queue_timeout = write_queue_timeout
+        self.waiting_writes = 0
+
+    def match_rule(self, method: str, path: str) -> Optional[RateLimitRule]:
+        for rule in self.rules:
+            if rule.matches(method, path):
+                return rule
+        return None
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] == "OPTIONS":
+            await self.app(scope, receive, send)
+            return
+
+        method, path = scope["method"], scope["path"]
+        rule = self.match_rule(method, path)
+        if rule is not None:
+            key = f"{rule.name}:{caller_identity(scope)}"
+            allowed, retry_after = await self.backend.consume(key, rule.rate, rule.burst)
+            if not allowed:
+                await self.reject(send, retry_after, "Rate limit exceeded, please slow down")
+                return
+
+        if method not in WRITE_METHODS or not path.startswith("/api/"):
+            await self.app(scope, receive, send)
+            return
+
+        if not await self.admit_write():
+            await self.reject(send, self.write_queue_timeout, "Server is busy, please retry shortly")
+            return
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            self.write_slots.release()
+
+    async def admit_write(self) -> bool:
+        """Wait for a write slot, unless the queue is full or the wait times out"""
+        if self.write_slots.locked() and self.waiting_writes >= self.write_queue_size:
+            return False
+        self.waiting_writes += 1
+        try:
+            await asyncio.wait_for(self.write_slots.acquire(), timeout=self.write_queue_timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+        finally:
+            self.waiting_writes -= 1
+
+    async def reject(self, send, retry_after: float, detail: str):
+        body = json.dumps({"detail": detail}).encode()
+        await send({
+            "type": "http.response.start",
+            "status": 429,
+            "headers": [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(body)).encode()),
+                (b"retry-after", str(max(1, math.ceil(retry_after))).encode()),
+            ],
+        })
+        await send({"type": "http.response.body", "body": body})
@@ -0,0 +1,378 @@
+"""
+Related-note recommendations
+
+Every note gets a sparse TF-IDF vector over hashed word features: the
+RELATED_MAX_TERMS strongest terms of its title, summary and content,
+L2-normalized, stored as rows of note_terms. Related notes are the top-k
+neighbours by cosine similarity, across all topics and courses, precomputed
+into related_notes so the endpoint is a single indexed read.
+
+Two paths keep them current:
+  * incremental: creating or editing a note enqueues an index_related_notes
+    job, which scores the note against the notes sharing its terms (via the
+    feature index on note_terms), stores its neighbours and offers it to
+    theirs. IDF comes from the snapshot saved by the last full recompute.
+  * full recompute (scripts/recompute_related_notes.py): refreshes the IDF
+    snapshot and every vector, then computes all neighbour lists block by
+    block, multiplying a chunk of notes against each chunk of the corpus in
+    turn. Corpus blocks are cached up to WCAH_RELATED_CACHE_TERMS nonzeros and
+    re-read beyond that, so memory stays bounded whatever the corpus size.
+    Blocks are sparse matrix products with NumPy/SciPy when installed, and an
+    inverted index in pure Python otherwise.
+Deleting a note deletes its vector and every neighbour entry that mentions it.
+"""
+import os
+import math
+import zlib
+import heapq
+from array import array
+from collections import Counter, defaultdict
+from datetime import datetime
+from typing import Callable, Dict, Iterator, List, NamedTuple, Optional, Tuple
+
+from sqlalchemy import or_, select
+from sqlalchemy.orm import Session
+
+from .models import StudyNote, NoteTerm, RelatedNote, RelatedState
+from .dedup import TOKEN_PATTERN
+from .jobs import job_handler
+
+RELATED_TOP_K = int(os.getenv("WCAH_RELATED_TOP_K", "20"))
+RELATED_MAX_TERMS = int(os.getenv("WCAH_RELATED_MAX_TERMS", "48"))
+RELATED_MIN_SCORE = float(os.getenv("WCAH_RELATED_MIN_SCORE", "0.05"))
+FEATURE_BITS = 18
+FEATURES = 1 << FEATURE_BITS
+MIN_TOKEN_LENGTH = 3
+# Neighbours of a new note whose lists it is offered to
+REVERSE_CANDIDATES = 100
+# Nonzeros of corpus blocks kept in memory during a full recompute (about 8 bytes each with NumPy)
+RELATED_CACHE_TERMS = int(os.getenv("WCAH_RELATED_CACHE_TERMS", "20000000"))
+
+Vector = Dict[int, float]
+
+
+def numpy_available() -> bool:
+    """
+    Whether the optional NumPy/SciPy backend is installed. Only the full recompute
+    uses it, so it's imported there rather than at startup (it costs ~250 ms).
+    """
+    try:
+        import numpy  # noqa: F401
+        import scipy.sparse  # noqa: F401
+    except ImportError:  # The pure-Python path gives the same results, more slowly
+        return False
+    return True
+
+
+def term_counts(text: str) -> Counter:
+    """Hashed feature -> occurrences; crc32 is stable across processes, unlike hash()"""
+    counts: Counter = Counter()
+    # Count words first (in C), then hash each distinct word once
+    for token, count in Counter(TOKEN_PATTERN.findall(text.lower())).items():
+        if len(token) >= MIN_TOKEN_LENGTH and not token.isdigit():
+            counts[zlib.crc32(token.encode()) & (FEATURES - 1)] += count
+    return counts
+
+
+def note_text(note: StudyNote) -> str:
+    return f"{note.title}\n{note.summary or ''}\n{note.content}"
+
+
+class Idf:
+    """Inverse document frequencies from a snapshot of per-feature document counts"""
+
+    def __init__(self, document_count: int = 0, frequencies: Optional[array] = None):
+        self.document_count = document_count
+        self.frequencies = frequencies if frequencies is not None else array("I", bytes(4 * FEATURES))
+
+    def weight(self, feature: int) -> float:
+        return math.log((self.document_count + 1) / (self.frequencies[feature] + 1)) + 1
+
+    def vector(self, counts: Counter) -> Vector:
+        weights = [(feature, (1 + math.log(count)) * self.weight(feature)) for feature, count in counts.items()]
+        strongest = heapq.nlargest(RELATED_MAX_TERMS, weights, key=lambda item: item[1])
+        norm = math.sqrt(sum(weight * weight for _, weight in strongest)) or 1.0
+        return {feature: weight / norm for feature, weight in strongest}
+
+
+_idf_cache: Tuple[Optional[datetime], Idf] = (None, Idf())
+
+
+def current_idf(db: Session) -> Idf:
+    """The saved IDF snapshot, reloaded only when a recompute has replaced it"""
+    global _idf_cache
+    updated_at = db.query(RelatedState.updated_at).filter(RelatedState.id == 1).scalar()
+    if updated_at != _idf_cache[0]:
+        state = db.query(RelatedState).filter(RelatedState.id == 1).first()
+        frequencies = array("I")
+        frequencies.frombytes(state.document_frequencies)
+        _idf_cache = (updated_at, Idf(state.document_count, frequencies))
+    return _idf_cache[1]
+
+
+def save_idf(db: Session, idf: Idf):
+    state = db.query(RelatedState).filter(RelatedState.id == 1).first() or RelatedState(id=1)
+    state.document_count = idf.document_count
+    state.document_frequencies = idf.frequencies.tobytes()
+    state.updated_at = datetime.utcnow()
+    db.merge(state)
+
+
+def store_vector(db: Session, note_id: int, vector: Vector):
+    db.query(NoteTerm).filter(NoteTerm.note_id == note_id).delete(synchronize_session=False)
+    if vector:
+        db.execute(NoteTerm.__table__.insert(), [
+            {"note_id": note_id, "feature": feature, "weight": weight} for feature, weight in vector.items()
+        ])
+
+
+def forget_related(db: Session, note_ids: List[int]):
+    """Remove deleted notes' vectors and every neighbour entry mentioning them (call in the deleting transaction)"""
+    if not note_ids:
+        return
+    db.query(NoteTerm).filter(NoteTerm.note_id.in_(note_ids)).delete(synchronize_session=False)
+    db.query(RelatedNote).filter(
+        or_(RelatedNote.note_id.in_(note_ids), RelatedNote.related_id.in_(note_ids))
+    ).delete(synchronize_session=False)
+
+
+# Incremental updates
+
+def score_against_index(db: Session, note_id: int, vector: Vector) -> Dict[int, float]:
+    """Cosine similarity with every note sharing a term, from the feature index"""
+    scores: Dict[int, float] = defaultdict(float)
+    if vector:
+        for other_id, feature, weight in db.query(NoteTerm.note_id, NoteTerm.feature, NoteTerm.weight).filter(
+            NoteTerm.feature.in_(list(vector)), NoteTerm.note_id != note_id
+        ):
+            scores[other_id] += vector[feature] * weight
+    return scores
+
+
+def index_related(db: Session, note: StudyNote, idf: Idf):
+    """Store a note's vector and neighbours and add it to its neighbours' lists"""
+    vector = idf.vector(term_counts(note_text(note)))
+    store_vector(db, note.id, vector)
+    scores = score_against_index(db, note.id, vector)
+    neighbours = heapq.nlargest(
+        max(RELATED_TOP_K, REVERSE_CANDIDATES),
+        ((score, other_id) for other_id, score in scores.items() if score >= RELATED_MIN_SCORE)
+    )
+
+    db.query(RelatedNote).filter(RelatedNote.note_id == note.id).delete(synchronize_session=False)
+    rows = [{"note_id": note.id, "related_id": other_id, "score": score} for score, other_id in neighbours[:RELATED_TOP_K]]
+
+    # Offer the note to its neighbours: it replaces their weakest entry if it scores higher
+    lists: Dict[int, List[Tuple[float, int]]] = defaultdict(list)
+    for row in db.query(RelatedNote.note_id, RelatedNote.related_id, RelatedNote.score).filter(
+        RelatedNote.note_id.in_([other_id for _, other_id in neighbours])
+    ):
+        if row.related_id != note.id:
+            lists[row.note_id].append((row.score, row.related_id))
+    stale: List[Tuple[int, int]] = []
+    for score, other_id in neighbours:
+        current = lists[other_id]
+        if len(current) < RELATED_TOP_K:
+            rows.append({"note_id": other_id, "related_id": note.id, "score": score})
+            continue
+        weakest = min(current)
+        if score > weakest[0]:
+            stale.append((other_id, weakest[1]))
+            rows.append({"note_id": other_id, "related_id": note.id, "score": score})
+    for other_id, related_id in stale:
+        db.query(RelatedNote).filter(
+            RelatedNote.note_id == other_id, RelatedNote.related_id == related_id
+        ).delete(synchronize_session=False)
+    # An edited note may already be in its neighbours' lists; its new score replaces the old one
+    db.query(RelatedNote).filter(RelatedNote.related_id == note.id).filter(
+        RelatedNote.note_id.in_([row["note_id"] for row in rows if row["note_id"] != note.id])
+    ).delete(synchronize_session=False)
+    if rows:
+        db.execute(RelatedNote.__table__.insert(), rows)
+
+
+@job_handler("index_related_notes", concurrency=1)
+def index_related_notes(db: Session, payload: dict):
+    """Job enqueued when notes are created or edited"""
+    idf = current_idf(db)
+    for note_id in payload["note_ids"]:
+        note = db.query(StudyNote).filter(StudyNote.id == note_id).first()
+        if note is not None:
+            index_related(db, note, idf)
+            db.commit()
+
+
+# Full recompute
+
+def note_chunks(db: Session, chunk_size: int) -> Iterator[List[StudyNote]]:
+    last_id = 0
+    while True:
+        notes = db.query(StudyNote).filter(StudyNote.id > last_id).order_by(StudyNote.id).limit(chunk_size).all()
+        if not notes:
+            return
+        yield notes
+        last_id = notes[-1].id
+        db.expunge_all()  # Bounded memory: drop the chunk's notes and their content
+
+
+class Block(NamedTuple):
+    """A chunk of notes' vectors: their ids, plus a CSR matrix (NumPy) or dicts (pure Python)"""
+    note_ids: List[int]
+    matrix: object
+    vectors: List[Vector]
+    terms: int
+
+
+def load_block(db: Session, first_id: int, last_id: int, use_numpy: bool) -> Block:
+    rows = db.execute(
+        select(NoteTerm.note_id, NoteTerm.feature, NoteTerm.weight)
+        .where(NoteTerm.note_id >= first_id, NoteTerm.note_id <= last_id)
+        .order_by(NoteTerm.note_id)
+    ).all()
+    if use_numpy:
+        import numpy as np
+        from scipy import sparse
+
+        if not rows:
+            return Block([], sparse.csr_matrix((0, FEATURES), dtype=np.float32), [], 0)
+        note_ids, features, weights = (np.array(column) for column in zip(*rows))
+        unique_ids, row_numbers = np.unique(note_ids, return_inverse=True)
+        matrix = sparse.csr_matrix(
+            (weights.astype(np.float32), (row_numbers, features)), shape=(len(unique_ids), FEATURES)
+        )
+        return Block(unique_ids.tolist(), matrix, [], len(rows))
+    vectors: Dict[int, Vector] = {}
+    for note_id, feature, weight in rows:
+        vectors.setdefault(note_id, {})[feature] = weight
+    return Block(list(vectors), None, list(vectors.values()), len(rows))
+
+
+class BlockCache:
+    """
+    Corpus blocks are needed once per query block. The first ones loaded are kept until
+    `max_terms` nonzeros are cached; the rest are read again each time, trading time for
+    a hard memory bound on large corpora.
+    """
+
+    def __init__(self, db: Session, max_terms: int, use_numpy: bool):
+        self.db = db
+        self.max_terms = max_terms
+        self.use_numpy = use_numpy
+        self.blocks: Dict[Tuple[int, int], Block] = {}
+        self.terms = 0
+
+    def get(self, chunk: Tuple[int, int]) -> Block:
+        block = self.blocks.get(chunk)
+        if block is None:
+            block = load_block(self.db, *chunk, self.use_numpy)
+            if self.terms + block.terms <= self.max_terms:
+                self.blocks[chunk] = block
+                self.terms += block.terms
+        return block
+
+
+def push_top(top: List[Tuple[float, int]], score: float, related_id: int):
+    """Keep the RELATED_TOP_K best (score, id) pairs in a min-heap"""
+    if len(top) < RELATED_TOP_K:
+        heapq.heappush(top, (score, related_id))
+    elif score > top[0][0]:
+        heapq.heapreplace(top, (score, related_id))
+
+
+def score_block_numpy(queries: Block, corpus: Block, tops: List[List[Tuple[float, int]]]):
+    import numpy as np
+
+    products = (queries.matrix @ corpus.matrix.T).tocsr()
+    products.data[products.data < RELATED_MIN_SCORE] = 0
+    products.eliminate_zeros()
+    for row in range(products.shape[0]):
+        start, end = products.indptr[row], products.indptr[row + 1]
+        if start == end:
+            continue
+        columns, scores = products.indices[start:end], products.data[start:end]
+        if len(scores) > RELATED_TOP_K + 1:
+            best = np.argpartition(-scores, RELATED_TOP_K + 1)[:RELATED_TOP_K + 1]
+            columns, scores = columns[best], scores[best]
+        note_id, top = queries.note_ids[row], tops[row]
+        for column, score in zip(columns.tolist(), scores.tolist()):
+            other_id = corpus.note_ids[column]
+            if other_id != note_id:
+                push_top(top, score, other_id)
+
+
+def score_block_python(queries: Block, corpus: Block, tops: List[List[Tuple[float, int]]]):
+    postings: Dict[int, List[Tuple[int, float]]] = defaultdict(list)
+    for other_id, vector in zip(corpus.note_ids, corpus.vectors):
+        for feature, weight in vector.items():
+            postings[feature].append((other_id, weight))
+    for note_id, vector, top in zip(queries.note_ids, queries.vectors, tops):
+        scores: Dict[int, float] = defaultdict(float)
+        for feature, weight in vector.items():
+            for other_id, other_weight in postings.get(feature, ()):
+                scores[other_id] += weight * other_weight
+        for other_id, score in scores.items():
+            if other_id != note_id and score >= RELATED_MIN_SCORE:
+                push_top(top, score, other_id)
+
+
+def recompute(
+    db: Session,
+    chunk_size: int = 5000,
+    cache_terms: int = RELATED_CACHE_TERMS,
+    progress: Callable[[str], None] = lambda _: None
+) -> dict:
+    """Rebuild the IDF snapshot, every note vector and every neighbour list, a chunk at a time"""
+    idf = Idf()
+    for notes in note_chunks(db, chunk_size):
+        for note in notes:
+            for feature in term_counts(note_text(note)):
+                idf.frequencies[feature] += 1
+        idf.document_count += len(notes)
+        progress(f"document frequencies: {idf.document_count} notes")
+    save_idf(db, idf)
+    db.commit()
+
+    chunks: List[Tuple[int, int]] = []  # (first id, last id)
+    vectorized = 0
+    for notes in note_chunks(db, chunk_size):
+        db.query(NoteTerm).filter(
+            NoteTerm.note_id >= notes[0].id, NoteTerm.note_id <= notes[-1].id
+        ).delete(synchronize_session=False)
+        rows = [
+            {"note_id": note.id, "feature": feature, "weight": weight}
+            for note in notes
+            for feature, weight in idf.vector(term_counts(note_text(note))).items()
+        ]
+        if rows:
+            db.execute(NoteTerm.__table__.insert(), rows)
+        db.commit()
+        chunks.append((notes[0].id, notes[-1].id))
+        vectorized += len(notes)
+        progress(f"vectors: {vectorized} notes")
+
+    use_numpy = numpy_available()
+    cache = BlockCache(db, cache_terms, use_numpy)
+    written = 0
+    for query_chunk in chunks:
+        queries = cache.get(query_chunk)
+        tops: List[List[Tuple[float, int]]] = [[] for _ in queries.note_ids]
+        for corpus_chunk in chunks:
+            corpus = cache.get(corpus_chunk)
+            if use_numpy:
+                score_block_numpy(queries, corpus, tops)
+            else:
+                score_block_python(queries, corpus, tops)
+        db.query(RelatedNote).filter(
+            RelatedNote.note_id >= query_chunk[0], RelatedNote.note_id <= query_chunk[1]
+        ).delete(synchronize_session=False)
+        rows = [
+            {"note_id": note_id, "related_id": related_id, "score": score}
+            for note_id, top in zip(queries.note_ids, tops)
+            for score, related_id in top
+        ]
+        if rows:
+            db.execute(RelatedNote.__table__.insert(), rows)
+        db.commit()
+        written += len(queries.note_ids)
+        progress(f"neighbours: {written} notes")
+    return {"notes": idf.document_count, "chunks": len(chunks), "backend": "numpy" if use_numpy else "python"}
@@ -0,0 +1,172 @@
+"""
+Note revision history with delta-compressed storage
+
+Revision 1 is a note's original text; each edit adds the next revision.
+Most revisions store only a zlib-compressed line delta against the previous
+one. Every SNAPSHOT_INTERVAL revisions (or whenever a delta wouldn't be
+smaller) the full text is stored instead, so rebuilding any revision applies
+at most SNAPSHOT_INTERVAL - 1 deltas on top of a snapshot.
+"""
+import os
+import json
+import zlib
+import difflib
+from typing import List, Optional, Tuple
+
+from sqlalchemy import func
+from sqlalchemy.orm import Session, defer
+
+from .models import StudyNote, NoteRevision
+
+SNAPSHOT_INTERVAL = int(os.getenv("WCAH_REVISION_SNAPSHOT_INTERVAL", "10"))
+
+
+def encode_delta(old: str, new: str) -> bytes:
+    """
+    Describe new as a list of ops over old's lines: [start, end] copies
+    old lines start:end, and a string inserts that text
+    """
+    old_lines = old.splitlines(keepends=True)
+    new_lines = new.splitlines(keepends=True)
+    ops: list = []
+    matcher = difflib.SequenceMatcher(None, old_lines, new_lines, autojunk=False)
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        if tag == "equal":
+            ops.append([i1, i2])
+        elif j2 > j1:
+            ops.append("".join(new_lines[j1:j2]))
+    return zlib.compress(json.dumps(ops, separators=(",", ":")).encode())
+
+
+def apply_delta(old: str, delta: bytes) -> str:
+    """Rebuild the newer text from the older text and an encoded delta"""
+    old_lines = old.splitlines(keepends=True)
+    parts = []
+    for op in json.loads(zlib.decompress(delta)):
+        if isinstance(op, str):
+            parts.append(op)
+        else:
+            parts.extend(old_lines[op[0]:op[1]])
+    return "".join(parts)
+
+
+def encode_snapshot(content: str) -> bytes:
+    return zlib.compress(content.encode())
+
+
+def decode_snapshot(data: bytes) -> str:
+    return zlib.decompress(data).decode()
+
+
+def latest_revision_number(db: Session, note_id: int) -> int:
+    return db.query(func.max(NoteRevision.revision)).filter(NoteRevision.note_id == note_id).scalar() or 0
+
+
+def record_revision(db: Session, note: StudyNote, previous: dict, editor_id: int):
+    """
+    Store the note's current fields as a new revision (call after applying the edit,
+    in the same transaction). The first edit also stores the original as revision 1,
+    from `previous`: the note's content, title, summary and note_type before the edit.
+    """
+    previous_content = previous["content"]
+    latest = latest_revision_number(db, note.id)
+    if latest == 0:
+        db.add(NoteRevision(
+            note_id=note.id,
+            revision=1,
+            is_snapshot=True,
+            data=encode_snapshot(previous_content),
+            content_size=len(previous_content),
+            title=previous["title"],
+            summary=previous["summary"],
+            note_type=previous["note_type"],
+            editor_id=note.author_id,
+            created_at=note.created_at,
+        ))
+        latest = 1
+
+    revision = latest + 1
+    snapshot = encode_snapshot(note.content)
+    delta = None
+    if (revision - 1) % SNAPSHOT_INTERVAL != 0:
+        delta = encode_delta(previous_content, note.content)
+        if len(delta) >= len(snapshot):
+            delta = None
+
+    db.add(NoteRevision(
+        note_id=note.id,
+        revision=revision,
+        is_snapshot=delta is None,
+        data=snapshot if delta is None else delta,
+        content_size=len(note.content),
+        title=note.title,
+        summary=note.summary,
+        note_type=note.note_type,
+        editor_id=editor_id,
+    ))
+    return revision
+
+
+def original_revision(note: StudyNote) -> NoteRevision:
+    """Unsaved revision 1 for a note that has never been edited"""
+    return NoteRevision(
+        note_id=note.id,
+        revision=1,
+        is_snapshot=True,
+        content_size=len(note.content),
+        title=note.title,
+        summary=note.summary,
+        note_type=note.note_type,
+        editor_id=note.author_id,
+        created_at=note.created_at,
+    )
+
+
+def list_revisions(db: Session, note: StudyNote) -> List[NoteRevision]:
+    """Revision metadata, newest first (the stored data is not loaded)"""
+    revisions = db.query(NoteRevision).options(defer(NoteRevision.data)).filter(
+        NoteRevision.note_id == note.id
+    ).order_by(NoteRevision.revision.desc()).all()
+    return revisions or [original_revision(note)]
+
+
+def get_revision(db: Session, note: StudyNote, revision: int) -> Optional[Tuple[NoteRevision, str]]:
+    """Return (revision row, full content), or None if the note has no such revision"""
+    latest = latest_revision_number(db, note.id)
+    if latest == 0:
+        return (original_revision(note), note.content) if revision == 1 else None
+    if revision < 1 or revision > latest:
+        return None
+
+    if revision == latest:
+        # The note row already holds the newest content
+        row = db.query(NoteRevision).options(defer(NoteRevision.data)).filter(
+            NoteRevision.note_id == note.id,
+            NoteRevision.revision == revision,
+        ).one()
+        return row, note.content
+
+    # The nearest snapshot at or before the revision, then the deltas after it
+    rows = db.query(NoteRevision).filter(
+        NoteRevision.note_id == note.id,
+        NoteRevision.revision <= revision,
+        NoteRevision.revision >= db.query(func.max(NoteRevision.revision)).filter(
+            NoteRevision.note_id == note.id,
+            NoteRevision.revision <= revision,
+            NoteRevision.is_snapshot.is_(True),
+        ).scalar_subquery(),
+    ).order_by(NoteRevision.revision).all()
+    content = ""
+    for row in rows:
+        content = decode_snapshot(row.data) if row.is_snapshot else apply_delta(content, row.data)
+    return rows[-1], content
+
+
+def diff_revisions(old_content: str, new_content: str, old_label: str, new_label: str) -> str:
+    """Unified diff between two revisions' content"""
+    return "".join(difflib.unified_diff(
+        old_content.splitlines(keepends=True),
+        new_content.splitlines(keepends=True),
+        fromfile=old_label,
+        tofile=new_label,
+    ))
@@ -0,0 +1,167 @@
+"""
+Token revocation
+
+Logging out revokes the login session: a row in revoked_sessions, which
+every access and refresh token issued from that login refers to by its
+"sid" claim. Each worker mirrors the table in a Bloom filter, so checking a
+token costs a few hashes and no query. Only a filter hit (a revoked session,
+or a rare false positive) is confirmed against the database. New rows are
+pulled in by a background loop every WCAH_REVOCATION_SYNC_SECONDS; sessions
+revoked in this worker are added to its filter immediately.
+
+Refresh tokens rotate: exchanging one records its jti in
+used_refresh_tokens, and presenting a used one again revokes its session,
+since either the client or whoever copied the token is replaying it.
+"""
+import os
+import math
+import asyncio
+import hashlib
+import logging
+import threading
+from datetime import datetime, timedelta
+
+from sqlalchemy import func, insert
+from sqlalchemy.orm import Session
+
+from .database import SessionLocal
+from .models import RevokedSession, UsedRefreshToken
+
+REVOCATION_SYNC_SECONDS = float(os.getenv("WCAH_REVOCATION_SYNC_SECONDS", "5"))
+# Expected revoked sessions alive at once; the filter is rebuilt larger if exceeded
+REVOCATION_FILTER_CAPACITY = int(os.getenv("WCAH_REVOCATION_FILTER_CAPACITY", "100000"))
+REVOCATION_FALSE_POSITIVE_RATE = 0.001
+PURGE_INTERVAL_SECONDS = 3600
+
+logger = logging.getLogger(__name__)
+
+
+class BloomFilter:
+    """Fixed-size Bloom filter over strings using double hashing"""
+
+    def __init__(self, capacity: int, false_positive_rate: float = REVOCATION_FALSE_POSITIVE_RATE):
+        self.capacity = max(capacity, 1)
+        self.size = max(64, int(-self.capacity * math.log(false_positive_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.size / self.capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+
+    def _positions(self, key: str):
+        digest = hashlib.blake2b(key.encode(), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        return ((h1 + i * h2) % self.size for i in range(self.hashes))
+
+    def add(self, key: str):
+        for position in self._positions(key):
+            self.bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def __contains__(self, key: str) -> bool:
+        return all(self.bits[position >> 3] & (1 << (position & 7)) for position in self._positions(key))
+
+
+class RevocationList:
+    """Per-worker Bloom filter of revoked session ids, synced from revoked_sessions"""
+
+    def __init__(self):
+        self.filter = BloomFilter(REVOCATION_FILTER_CAPACITY)
+        self.version = 0  # Newest revoked_sessions id in the filter
+        self.lock = threading.Lock()
+
+    def is_revoked(self, session_id: str, db: Session) -> bool:
+        if session_id not in self.filter:
+            return False
+        # Hits are rare (revoked or a false positive), so confirming them is cheap overall
+        return db.query(
+            db.query(RevokedSession).filter(RevokedSession.session_id == session_id).exists()
+        ).scalar()
+
+    def revoke(self, db: Session, session_id: str, expires_at: datetime):
+        """Revoke a session (commits) and add it to this worker's filter right away"""
+        db.add(RevokedSession(session_id=session_id, expires_at=expires_at))
+        db.commit()
+        with self.lock:
+            self.filter.add(session_id)
+
+    def sync(self, db: Session):
+        """Add sessions revoked since the last sync, by any worker"""
+        rows = db.query(RevokedSession.id, RevokedSession.session_id).filter(
+            RevokedSession.id > self.version
+        ).order_by(RevokedSession.id).all()
+        if not rows:
+            return
+        with self.lock:
+            if self.filter.count + len(rows) > self.filter.capacity:
+                # Past capacity the false positive rate climbs; rebuild with room to grow
+                self._rebuild(db, self.filter.count * 2 + len(rows))
+                return
+            for row in rows:
+                self.filter.add(row.session_id)
+            self.version = rows[-1].id
+
+    def purge(self, db: Session):
+        """Delete sessions whose tokens have all expired and rebuild the filter without them"""
+        deleted = db.query(RevokedSession).filter(
+            RevokedSession.expires_at < datetime.utcnow()
+        ).delete(synchronize_session=False)
+        db.query(UsedRefreshToken).filter(
+            UsedRefreshToken.expires_at < datetime.utcnow()
+        ).delete(synchronize_session=False)
+        db.commit()
+        if deleted:
+            with self.lock:
+                self._rebuild(db, REVOCATION_FILTER_CAPACITY)
+
+    def _rebuild(self, db: Session, capacity: int):
+        live = db.query(func.count(RevokedSession.id)).scalar()
+        bloom = BloomFilter(max(capacity, live * 2))
+        version = 0
+        for row in db.query(RevokedSession.id, RevokedSession.session_id).yield_per(10000):
+            bloom.add(row.session_id)
+            version = max(version, row.id)
+        self.filter, self.version = bloom, version
+
+
+revocation_list = RevocationList()
+
+
+def use_refresh_token(db: Session, jti: str, session_id: str, expires_at: datetime) -> bool:
+    """Mark a refresh token as exchanged (commits); False if it already was"""
+    inserted = db.execute(
+        insert(UsedRefreshToken).prefix_with("OR IGNORE").values(
+            jti=jti, session_id=session_id, expires_at=expires_at
+        )
+    ).rowcount
+    db.commit()
+    return inserted == 1
+
+
+def run_revocation_sync(purge: bool = False):
+    """Also run once at startup, before the worker serves requests"""
+    db = SessionLocal()
+    try:
+        if purge:
+            revocation_list.purge(db)
+        revocation_list.sync(db)
+    finally:
+        db.close()
+
+
+async def revocation_sync_loop():
+    """Periodic sync task started from main.lifespan"""
+    loop = asyncio.get_running_loop()
+    purge_every = max(1, int(PURGE_INTERVAL_SECONDS / REVOCATION_SYNC_SECONDS))
+    runs = 0
+    while True:
+        await asyncio.sleep(REVOCATION_SYNC_SECONDS)
+        runs += 1
+        try:
+            await loop.run_in_executor(None, run_revocation_sync, runs % purge_every == 0)
+        except Exception:
+            logger.exception("Revocation sync failed")
+
+
+def session_expiry(refresh_lifetime: timedelta) -> datetime:
+    """Upper bound on when any token of a session revoked now expires"""
+    return datetime.utcnow() + refresh_lifetime
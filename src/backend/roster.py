@@ -0,0 +1,171 @@
+"""
+Bulk roster enrollment
+
+A roster is a list of usernames or email addresses, as CSV (one student per
+row, optionally with a username/email header) or JSON. CSV bodies are parsed
+as they stream in. Rows are resolved and enrolled in batches: one IN query
+for the users, one IN query for existing enrollments, and one multi-row
+INSERT per batch, all in a single transaction. Every row gets a status in
+the report.
+"""
+import io
+import os
+import csv
+import json
+import codecs
+from typing import AsyncIterator, Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import insert, or_
+from sqlalchemy.orm import Session
+
+from .models import User, user_courses
+
+ROSTER_MAX_ROWS = int(os.getenv("WCAH_ROSTER_MAX_ROWS", "20000"))
+ROSTER_MAX_BYTES = int(os.getenv("WCAH_ROSTER_MAX_BYTES", str(5 * 1024 * 1024)))
+# Two bound parameters per inserted row; stays under SQLite's 999-variable limit
+BATCH_SIZE = 400
+HEADER_NAMES = {"username", "email", "user", "student", "identifier"}
+
+
+class RosterTooLarge(Exception):
+    pass
+
+
+class RosterFormatError(Exception):
+    pass
+
+
+async def read_limited(chunks: AsyncIterator[bytes], limit: int = ROSTER_MAX_BYTES) -> AsyncIterator[bytes]:
+    total = 0
+    async for chunk in chunks:
+        total += len(chunk)
+        if total > limit:
+            raise RosterTooLarge(f"Rosters are limited to {limit} bytes")
+        yield chunk
+
+
+async def csv_identifiers(chunks: AsyncIterator[bytes]) -> AsyncIterator[str]:
+    """Yield the identifier column of each CSV row, parsing complete lines as they arrive"""
+    decoder = codecs.getincrementaldecoder("utf-8-sig")(errors="replace")
+    pending = ""
+    column: Optional[int] = None  # Decided by the first row: a header names it, otherwise column 0
+
+    def identifiers(text: str) -> Iterable[str]:
+        nonlocal column
+        for row in csv.reader(io.StringIO(text)):
+            if not row:
+                continue
+            if column is None:
+                header = [cell.strip().lower() for cell in row]
+                column = next((i for i, cell in enumerate(header) if cell in HEADER_NAMES), None)
+                if column is not None:
+                    continue
+                column = 0
+            yield row[column].strip() if column < len(row) else ""
+
+    async for chunk in chunks:
+        pending += decoder.decode(chunk)
+        complete, _, pending = pending.rpartition("\n")
+        for identifier in identifiers(complete):
+            yield identifier
+    pending += decoder.decode(b"", final=True)
+    for identifier in identifiers(pending):
+        yield identifier
+
+
+def json_identifiers(body: bytes) -> List[str]:
+    """Accept ["alice", "bob@uwaterloo.ca"], [{"username": ...} | {"email": ...}] or {"students": [...]}"""
+    try:
+        data = json.loads(body or b"null")
+    except ValueError:
+        raise RosterFormatError("Roster is not valid JSON")
+    if isinstance(data, dict):
+        data = data.get("students")
+    if not isinstance(data, list):
+        raise RosterFormatError('Expected a JSON list of students or {"students": [...]}')
+    identifiers = []
+    for item in data:
+        if isinstance(item, dict):
+            item = item.get("username") or item.get("email") or ""
+        identifiers.append(str(item).strip())
+    return identifiers
+
+
+class RosterEnrollment:
+    """Accumulates roster rows and enrolls them a batch at a time"""
+
+    def __init__(self, db: Session, course_id: int):
+        self.db = db
+        self.course_id = course_id
+        self.rows: List[dict] = []
+        self.batch: List[Tuple[int, str]] = []  # (row number, identifier)
+        self.seen_user_ids = set()
+        self.enrolled_user_ids: List[int] = []
+
+    def add(self, identifier: str):
+        if len(self.rows) + len(self.batch) >= ROSTER_MAX_ROWS:
+            raise RosterTooLarge(f"Rosters are limited to {ROSTER_MAX_ROWS} rows")
+        self.batch.append((len(self.rows) + len(self.batch) + 1, identifier))
+        if len(self.batch) >= BATCH_SIZE:
+            self.flush()
+
+    def flush(self):
+        batch, self.batch = self.batch, []
+        if not batch:
+            return
+        names = {identifier for _, identifier in batch if identifier and "@" not in identifier}
+        emails = {identifier for _, identifier in batch if "@" in identifier}
+        conditions = []
+        if names:
+            conditions.append(User.username.in_(names))
+        if emails:
+            conditions.append(User.email.in_(emails))
+        by_name: Dict[str, tuple] = {}
+        by_email: Dict[str, tuple] = {}
+        if conditions:
+            for user in self.db.query(User.id, User.username, User.email, User.identity).filter(or_(*conditions)):
+                by_name[user.username] = user
+                by_email[user.email] = user
+
+        candidates = {user.id for user in by_name.values()} | {user.id for user in by_email.values()}
+        already = {
+            row.user_id for row in self.db.query(user_courses.c.user_id).filter(
+                user_courses.c.course_id == self.course_id,
+                user_courses.c.user_id.in_(candidates)
+            )
+        } if candidates else set()
+
+        new_rows = []
+        for row_number, identifier in batch:
+            user = (by_email if "@" in identifier else by_name).get(identifier)
+            if not identifier:
+                status = "invalid"
+            elif user is None:
+                status = "not_found"
+            elif user.id in self.seen_user_ids:
+                status = "duplicate"
+            elif user.identity != "student":
+                status = "not_a_student"
+            elif user.id in already:
+                status = "already_enrolled"
+            else:
+                status = "enrolled"
+                new_rows.append({"user_id": user.id, "course_id": self.course_id})
+            if user is not None:
+                self.seen_user_ids.add(user.id)
+            self.rows.append({
+                "row": row_number,
+                "identifier": identifier,
+                "status": status,
+                "user_id": user.id if user is not None else None,
+            })
+        if new_rows:
+            # One multi-row INSERT ... VALUES (...), (...) for the whole batch
+            self.db.execute(insert(user_courses).values(new_rows))
+            self.enrolled_user_ids.extend(row["user_id"] for row in new_rows)
+
+    def report(self) -> dict:
+        counts: Dict[str, int] = {}
+        for row in self.rows:
+            counts[row["status"]] = counts.get(row["status"], 0) + 1
+        return {"course_id": self.course_id, "total": len(self.rows), "counts": counts, "rows": self.rows}
@@ -0,0 +1,174 @@
+"""
+Operational routes for professors: diagnostics and maintenance
+"""
+import time
+from typing import List, Optional
+
+from fastapi import APIRouter, Depends, HTTPException, Query, status
+from fastapi.responses import FileResponse
+from sqlalchemy.orm import Session
+
+from ..database import get_db
+from ..models import User, Job
+from ..schemas import (
+    SlowQueryLogResponse, ProfilerStatusResponse, ProfileFileResponse, ProfileSignatureResponse, LoopLagResponse,
+    JobQueueResponse, JobResponse
+)
+from ..auth import get_current_professor
+from ..querylog import slow_query_log, SLOW_QUERY_MS
+from ..profiling import (
+    sampling_profiler, list_profiles, profile_path, sign_profile_request,
+    PROFILE_SECRET, SAMPLE_INTERVAL_MS, SAMPLE_MAX_SECONDS
+)
+from ..watchdog import loop_watchdog
+from ..jobs import job_runner, job_to_dict, retry_job
+
+router = APIRouter()
+
+
+@router.get("/slow-queries", response_model=SlowQueryLogResponse)
+async def get_slow_queries(
+    limit: int = Query(50, ge=1, le=1000),
+    current_user: User = Depends(get_current_professor)
+):
+    """
+    Most recent statements slower than the threshold, newest first, with their query plans
+    """
+    return {"threshold_ms": SLOW_QUERY_MS, "queries": slow_query_log.recent(limit)}
+
+
+@router.delete("/slow-queries", status_code=status.HTTP_204_NO_CONTENT)
+async def clear_slow_queries(current_user: User = Depends(get_current_professor)):
+    """
+    Empty the slow query buffer (e.g. before reproducing a problem)
+    """
+    slow_query_log.clear()
+    return None
+
+
+@router.get("/profiler", response_model=ProfilerStatusResponse)
+async def get_profiler_status(current_user: User = Depends(get_current_professor)):
+    """
+    Whether the sampling profiler is running in this worker
+    """
+    return sampling_profiler.status()
+
+
+@router.post("/profiler/start", response_model=ProfilerStatusResponse)
+async def start_profiler(
+    interval_ms: float = Query(SAMPLE_INTERVAL_MS, ge=1, le=1000),
+    max_seconds: float = Query(SAMPLE_MAX_SECONDS, gt=0, le=3600),
+    current_user: User = Depends(get_current_professor)
+):
+    """
+    Start sampling every thread's stack; it stops itself after max_seconds
+    """
+    if not sampling_profiler.start(interval_ms, max_seconds):
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="Profiler is already running"
+        )
+    return sampling_profiler.status()
+
+
+@router.post("/profiler/stop", response_model=ProfileFileResponse)
+async def stop_profiler(current_user: User = Depends(get_current_professor)):
+    """
+    Stop sampling and save the collapsed stacks (flamegraph.pl / speedscope input)
+    """
+    result = sampling_profiler.stop()
+    if result is None:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="Profiler is not running"
+        )
+    return result
+
+
+@router.get("/profiles", response_model=List[ProfileFileResponse])
+async def get_profiles(current_user: User = Depends(get_current_professor)):
+    """
+    Saved sampling (.collapsed) and per-request cProfile (.prof) files, newest first
+    """
+    return list_profiles()
+
+
+@router.get("/profiles/{name}")
+async def download_profile(name: str, current_user: User = Depends(get_current_professor)):
+    """
+    Download a saved profile
+    """
+    path = profile_path(name)
+    if path is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Profile not found"
+        )
+    return FileResponse(path, filename=name, media_type="application/octet-stream")
+
+
+@router.post("/profiles/sign", response_model=ProfileSignatureResponse)
+async def sign_profile(
+    path: str = Query(..., description="Request path to profile, e.g. /api/courses/"),
+    ttl: int = Query(300, ge=1, le=86400),
+    current_user: User = Depends(get_current_professor)
+):
+    """
+    X-Profile header value that runs requests to `path` under cProfile until it expires
+    """
+    if not PROFILE_SECRET:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Per-request profiling is not enabled"
+        )
+    expires = int(time.time()) + ttl
+    return {"header": "X-Profile", "value": sign_profile_request(path, expires), "expires": expires}
+
+
+@router.get("/loop-lag", response_model=LoopLagResponse)
+async def get_loop_lag(
+    limit: int = Query(20, ge=1, le=1000),
+    current_user: User = Depends(get_current_professor)
+):
+    """
+    This worker's event loop lag histogram and recent stalls with the stack that blocked the loop
+    """
+    return loop_watchdog.snapshot(limit)
+
+
+@router.get("/jobs", response_model=JobQueueResponse)
+async def get_jobs(
+    job_status: Optional[str] = Query(None, alias="status", pattern="^(queued|running|done|failed)$"),
+    limit: int = Query(50, ge=1, le=1000),
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_professor)
+):
+    """
+    Background job counts per type and status, and the most recent jobs
+    """
+    return job_runner.status(db, limit, job_status)
+
+
+@router.post("/jobs/{job_id}/retry", response_model=JobResponse)
+async def retry_failed_job(
+    job_id: int,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_professor)
+):
+    """
+    Queue a failed job again
+    """
+    job = db.query(Job).filter(Job.id == job_id).first()
+    if not job:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Job not found"
+        )
+    if job.status != "failed":
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="Only failed jobs can be retried"
+        )
+    retry_job(db, job)
+    job_runner.notify()
+    return job_to_dict(job)
@@ -0,0 +1,260 @@
+"""
+Note attachment routes (PDFs and images, stored in the blob store)
+"""
+import os
+from urllib.parse import quote
+from typing import List, Optional, Tuple
+
+import anyio
+from fastapi import APIRouter, Depends, File, HTTPException, Request, UploadFile, status
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import Response
+from sqlalchemy.orm import Session
+from starlette.types import Receive, Scope, Send
+
+from ..database import get_db
+from ..models import User, NoteAttachment
+from ..schemas import AttachmentResponse
+from ..auth import get_current_user
+from ..blobstore import blob_store, BlobTooLarge
+from ..access import access_control
+from .notes import get_note_or_404
+
+router = APIRouter()
+
+MAX_ATTACHMENT_BYTES = int(os.getenv("WCAH_ATTACHMENT_MAX_BYTES", str(25 * 1024 * 1024)))
+# When set (e.g. "/protected-blobs/"), downloads are handed to nginx with X-Accel-Redirect
+ACCEL_REDIRECT_PREFIX = os.getenv("WCAH_BLOB_ACCEL_REDIRECT", "")
+# Leading bytes of each accepted format; the stored type comes from these, never from the client
+FILE_SIGNATURES = (
+    (b"%PDF-", "application/pdf"),
+    (b"\x89PNG\r\n\x1a\n", "image/png"),
+    (b"\xff\xd8\xff", "image/jpeg"),
+    (b"GIF87a", "image/gif"),
+    (b"GIF89a", "image/gif"),
+)
+# Raster images are safe to render from the API origin; anything else is downloaded
+INLINE_CONTENT_TYPES = {"image/png", "image/jpeg", "image/gif", "image/webp"}
+SERVED_CONTENT_TYPES = INLINE_CONTENT_TYPES | {"application/pdf"}
+
+
+def sniff_content_type(head: bytes) -> Optional[str]:
+    """The attachment type from its first bytes, or None if it isn't an accepted format"""
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return "image/webp"
+    for signature, content_type in FILE_SIGNATURES:
+        if head.startswith(signature):
+            return content_type
+    return None
+
+
+def parse_range(header: Optional[str], size: int) -> Optional[Tuple[int, int]]:
+    """
+    Parse a single "bytes=start-end" range into an inclusive (start, end).
+    Returns None to send the whole file; raises ValueError if unsatisfiable.
+    """
+    if not header or not header.startswith("bytes=") or "," in header:
+        return None
+    start_text, _, end_text = header[len("bytes="):].strip().partition("-")
+    try:
+        if start_text:
+            start = int(start_text)
+            end = int(end_text) if end_text else size - 1
+        else:
+            # "bytes=-500" is the last 500 bytes
+            start = max(size - int(end_text), 0)
+            end = size - 1
+    except ValueError:
+        return None
+    if start >= size or start > end:
+        raise ValueError("Range not satisfiable")
+    return start, min(end, size - 1)
+
+
+class BlobResponse(Response):
+    """
+    Sends a blob file, or one byte range of it. Uses the ASGI zero-copy send
+    extension when the server offers it, and chunked reads otherwise.
+    """
+    chunk_size = 64 * 1024
+
+    def __init__(self, path: str, size: int, byte_range: Optional[Tuple[int, int]], headers: dict, media_type: str):
+        self.path = path
+        self.start, self.end = byte_range or (0, size - 1)
+        super().__init__(
+            status_code=status.HTTP_206_PARTIAL_CONTENT if byte_range else status.HTTP_200_OK,
+            headers=headers,
+            media_type=media_type,
+        )
+        self.headers["content-length"] = str(self.end - self.start + 1)
+        if byte_range:
+            self.headers["content-range"] = f"bytes {self.start}-{self.end}/{size}"
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        await send({"type": "http.response.start", "status": self.status_code, "headers": self.raw_headers})
+        remaining = self.end - self.start + 1
+        if scope["method"] == "HEAD" or remaining <= 0:
+            await send({"type": "http.response.body", "body": b"", "more_body": False})
+            return
+
+        with open(self.path, "rb") as file:
+            if "http.response.zerocopysend" in scope.get("extensions", {}):
+                await send({
+                    "type": "http.response.zerocopysend",
+                    "file": file,
+                    "offset": self.start,
+                    "count": remaining,
+                    "more_body": False,
+                })
+                return
+            file.seek(self.start)
+            while remaining > 0:
+                chunk = await anyio.to_thread.run_sync(file.read, min(self.chunk_size, remaining))
+                if not chunk:
+                    break
+                remaining -= len(chunk)
+                await send({"type": "http.response.body", "body": chunk, "more_body": remaining > 0})
+        if remaining > 0:
+            # File shrank underneath us; end the response rather than hang
+            await send({"type": "http.response.body", "body": b"", "more_body": False})
+
+
+def get_attachment_or_404(db: Session, note_id: int, attachment_id: int) -> NoteAttachment:
+    attachment = db.query(NoteAttachment).filter(
+        NoteAttachment.id == attachment_id,
+        NoteAttachment.note_id == note_id
+    ).first()
+    if not attachment:
+        raise HTTPException(status_code=404, detail="Attachment not found")
+    return attachment
+
+
+@router.post("/{note_id}/attachments", response_model=AttachmentResponse, status_code=status.HTTP_201_CREATED)
+async def upload_attachment(
+    note_id: int,
+    file: UploadFile = File(...),
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """
+    Attach a PDF or image to a note (author or professor)
+    """
+    note = get_note_or_404(db, note_id, current_user)
+    if current_user.id != note.author_id and current_user.identity != 'professor':
+        raise HTTPException(status_code=403, detail="Not authorized")
+
+    content_type = sniff_content_type(await file.read(16))
+    await file.seek(0)
+    if content_type is None:
+        await file.close()
+        raise HTTPException(
+            status_code=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE,
+            detail="Only PDF, PNG, JPEG, GIF and WebP attachments are supported"
+        )
+
+    # python-multipart has already streamed the part to a spooled temp file; copy it
+    # into the blob store in chunks, hashing on the way
+    try:
+        digest, size = await run_in_threadpool(blob_store.put_file, file.file, MAX_ATTACHMENT_BYTES)
+    except BlobTooLarge:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=f"Attachments are limited to {MAX_ATTACHMENT_BYTES} bytes"
+        )
+    finally:
+        await file.close()
+
+    attachment = NoteAttachment(
+        note_id=note.id,
+        filename=os.path.basename(file.filename or "attachment")[:255],
+        content_type=content_type,
+        size=size,
+        sha256=digest,
+        uploader_id=current_user.id
+    )
+    db.add(attachment)
+    db.commit()
+    db.refresh(attachment)
+    return AttachmentResponse.from_orm(attachment)
+
+
+@router.get("/{note_id}/attachments", response_model=List[AttachmentResponse])
+async def list_attachments(
+    note_id: int,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """
+    List a note's attachments
+    """
+    get_note_or_404(db, note_id, current_user)
+    attachments = db.query(NoteAttachment).filter(
+        NoteAttachment.note_id == note_id
+    ).order_by(NoteAttachment.id).all()
+    return [AttachmentResponse.from_orm(attachment) for attachment in attachments]
+
+
+@router.get("/{note_id}/attachments/{attachment_id}")
+async def download_attachment(
+    note_id: int,
+    attachment_id: int,
+    request: Request,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """
+    Download an attachment; supports single byte ranges and conditional requests
+    """
+    attachment = get_attachment_or_404(db, note_id, attachment_id)
+    access_control.require_note(db, current_user, attachment.note)
+    path = blob_store.path(attachment.sha256)
+    if not path.is_file():
+        raise HTTPException(status_code=404, detail="Attachment data is missing")
+
+    etag = f'"{attachment.sha256}"'
+    # Rows from before uploads were sniffed may carry any client-supplied type
+    media_type = attachment.content_type if attachment.content_type in SERVED_CONTENT_TYPES else "application/octet-stream"
+    disposition = "inline" if media_type in INLINE_CONTENT_TYPES else "attachment"
+    headers = {
+        "x-content-type-options": "nosniff",
+        "accept-ranges": "bytes",
+        "etag": etag,
+        # An attachment id always refers to the same bytes
+        "cache-control": "private, max-age=31536000, immutable",
+        "content-disposition": f"{disposition}; filename*=utf-8''{quote(attachment.filename)}",
+    }
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+
+    if ACCEL_REDIRECT_PREFIX:
+        # nginx serves the file itself with sendfile, including ranges
+        relative = path.relative_to(blob_store.root).as_posix()
+        headers["x-accel-redirect"] = ACCEL_REDIRECT_PREFIX.rstrip("/") + "/" + relative
+        return Response(headers=headers, media_type=media_type)
+
+    try:
+        byte_range = parse_range(request.headers.get("range"), attachment.size)
+    except ValueError:
+        return Response(
+            status_code=status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE,
+            headers={"content-range": f"bytes */{attachment.size}"}
+        )
+    return BlobResponse(str(path), attachment.size, byte_range, headers, media_type)
+
+
+@router.delete("/{note_id}/attachments/{attachment_id}", status_code=status.HTTP_204_NO_CONTENT)
+async def delete_attachment(
+    note_id: int,
+    attachment_id: int,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """
+    Remove an attachment (author or professor). The blob is reclaimed by garbage collection.
+    """
+    attachment = get_attachment_or_404(db, note_id, attachment_id)
+    if current_user.id != attachment.note.author_id and current_user.identity != 'professor':
+        raise HTTPException(status_code=403, detail="Not authorized")
+    db.delete(attachment)
+    db.commit()
+    return None
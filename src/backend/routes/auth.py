@@ -1,13 +1,25 @@
 """
-Authentication routes: signup, login
+Authentication routes: signup, login, token refresh, logout
 """
-from fastapi import APIRouter, Depends, HTTPException, status
+from datetime import datetime
+from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException, status
+from fastapi.concurrency import run_in_threadpool
 from sqlalchemy.orm import Session
 
 from ..database import get_db
 from ..models import User
-from ..schemas import UserCreate, UserLogin, Token, UserResponse
-from ..auth import get_password_hash, verify_password, create_access_token, get_current_user
+from ..schemas import UserCreate, UserLogin, Token, UserResponse, RefreshRequest
+from ..auth import (
+    get_password_hash,
+    verify_password,
+    password_needs_update,
+    upgrade_password_hash,
+    create_token_pair,
+    decode_token,
+    revoke_session,
+    get_current_user,
+)
+from ..revocation import revocation_list, use_refresh_token
 
 router = APIRouter()
 
@@ -42,8 +54,8 @@ async def signup(user_data: UserCreate, db: Session = Depends(get_db)):
             detail="Email already registered"
         )
     
-    # Create new user
-    hashed_password = get_password_hash(user_data.password)
+    # Create new user (hash in the threadpool so the event loop stays free)
+    hashed_password = await run_in_threadpool(get_password_hash, user_data.password)
     new_user = User(
         username=user_data.username,
         email=user_data.email,
@@ -55,41 +67,92 @@ async def signup(user_data: UserCreate, db: Session = Depends(get_db)):
     db.commit()
     db.refresh(new_user)
     
-    # Create access token
-    access_token = create_access_token(data={"sub": new_user.username})
-    
+    # Create access and refresh tokens
     return {
-        "access_token": access_token,
-        "token_type": "bearer",
+        **create_token_pair(new_user.username),
         "user": UserResponse.from_orm(new_user)
     }
 
 
 @router.post("/login", response_model=Token)
-async def login(credentials: UserLogin, db: Session = Depends(get_db)):
+async def login(
+    credentials: UserLogin,
+    background_tasks: BackgroundTasks,
+    db: Session = Depends(get_db)
+):
     """
     Authenticate user and return JWT token
     """
     # Find user by username
     user = db.query(User).filter(User.username == credentials.username).first()
     
-    if not user or not verify_password(credentials.password, user.password_hash):
+    # Verify in the threadpool so concurrent logins spread across cores
+    if not user or not await run_in_threadpool(verify_password, credentials.password, user.password_hash):
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect username or password",
             headers={"WWW-Authenticate": "Bearer"},
         )
     
-    # Create access token
-    access_token = create_access_token(data={"sub": user.username})
+    # Upgrade outdated hashes after the response is sent
+    if password_needs_update(user.password_hash):
+        background_tasks.add_task(upgrade_password_hash, user.id, credentials.password)
+    
+    # Create access and refresh tokens
+    return {
+        **create_token_pair(user.username),
+        "user": UserResponse.from_orm(user)
+    }
+
+
+@router.post("/refresh", response_model=Token)
+async def refresh(request: RefreshRequest, db: Session = Depends(get_db)):
+    """
+    Exchange a refresh token for a new access and refresh token pair in the same session.
+    Each refresh token works once; reusing one signs the whole session out.
+    """
+    payload = decode_token(request.refresh_token, token_type="refresh")
+    user = None
+    if payload is not None and payload.get("jti") and not revocation_list.is_revoked(payload["sid"], db):
+        user = db.query(User).filter(User.username == payload["sub"]).first()
+    if user is None:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Invalid or expired refresh token",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    if not use_refresh_token(db, payload["jti"], payload["sid"], datetime.utcfromtimestamp(payload["exp"])):
+        # Replayed: the client or someone holding a copy already exchanged it
+        revoke_session(db, payload["sid"])
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Refresh token was already used; the session has been signed out",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
     
     return {
-        "access_token": access_token,
-        "token_type": "bearer",
+        **create_token_pair(user.username, payload["sid"]),
         "user": UserResponse.from_orm(user)
     }
 
 
+@router.post("/logout", status_code=status.HTTP_204_NO_CONTENT)
+async def logout(request: RefreshRequest, db: Session = Depends(get_db)):
+    """
+    Revoke the session: its refresh token and every access token issued from it stop working
+    """
+    # An expired refresh token still identifies the session, so logout always works
+    payload = decode_token(request.refresh_token, token_type="refresh", verify_exp=False)
+    if payload is None:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Invalid refresh token",
+        )
+    if not revocation_list.is_revoked(payload["sid"], db):
+        revoke_session(db, payload["sid"])
+    return None
+
+
 @router.get("/me", response_model=UserResponse)
 async def get_current_user_info(current_user: User = Depends(get_current_user)):
     """
@@ -1,18 +1,35 @@
 """
 Course management routes
 """
-from fastapi import APIRouter, Depends, HTTPException, status
+import asyncio
+from fastapi import APIRouter, Depends, File, HTTPException, Query, Request, UploadFile, status
+from fastapi.concurrency import run_in_threadpool
 from sqlalchemy.orm import Session
 from sqlalchemy import delete
-from typing import List
+from typing import List, Optional
 
 from ..database import get_db
-from ..models import User, Course, user_courses
-from ..schemas import CourseCreate, CourseResponse
+from ..models import User, Course, Topic, StudyNote, CourseActivity, NoteRanking, user_courses
+from ..schemas import (
+    CourseCreate, CourseResponse, CourseSuggestion, RosterReport, ImportReport, CourseViewsResponse
+)
 from ..auth import get_current_user, get_current_professor
+from ..search import course_index, record_course_change
+from ..access import access_control
+from ..events import broker
+from ..jobs import enqueue, job_handler, job_runner
+from ..viewstats import view_stats, merged_unique_viewers, forget_views
+from ..related import forget_related
+from ..importer import ArchiveError, ArchiveTooLarge, import_archive
+from ..roster import (
+    RosterEnrollment, RosterTooLarge, RosterFormatError, read_limited, csv_identifiers, json_identifiers
+)
 
 router = APIRouter()
 
+# Notes of a deleted course removed per transaction by the delete_topics job
+DELETE_BATCH_SIZE = 500
+
 
 @router.post("/", response_model=CourseResponse, status_code=status.HTTP_201_CREATED)
 async def create_course(
@@ -39,8 +56,11 @@ async def create_course(
     )
     
     db.add(new_course)
+    db.flush()
+    record_course_change(db, new_course.id)
     db.commit()
     db.refresh(new_course)
+    course_index.sync(db)
     
     return CourseResponse.from_orm(new_course)
 
@@ -66,6 +86,23 @@ async def list_courses(
     return result
 
 
+@router.get("/search", response_model=List[CourseSuggestion])
+async def search_courses(
+    q: str = Query(..., min_length=1, max_length=100),
+    limit: int = Query(10, ge=1, le=50),
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """
+    Autocomplete courses by code or name prefix, falling back to typo-tolerant matches
+    """
+    course_index.sync(db)
+    return [
+        CourseSuggestion(id=entry.id, course_code=entry.course_code, course_name=entry.course_name)
+        for entry in course_index.search(q, limit)
+    ]
+
+
 @router.get("/{course_id}", response_model=CourseResponse)
 async def get_course(
     course_id: int,
@@ -117,10 +154,134 @@ async def enroll_in_course(
     
     current_user.enrolled_courses.append(course)
     db.commit()
+    access_control.invalidate_user(current_user.id)
     
     return {"message": "Successfully enrolled in course"}
 
 
+@router.post("/{course_id}/roster", response_model=RosterReport)
+async def enroll_roster(
+    course_id: int,
+    request: Request,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_professor)
+):
+    """
+    Enroll a class at once (professor who created the course only). Send the roster as
+    text/csv (one username or email per row, optional header) or application/json
+    (a list, or {"students": [...]}).
+    Returns a status for every row.
+    """
+    course = db.query(Course.creator_id).filter(Course.id == course_id).first()
+    if not course:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Course not found"
+        )
+    if course.creator_id != current_user.id:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="You can only enroll students in your own courses"
+        )
+
+    enrollment = RosterEnrollment(db, course_id)
+    chunks = read_limited(request.stream())
+    try:
+        if request.headers.get("content-type", "").startswith("application/json"):
+            body = b"".join([chunk async for chunk in chunks])
+            for identifier in json_identifiers(body):
+                enrollment.add(identifier)
+        else:
+            async for identifier in csv_identifiers(chunks):
+                enrollment.add(identifier)
+        enrollment.flush()
+    except RosterTooLarge as exc:
+        db.rollback()
+        raise HTTPException(status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE, detail=str(exc))
+    except RosterFormatError as exc:
+        db.rollback()
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(exc))
+    db.commit()
+
+    for user_id in enrollment.enrolled_user_ids:
+        access_control.invalidate_user(user_id)
+    return enrollment.report()
+
+
+@router.post("/{course_id}/import", response_model=ImportReport)
+async def import_notes(
+    course_id: int,
+    file: UploadFile = File(...),
+    import_id: Optional[str] = Query(None, max_length=64),
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_professor)
+):
+    """
+    Import a zip or tar of Markdown files as notes (professor who created the course only).
+    Each file's directory is its topic; front matter may set title, summary and type.
+    Progress is published as "import_progress" events on the course:{course_id} channel,
+    tagged with import_id if one is given.
+    """
+    course = db.query(Course).filter(Course.id == course_id).first()
+    if not course:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Course not found"
+        )
+    if course.creator_id != current_user.id:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="You can only import notes into your own courses"
+        )
+
+    loop = asyncio.get_running_loop()
+    channels = [f"course:{course_id}"]
+
+    def progress(data: dict):
+        # Called from the import thread; the broker belongs to the event loop
+        loop.call_soon_threadsafe(broker.publish, channels, "import_progress", {"import_id": import_id, **data})
+
+    # The upload is already spooled to a temp file; the import reads it member by member
+    try:
+        report = await run_in_threadpool(import_archive, file.file, course_id, current_user.id, progress)
+    except ArchiveTooLarge as exc:
+        raise HTTPException(status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE, detail=str(exc))
+    except ArchiveError as exc:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(exc))
+    finally:
+        await file.close()
+    job_runner.notify()
+    return report
+
+
+@router.get("/{course_id}/views", response_model=CourseViewsResponse)
+async def get_course_views(
+    course_id: int,
+    topic_id: List[int] = Query(default=[]),
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_professor)
+):
+    """
+    Student views and distinct viewers for a course and each of its topics (professors only).
+    Pass topic_id (repeatable) to also count distinct viewers across just those topics.
+    Views reach these numbers within WCAH_VIEW_FLUSH_SECONDS.
+    """
+    if not db.query(Course.id).filter(Course.id == course_id).first():
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Course not found"
+        )
+    topics = db.query(Topic.id, Topic.title).filter(Topic.course_id == course_id).order_by(Topic.id).all()
+    topic_stats = view_stats(db, "topic", [topic.id for topic in topics])
+    selected = [topic.id for topic in topics if topic.id in set(topic_id)]
+    return CourseViewsResponse(
+        course_id=course_id,
+        **view_stats(db, "course", [course_id])[course_id],
+        topics=[{"topic_id": topic.id, "title": topic.title, **topic_stats[topic.id]} for topic in topics],
+        selected_unique_viewers=merged_unique_viewers(db, "topic", selected) if topic_id else None
+    )
+
+
 @router.put("/{course_id}", response_model=CourseResponse)
 async def update_course(
     course_id: int,
@@ -145,9 +306,11 @@ async def update_course(
     course.course_code = course_data.course_code
     course.course_name = course_data.course_name
     course.description = course_data.description
+    record_course_change(db, course.id)
     
     db.commit()
     db.refresh(course)
+    course_index.sync(db)
     
     return CourseResponse.from_orm(course)
 
@@ -173,9 +336,43 @@ async def delete_course(
     
     # Manually delete enrollments using raw SQL to avoid ORM issues
     db.execute(delete(user_courses).where(user_courses.c.course_id == course_id))
+    db.execute(delete(CourseActivity).where(CourseActivity.course_id == course_id))
     
-    # Now delete the course (cascade will handle topics and notes)
-    db.delete(course)
+    # Remove the course and its topics now; their notes are deleted by a background job.
+    # Until then the notes point at topics that no longer exist, so no read reaches them,
+    # and their rankings go now since those are keyed by the (reusable) course id.
+    topic_ids = [row.id for row in db.query(Topic.id).filter(Topic.course_id == course_id)]
+    db.execute(delete(NoteRanking).where(NoteRanking.course_id == course_id))
+    db.execute(delete(Topic).where(Topic.course_id == course_id))
+    db.execute(delete(Course).where(Course.id == course_id))
+    forget_views(db, "course", [course_id])
+    forget_views(db, "topic", topic_ids)
+    if topic_ids:
+        enqueue(db, "delete_topics", {"topic_ids": topic_ids})
+    record_course_change(db, course_id)
     db.commit()
+    job_runner.notify()
+    course_index.sync(db)
+    access_control.invalidate_course(course_id)
     
     return {"message": "Course deleted successfully"}
+
+
+@job_handler("delete_topics", concurrency=1)
+def delete_topics(db: Session, payload: dict):
+    """Delete the notes of a removed course's topics, a batch per transaction"""
+    for topic_id in payload["topic_ids"]:
+        while True:
+            notes = db.query(StudyNote).filter(StudyNote.topic_id == topic_id).limit(DELETE_BATCH_SIZE).all()
+            if not notes:
+                break
+            note_ids = [note.id for note in notes]
+            forget_views(db, "note", note_ids)
+            forget_related(db, note_ids)
+            for note in notes:
+                db.delete(note)
+            db.commit()
+        # Jobs queued before topics were deleted along with their course
+        db.execute(delete(Topic).where(Topic.id == topic_id))
+        db.commit()
+        access_control.invalidate_topic(topic_id)
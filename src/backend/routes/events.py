@@ -0,0 +1,127 @@
+"""
+Real-time update stream (Server-Sent Events)
+"""
+import asyncio
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, status
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
+from typing import List, Optional
+
+from ..database import SessionLocal
+from ..models import StudyNote, User
+from ..auth import (
+    get_user_from_token,
+    get_current_user,
+    create_stream_ticket,
+    decode_token,
+    oauth2_scheme,
+    STREAM_TICKET_SECONDS,
+)
+from ..access import access_control
+from ..revocation import revocation_list
+from ..events import broker, HEARTBEAT_SECONDS
+
+router = APIRouter()
+
+
+@router.post("/ticket")
+async def create_ticket(token: str = Depends(oauth2_scheme), current_user: User = Depends(get_current_user)):
+    """
+    Ticket for opening an event stream. EventSource can't set headers, so the
+    ticket goes in the URL instead of the access token: it expires in
+    WCAH_STREAM_TICKET_SECONDS and is accepted by nothing else.
+    """
+    session_id = decode_token(token)["sid"]
+    return {"ticket": create_stream_ticket(current_user.username, session_id), "expires_in": STREAM_TICKET_SECONDS}
+
+
+@router.get("/")
+async def stream_events(
+    request: Request,
+    note: List[int] = Query(default=[]),
+    topic: List[int] = Query(default=[]),
+    course: List[int] = Query(default=[]),
+    ticket: Optional[str] = Query(default=None),
+):
+    """
+    Subscribe to updates for notes, topics and courses as an SSE stream.
+    Authenticate with a bearer access token, or a ?ticket= from POST /api/events/ticket.
+    """
+    token, token_type = ticket, "stream"
+    if token is None:
+        scheme, _, token = request.headers.get("authorization", "").partition(" ")
+        token_type = "access"
+        if scheme.lower() != "bearer":
+            token = None
+
+    # Authenticate with a short-lived session; an open stream must not hold a pooled connection
+    db = SessionLocal()
+    try:
+        user = get_user_from_token(token, db, token_type) if token else None
+        if user is None:
+            raise HTTPException(
+                status_code=status.HTTP_401_UNAUTHORIZED,
+                detail="Could not validate credentials",
+                headers={"WWW-Authenticate": "Bearer"},
+            )
+        session_id = decode_token(token, token_type)["sid"]
+        # Only stream updates for content the user could read
+        for course_id in course:
+            access_control.require_course(db, user, course_id)
+        for topic_id in topic:
+            access_control.require_topic(db, user, topic_id)
+        for note_id in note:
+            topic_id = db.query(StudyNote.topic_id).filter(StudyNote.id == note_id).scalar()
+            if topic_id is None:
+                raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Note not found")
+            access_control.require_topic(db, user, topic_id)
+    finally:
+        db.close()
+
+    channels = [f"note:{i}" for i in note] + [f"topic:{i}" for i in topic] + [f"course:{i}" for i in course]
+    if not channels:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Subscribe to at least one note, topic or course"
+        )
+
+    subscription = broker.subscribe(channels)
+
+    def session_revoked() -> bool:
+        db = SessionLocal()
+        try:
+            return revocation_list.is_revoked(session_id, db)
+        finally:
+            db.close()
+
+    async def event_stream():
+        loop = asyncio.get_running_loop()
+        check_at = loop.time() + HEARTBEAT_SECONDS
+        try:
+            # Tell the client how long to wait before reconnecting
+            yield "retry: 3000\n\n"
+            while True:
+                message = await subscription.next(HEARTBEAT_SECONDS)
+                # The credentials were only checked on connect; end the stream once the
+                # session is signed out (a Bloom filter miss costs no query)
+                if loop.time() >= check_at:
+                    if await run_in_threadpool(session_revoked):
+                        break
+                    check_at = loop.time() + HEARTBEAT_SECONDS
+                if subscription.lagged:
+                    subscription.lagged = False
+                    yield "event: resync\ndata: {}\n\n"
+                if message is None:
+                    if await request.is_disconnected():
+                        break
+                    yield ": heartbeat\n\n"
+                    continue
+                yield f"data: {message}\n\n"
+        finally:
+            broker.unsubscribe(subscription)
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
@@ -0,0 +1,31 @@
+"""
+Personalized dashboard feed routes
+"""
+from fastapi import APIRouter, Depends, Query
+from sqlalchemy.orm import Session
+from typing import Optional
+
+from ..database import get_db
+from ..models import User, user_courses
+from ..schemas import FeedResponse
+from ..auth import get_current_user
+from ..feed import feed_cache
+
+router = APIRouter()
+
+
+@router.get("/", response_model=FeedResponse)
+async def get_feed(
+    limit: int = Query(20, ge=1, le=100),
+    before: Optional[int] = Query(None, description="Return items older than this feed item id"),
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """
+    Recent notes and comments across all of the current user's enrolled courses, newest first
+    """
+    course_ids = [
+        row.course_id
+        for row in db.query(user_courses.c.course_id).filter(user_courses.c.user_id == current_user.id)
+    ]
+    return feed_cache.get_feed(db, current_user.id, course_ids, limit=limit, before=before)
@@ -1,14 +1,30 @@
 """
 Study Note management routes
 """
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Query, Response, status
 from sqlalchemy.orm import Session
-from typing import List
+from sqlalchemy import insert, update
+from typing import List, Optional
 
 from ..database import get_db
-from ..models import User, StudyNote, Topic, Comment
-from ..schemas import StudyNoteCreate, StudyNoteResponse, CommentCreate, CommentResponse
-from ..auth import get_current_user
+from ..models import User, StudyNote, Topic, Comment, NoteFingerprint, NoteRanking, RelatedNote, user_note_likes
+from ..schemas import (
+    StudyNoteCreate, StudyNoteUpdate, StudyNoteResponse, CommentCreate, CommentResponse,
+    NoteRevisionResponse, NoteRevisionContentResponse, NoteDiffResponse, NoteViewsResponse, RelatedNoteResponse
+)
+from ..auth import get_current_user, get_current_professor
+from ..writebatch import run_write
+from ..events import broker, note_channels
+from ..feed import record_note_created, record_comment_added, record_note_deleted
+from ..revisions import record_revision, list_revisions, get_revision, diff_revisions, latest_revision_number
+from ..dedup import (
+    DUPLICATE_POLICY, compute_fingerprint, find_duplicate, index_note, reindex_note, forget_note, not_a_duplicate
+)
+from ..ranking import add_note_ranking, bump_hot_score, ranked_notes, LIKE_WEIGHT, COMMENT_WEIGHT
+from ..access import access_control
+from ..viewstats import record_view, view_stats, forget_views
+from ..jobs import enqueue, job_runner
+from ..related import forget_related
 
 router = APIRouter()
 
@@ -16,11 +32,13 @@ router = APIRouter()
 @router.post("/", response_model=StudyNoteResponse, status_code=status.HTTP_201_CREATED)
 async def create_note(
     note_data: StudyNoteCreate,
+    response: Response,
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user)
 ):
     """
-    Create a new study note
+    Create a new study note. Exact or near duplicates of a note in the same topic are
+    rejected or linked to the original, depending on WCAH_DUPLICATE_POLICY.
     """
     # Verify topic exists
     topic = db.query(Topic).filter(Topic.id == note_data.topic_id).first()
@@ -29,6 +47,18 @@ async def create_note(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Topic not found"
         )
+    access_control.require_course(db, current_user, topic.course_id)
+    
+    fingerprint = compute_fingerprint(note_data.content)
+    duplicate = None
+    if DUPLICATE_POLICY != "off":
+        duplicate = find_duplicate(db, topic.id, fingerprint)
+    if duplicate and DUPLICATE_POLICY == "reject":
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail=f"A matching note already exists in this topic (note {duplicate[0]})",
+            headers={"X-Duplicate-Of": str(duplicate[0])}
+        )
     
     new_note = StudyNote(
         topic_id=note_data.topic_id,
@@ -40,28 +70,90 @@ async def create_note(
     )
     
     db.add(new_note)
+    db.flush()
+    add_note_ranking(db, new_note.id, topic.id, topic.course_id)
+    record_note_created(db, new_note, topic.course_id)
+    index_note(db, new_note.id, topic.id, fingerprint, duplicate[0] if duplicate else None)
+    enqueue(db, "index_related_notes", {"note_ids": [new_note.id]})
     db.commit()
+    job_runner.notify()
     db.refresh(new_note)
     
-    return StudyNoteResponse.from_orm(new_note)
+    if duplicate:
+        response.headers["X-Duplicate-Of"] = str(duplicate[0])
+    note_response = StudyNoteResponse.from_orm(new_note)
+    broker.publish(
+        [f"topic:{topic.id}", f"course:{topic.course_id}"],
+        "note_created",
+        note_response.dict()
+    )
+    return note_response
 
 
 @router.get("/topic/{topic_id}", response_model=List[StudyNoteResponse])
 async def list_notes_by_topic(
     topic_id: int,
+    sort: str = Query("hot", pattern="^(hot|likes|new)$"),
+    limit: Optional[int] = Query(None, ge=1, le=100),
+    offset: int = Query(0, ge=0),
+    include_duplicates: bool = False,
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user)
 ):
     """
-    List all notes for a specific topic, sorted by likes
+    List notes for a specific topic, hottest first by default (or by likes / newest).
+    Notes linked as duplicates of another note are left out unless include_duplicates is set.
     """
-    notes = db.query(StudyNote).filter(
-        StudyNote.topic_id == topic_id
-    ).order_by(StudyNote.likes.desc()).all()
+    access_control.require_topic(db, current_user, topic_id)
+    where = None if include_duplicates else not_a_duplicate()
+    if sort == "hot":
+        notes = ranked_notes(db, topic_id=topic_id, limit=limit, offset=offset, where=where)
+    else:
+        order = StudyNote.likes.desc() if sort == "likes" else StudyNote.created_at.desc()
+        query = db.query(StudyNote).filter(
+            StudyNote.topic_id == topic_id
+        ).order_by(order, StudyNote.id.desc())
+        if where is not None:
+            query = query.filter(where)
+        if limit is not None:
+            query = query.limit(limit)
+        notes = query.offset(offset).all()
     
     return [StudyNoteResponse.from_orm(note) for note in notes]
 
 
+@router.get("/trending", response_model=List[StudyNoteResponse])
+async def list_trending_notes(
+    limit: int = Query(20, ge=1, le=100),
+    offset: int = Query(0, ge=0),
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """
+    List the hottest notes across all courses the user can see
+    """
+    course_ids = access_control.visible_course_ids(db, current_user)
+    where = None if course_ids is None else NoteRanking.course_id.in_(course_ids)
+    notes = ranked_notes(db, limit=limit, offset=offset, where=where)
+    return [StudyNoteResponse.from_orm(note) for note in notes]
+
+
+@router.get("/trending/course/{course_id}", response_model=List[StudyNoteResponse])
+async def list_trending_notes_by_course(
+    course_id: int,
+    limit: int = Query(20, ge=1, le=100),
+    offset: int = Query(0, ge=0),
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """
+    List the hottest notes in a course
+    """
+    access_control.require_course(db, current_user, course_id)
+    notes = ranked_notes(db, course_id=course_id, limit=limit, offset=offset)
+    return [StudyNoteResponse.from_orm(note) for note in notes]
+
+
 @router.get("/{note_id}", response_model=StudyNoteResponse)
 async def get_note(
     note_id: int,
@@ -77,10 +169,175 @@ async def get_note(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Study Note not found"
         )
+    course_id = access_control.require_note(db, current_user, note)
+    record_view(note.id, note.topic_id, course_id, current_user)
     
     return StudyNoteResponse.from_orm(note)
 
 
+@router.put("/{note_id}", response_model=StudyNoteResponse)
+async def update_note(
+    note_id: int,
+    note_data: StudyNoteUpdate,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """
+    Edit a note (author or professor), keeping the previous version in its revision history
+    """
+    note = db.query(StudyNote).filter(StudyNote.id == note_id).first()
+    if not note:
+        raise HTTPException(status_code=404, detail="Note not found")
+    # Also 404s a note whose course was deleted and is waiting for the delete_topics job
+    course_id = access_control.require_note(db, current_user, note)
+
+    if current_user.id != note.author_id and current_user.identity != 'professor':
+        raise HTTPException(status_code=403, detail="Not authorized")
+
+    previous = {
+        "content": note.content,
+        "title": note.title,
+        "summary": note.summary,
+        "note_type": note.note_type,
+    }
+    note.title = note_data.title
+    note.content = note_data.content
+    note.summary = note_data.summary
+    note.note_type = note_data.note_type
+    record_revision(db, note, previous, current_user.id)
+    reindex_note(db, note)
+    enqueue(db, "index_related_notes", {"note_ids": [note.id]})
+    db.commit()
+    job_runner.notify()
+    db.refresh(note)
+
+    response = StudyNoteResponse.from_orm(note)
+    broker.publish(
+        note_channels(note.id, note.topic_id, course_id),
+        "note_updated",
+        response.dict()
+    )
+    return response
+
+
+def get_note_or_404(db: Session, note_id: int, user: User) -> StudyNote:
+    """Load a note the user is allowed to see"""
+    note = db.query(StudyNote).filter(StudyNote.id == note_id).first()
+    if not note:
+        raise HTTPException(status_code=404, detail="Note not found")
+    access_control.require_note(db, user, note)
+    return note
+
+
+def get_revision_or_404(db: Session, note: StudyNote, revision: int):
+    found = get_revision(db, note, revision)
+    if found is None:
+        raise HTTPException(status_code=404, detail="Revision not found")
+    return found
+
+
+@router.get("/{note_id}/duplicates", response_model=List[StudyNoteResponse])
+async def list_duplicates(
+    note_id: int,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """
+    List notes that were linked to this note as duplicates
+    """
+    get_note_or_404(db, note_id, current_user)
+    duplicates = db.query(StudyNote).join(
+        NoteFingerprint, NoteFingerprint.note_id == StudyNote.id
+    ).filter(NoteFingerprint.duplicate_of == note_id).order_by(StudyNote.id).all()
+    return [StudyNoteResponse.from_orm(note) for note in duplicates]
+
+
+@router.get("/{note_id}/related", response_model=List[RelatedNoteResponse])
+async def list_related_notes(
+    note_id: int,
+    limit: int = Query(10, ge=1, le=50),
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """
+    Notes with similar content from any topic or course the user can see, most similar first
+    """
+    get_note_or_404(db, note_id, current_user)
+    # Joining the topic also skips notes of deleted courses that are still being removed
+    query = db.query(StudyNote, RelatedNote.score).join(
+        RelatedNote, RelatedNote.related_id == StudyNote.id
+    ).join(Topic, Topic.id == StudyNote.topic_id).filter(RelatedNote.note_id == note_id, not_a_duplicate())
+    course_ids = access_control.visible_course_ids(db, current_user)
+    if course_ids is not None:
+        query = query.filter(Topic.course_id.in_(course_ids))
+    rows = query.order_by(RelatedNote.score.desc()).limit(limit).all()
+    return [RelatedNoteResponse(**StudyNoteResponse.from_orm(note).dict(), score=score) for note, score in rows]
+
+
+@router.get("/{note_id}/views", response_model=NoteViewsResponse)
+async def get_note_views(
+    note_id: int,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_professor)
+):
+    """
+    How many times students viewed a note, and how many distinct students (professors only)
+    """
+    get_note_or_404(db, note_id, current_user)
+    return NoteViewsResponse(note_id=note_id, **view_stats(db, "note", [note_id])[note_id])
+
+
+@router.get("/{note_id}/revisions", response_model=List[NoteRevisionResponse])
+async def list_note_revisions(
+    note_id: int,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """
+    List a note's revisions, newest first
+    """
+    note = get_note_or_404(db, note_id, current_user)
+    return [NoteRevisionResponse.from_orm(revision) for revision in list_revisions(db, note)]
+
+
+@router.get("/{note_id}/revisions/{revision}", response_model=NoteRevisionContentResponse)
+async def get_note_revision(
+    note_id: int,
+    revision: int,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """
+    Get a note as it was at a given revision
+    """
+    note = get_note_or_404(db, note_id, current_user)
+    row, content = get_revision_or_404(db, note, revision)
+    return NoteRevisionContentResponse(**NoteRevisionResponse.from_orm(row).dict(), content=content)
+
+
+@router.get("/{note_id}/diff", response_model=NoteDiffResponse)
+async def diff_note_revisions(
+    note_id: int,
+    from_revision: int = Query(..., alias="from", ge=1),
+    to_revision: Optional[int] = Query(None, alias="to", ge=1),
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """
+    Unified diff of a note's content between two revisions (to defaults to the latest)
+    """
+    note = get_note_or_404(db, note_id, current_user)
+    if to_revision is None:
+        to_revision = latest_revision_number(db, note.id) or 1
+    _, old_content = get_revision_or_404(db, note, from_revision)
+    _, new_content = get_revision_or_404(db, note, to_revision)
+    return NoteDiffResponse(
+        from_revision=from_revision,
+        to_revision=to_revision,
+        diff=diff_revisions(old_content, new_content, f"revision {from_revision}", f"revision {to_revision}")
+    )
+
+
 @router.post("/{note_id}/like", status_code=status.HTTP_200_OK)
 async def like_note(
     note_id: int,
@@ -90,24 +347,46 @@ async def like_note(
     """
     Like a note (one like per user)
     """
-    note = db.query(StudyNote).filter(StudyNote.id == note_id).first()
-    if not note:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="Note not found"
-        )
-    
-    if current_user in note.liked_by_users:
-         raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail="You have already liked this note"
+    user_id = current_user.id
+
+    def apply_like(db: Session):
+        note_row = db.query(StudyNote.topic_id, Topic.course_id).join(
+            Topic, StudyNote.topic_id == Topic.id
+        ).filter(StudyNote.id == note_id).first()
+        if not note_row:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Note not found"
+            )
+        access_control.require_course(db, current_user, note_row.course_id)
+        
+        already_liked = db.query(user_note_likes).filter(
+            user_note_likes.c.note_id == note_id,
+            user_note_likes.c.user_id == user_id
+        ).first()
+        if already_liked:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="You have already liked this note"
+            )
+        
+        db.execute(insert(user_note_likes).values(user_id=user_id, note_id=note_id))
+        db.execute(
+            update(StudyNote)
+            .where(StudyNote.id == note_id)
+            .values(likes=StudyNote.likes + 1)
         )
-    
-    note.liked_by_users.append(current_user)
-    note.likes_count += 1
-    db.commit()
-    
-    return {"message": "Note liked successfully", "likes": note.likes_count}
+        bump_hot_score(db, note_id, LIKE_WEIGHT)
+        likes = db.query(StudyNote.likes).filter(StudyNote.id == note_id).scalar()
+        return likes, note_row.topic_id, note_row.course_id
+
+    likes, topic_id, course_id = await run_write(db, apply_like)
+    broker.publish(
+        note_channels(note_id, topic_id, course_id),
+        "note_liked",
+        {"note_id": note_id, "likes": likes}
+    )
+    return {"message": "Note liked successfully", "likes": likes}
 
 
 @router.post("/{note_id}/comments", response_model=CommentResponse)
@@ -120,24 +399,39 @@ async def add_comment(
     """
     Add a comment to a note
     """
-    note = db.query(StudyNote).filter(StudyNote.id == note_id).first()
-    if not note:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="Note not found"
+    user_id = current_user.id
+
+    def apply_comment(db: Session):
+        note_row = db.query(StudyNote.title, StudyNote.topic_id, Topic.course_id).join(
+            Topic, StudyNote.topic_id == Topic.id
+        ).filter(StudyNote.id == note_id).first()
+        if not note_row:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Note not found"
+            )
+        access_control.require_course(db, current_user, note_row.course_id)
+        
+        new_comment = Comment(
+            note_id=note_id,
+            user_id=user_id,
+            content=comment_data.content
         )
-    
-    new_comment = Comment(
-        note_id=note_id,
-        user_id=current_user.id,
-        content=comment_data.content
+        db.add(new_comment)
+        bump_hot_score(db, note_id, COMMENT_WEIGHT)
+        db.flush()
+        record_comment_added(db, new_comment, note_row.title, note_row.topic_id, note_row.course_id)
+        # Load server defaults (created_at) now, since the response is built before commit
+        db.refresh(new_comment)
+        return CommentResponse.from_orm(new_comment), note_row.topic_id, note_row.course_id
+
+    comment, topic_id, course_id = await run_write(db, apply_comment)
+    broker.publish(
+        note_channels(note_id, topic_id, course_id),
+        "comment_added",
+        comment.dict()
     )
-    
-    db.add(new_comment)
-    db.commit()
-    db.refresh(new_comment)
-    
-    return CommentResponse.from_orm(new_comment)
+    return comment
 
 @router.get("/{note_id}/comments", response_model=List[CommentResponse])
 async def get_comments(
@@ -145,10 +439,7 @@ async def get_comments(
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user)
 ):
-    note = db.query(StudyNote).filter(StudyNote.id == note_id).first()
-    if not note:
-        raise HTTPException(status_code=404, detail="Note not found")
-        
+    note = get_note_or_404(db, note_id, current_user)
     return [CommentResponse.from_orm(c) for c in note.comments]
 
 @router.delete("/{note_id}", status_code=status.HTTP_204_NO_CONTENT)
@@ -160,11 +451,19 @@ async def delete_note(
     note = db.query(StudyNote).filter(StudyNote.id == note_id).first()
     if not note:
         raise HTTPException(status_code=404, detail="Note not found")
+    # Also 404s a note whose course was deleted and is waiting for the delete_topics job
+    course_id = access_control.require_note(db, current_user, note)
         
     # Check permissions (author or professor)
     if current_user.id != note.author_id and current_user.identity != 'professor':
         raise HTTPException(status_code=403, detail="Not authorized")
         
+    channels = note_channels(note.id, note.topic_id, course_id)
+    record_note_deleted(db, note, course_id)
+    forget_note(db, note.id)
+    forget_views(db, "note", [note.id])
+    forget_related(db, [note.id])
     db.delete(note)
     db.commit()
+    broker.publish(channels, "note_deleted", {"note_id": note_id})
     return None
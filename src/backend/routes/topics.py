@@ -9,6 +9,10 @@ from ..database import get_db
 from ..models import User, Topic, Course
 from ..schemas import TopicCreate, TopicResponse
 from ..auth import get_current_user, get_current_professor
+from ..feed import record_note_deleted
+from ..access import access_control
+from ..viewstats import forget_views
+from ..related import forget_related
 
 router = APIRouter()
 
@@ -68,12 +72,7 @@ async def list_topics_by_course(
         )
     
     # Check if user has access (professor or enrolled student)
-    if current_user.identity == 'student':
-        if course not in current_user.enrolled_courses:
-            raise HTTPException(
-                status_code=status.HTTP_403_FORBIDDEN,
-                detail="You must be enrolled in this course to view topics"
-            )
+    access_control.require_course(db, current_user, course_id)
     
     topics = db.query(Topic).filter(Topic.course_id == course_id).all()
     return [TopicResponse.from_orm(topic) for topic in topics]
@@ -94,6 +93,7 @@ async def get_topic(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Topic not found"
         )
+    access_control.require_course(db, current_user, topic.course_id)
     
     return TopicResponse.from_orm(topic)
 
@@ -133,6 +133,13 @@ async def delete_topic(
     if not topic:
         raise HTTPException(status_code=404, detail="Topic not found")
         
+    # The cascade below removes the notes; take them out of the course feed too
+    for note in topic.notes:
+        record_note_deleted(db, note, topic.course_id)
+    forget_views(db, "note", [note.id for note in topic.notes])
+    forget_views(db, "topic", [topic_id])
+    forget_related(db, [note.id for note in topic.notes])
     db.delete(topic)
     db.commit()
+    access_control.invalidate_topic(topic_id)
     return None
@@ -2,7 +2,7 @@
 Pydantic schemas for request/response validation
 """
 from pydantic import BaseModel, EmailStr, Field
-from typing import Optional, List
+from typing import Optional, List, Union, Dict
 from datetime import datetime
 
 
@@ -32,10 +32,16 @@ class UserResponse(UserBase):
 
 class Token(BaseModel):
     access_token: str
+    refresh_token: str
     token_type: str
+    expires_in: int  # Access token lifetime in seconds
     user: UserResponse
 
 
+class RefreshRequest(BaseModel):
+    refresh_token: str
+
+
 # Course Schemas
 class CourseBase(BaseModel):
     course_code: str = Field(..., max_length=20)
@@ -57,6 +63,64 @@ class CourseResponse(CourseBase):
         from_attributes = True
 
 
+class CourseSuggestion(BaseModel):
+    id: int
+    course_code: str
+    course_name: str
+
+
+class RosterRowResult(BaseModel):
+    row: int  # 1-based, header excluded
+    identifier: str
+    # enrolled, already_enrolled, not_found, duplicate, not_a_student or invalid
+    status: str
+    user_id: Optional[int] = None
+
+
+class RosterReport(BaseModel):
+    course_id: int
+    total: int
+    counts: Dict[str, int]  # Rows per status
+    rows: List[RosterRowResult]
+
+
+class ImportFileResult(BaseModel):
+    path: str
+    status: str  # imported, skipped or error
+    note_id: Optional[int] = None
+    topic: Optional[str] = None
+    duplicate_of: Optional[int] = None
+    detail: Optional[str] = None
+
+
+class ImportReport(BaseModel):
+    course_id: int
+    counts: Dict[str, int]  # Files per status
+    created_topics: List[int]
+    files: List[ImportFileResult]
+
+
+class ViewStatsResponse(BaseModel):
+    views: int  # Student views flushed so far
+    unique_viewers: int  # HyperLogLog estimate (about 1.6% error)
+
+
+class NoteViewsResponse(ViewStatsResponse):
+    note_id: int
+
+
+class TopicViewsResponse(ViewStatsResponse):
+    topic_id: int
+    title: str
+
+
+class CourseViewsResponse(ViewStatsResponse):
+    course_id: int
+    topics: List[TopicViewsResponse]
+    # Distinct viewers across the topic_id filter, merged from the topic sketches
+    selected_unique_viewers: Optional[int] = None
+
+
 # Topic Schemas
 class TopicBase(BaseModel):
     title: str = Field(..., max_length=200)
@@ -96,6 +160,10 @@ class StudyNoteCreate(StudyNoteBase):
     topic_id: int
 
 
+class StudyNoteUpdate(StudyNoteBase):
+    pass
+
+
 class StudyNoteResponse(StudyNoteBase):
     id: int
     topic_id: int
@@ -107,6 +175,47 @@ class StudyNoteResponse(StudyNoteBase):
         from_attributes = True
 
 
+class RelatedNoteResponse(StudyNoteResponse):
+    score: float  # Cosine similarity of the notes' TF-IDF vectors, 0 to 1
+
+
+class NoteRevisionResponse(BaseModel):
+    revision: int
+    title: str
+    summary: Optional[str] = None
+    note_type: NoteType
+    editor_id: int
+    content_size: int
+    created_at: datetime
+
+    class Config:
+        from_attributes = True
+
+
+class NoteRevisionContentResponse(NoteRevisionResponse):
+    content: str
+
+
+class NoteDiffResponse(BaseModel):
+    from_revision: int
+    to_revision: int
+    diff: str  # Unified diff of the content
+
+
+class AttachmentResponse(BaseModel):
+    id: int
+    note_id: int
+    filename: str
+    content_type: str
+    size: int
+    sha256: str
+    uploader_id: int
+    created_at: datetime
+
+    class Config:
+        from_attributes = True
+
+
 # Comment Schemas
 class CommentBase(BaseModel):
     content: str
@@ -125,3 +234,117 @@ class CommentResponse(CommentBase):
     class Config:
         from_attributes = True
 
+
+# Feed Schemas
+class FeedItemResponse(BaseModel):
+    id: int
+    kind: str  # "note" or "comment"
+    course_id: int
+    topic_id: int
+    note_id: int
+    comment_id: Optional[int] = None
+    author_id: int
+    title: str
+    excerpt: Optional[str] = None
+    created_at: datetime
+
+
+class FeedResponse(BaseModel):
+    items: List[FeedItemResponse]
+    next_before: Optional[int] = None  # Pass as ?before= to get the next page
+
+
+# Admin Schemas
+class SlowQueryResponse(BaseModel):
+    at: float  # Unix time
+    duration_ms: float
+    statement: str
+    parameters: Optional[str] = None
+    request_id: Optional[str] = None
+    route: Optional[str] = None  # "METHOD /path" of the request that ran it
+    plan: Optional[List[str]] = None
+
+
+class SlowQueryLogResponse(BaseModel):
+    threshold_ms: float
+    queries: List[SlowQueryResponse]
+
+
+class ProfilerStatusResponse(BaseModel):
+    running: bool
+    started_at: Optional[float] = None
+    interval_ms: float
+    samples: int
+
+
+class ProfileFileResponse(BaseModel):
+    name: str
+    size: Optional[int] = None
+    modified: Optional[float] = None
+    samples: Optional[int] = None  # Set when a sampling run was just stopped
+    stacks: Optional[int] = None
+
+
+class ProfileSignatureResponse(BaseModel):
+    header: str
+    value: str
+    expires: int
+
+
+class LagBucketResponse(BaseModel):
+    le: Union[float, str]  # Upper bound in ms, or "+Inf"
+    count: int  # Observations at or below the bound
+
+
+class LagHistogramResponse(BaseModel):
+    buckets: List[LagBucketResponse]
+    count: int
+    sum_ms: float
+    max_ms: float
+
+
+class LoopStallResponse(BaseModel):
+    at: float  # Unix time the stall was captured
+    lag_ms: float
+    route: Optional[str] = None
+    request_id: Optional[str] = None
+    handler: Optional[str] = None  # e.g. "notes.get_note"
+    stack: List[str]  # Outermost frame first
+
+
+class LoopLagResponse(BaseModel):
+    interval_ms: float
+    threshold_ms: float
+    lag: LagHistogramResponse
+    stalls: List[LoopStallResponse]
+
+
+class JobResponse(BaseModel):
+    id: int
+    job_type: str
+    status: str  # queued, running, done or failed
+    priority: int
+    attempts: int
+    max_attempts: int
+    idempotency_key: Optional[str] = None
+    run_after: datetime
+    locked_by: Optional[str] = None
+    last_error: Optional[str] = None
+    created_at: datetime
+    finished_at: Optional[datetime] = None
+
+
+class JobTypeStatusResponse(BaseModel):
+    job_type: str
+    concurrency: Optional[int] = None  # None for types no handler is registered for
+    queued: int
+    running: int
+    done: int
+    failed: int
+
+
+class JobQueueResponse(BaseModel):
+    workers: int  # Live worker threads in this process
+    types: List[JobTypeStatusResponse]
+    oldest_queued_seconds: Optional[float] = None
+    recent: List[JobResponse]
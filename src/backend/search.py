@@ -0,0 +1,222 @@
+"""
+Course catalogue autocomplete
+
+Each worker keeps an in-memory index of course codes and names:
+  * a sorted list of (term, course id) for prefix lookups with bisect
+  * trigram postings for typo-tolerant matching when prefixes find too little
+Course writes append to course_changes in the same transaction; before each
+lookup the index applies any changes newer than the last one it saw (one
+indexed query), so every worker stays current without a full rebuild.
+"""
+import re
+import bisect
+import threading
+from collections import Counter
+from typing import Dict, List, NamedTuple, Optional, Set, Tuple
+
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+from .database import SessionLocal
+from .models import Course, CourseChange
+
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+")
+MIN_FUZZY_SCORE = 0.4
+MAX_QUERY_LENGTH = 100
+
+
+class CourseEntry(NamedTuple):
+    id: int
+    course_code: str
+    course_name: str
+    compact_code: str  # "CS 135" -> "cs135"
+    terms: Tuple[str, ...]
+    trigrams: frozenset
+
+
+def tokenize(text: str) -> List[str]:
+    return TOKEN_PATTERN.findall(text.lower())
+
+
+def compact(text: str) -> str:
+    return "".join(tokenize(text))
+
+
+def trigrams(term: str) -> Set[str]:
+    """Trigrams of a term, padded at the start so prefixes weigh more"""
+    padded = f"  {term}"
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def make_entry(course_id: int, course_code: str, course_name: str) -> CourseEntry:
+    compact_code = compact(course_code)
+    terms = tuple(dict.fromkeys([compact_code, *tokenize(course_code), *tokenize(course_name)]))
+    grams = set()
+    for term in terms:
+        grams |= trigrams(term)
+    return CourseEntry(course_id, course_code, course_name, compact_code, terms, frozenset(grams))
+
+
+class CourseIndex:
+    """Per-worker prefix and trigram index over course codes and names"""
+
+    def __init__(self):
+        self.entries: Dict[int, CourseEntry] = {}
+        self.codes: List[Tuple[str, int]] = []  # (compact code, id), sorted
+        self.terms: List[Tuple[str, int]] = []  # (term, id), sorted
+        self.postings: Dict[str, Set[int]] = {}
+        self.version: Optional[int] = None  # Newest course_changes id applied
+        self.max_course_id = 0
+        self.lock = threading.Lock()
+
+    def add(self, entry: CourseEntry):
+        self.entries[entry.id] = entry
+        bisect.insort(self.codes, (entry.compact_code, entry.id))
+        for term in entry.terms:
+            bisect.insort(self.terms, (term, entry.id))
+        for gram in entry.trigrams:
+            self.postings.setdefault(gram, set()).add(entry.id)
+
+    def remove(self, course_id: int):
+        entry = self.entries.pop(course_id, None)
+        if entry is None:
+            return
+        self._discard(self.codes, (entry.compact_code, entry.id))
+        for term in entry.terms:
+            self._discard(self.terms, (term, entry.id))
+        for gram in entry.trigrams:
+            ids = self.postings.get(gram)
+            if ids is not None:
+                ids.discard(entry.id)
+                if not ids:
+                    del self.postings[gram]
+
+    @staticmethod
+    def _discard(items: List[Tuple[str, int]], item: Tuple[str, int]):
+        position = bisect.bisect_left(items, item)
+        if position < len(items) and items[position] == item:
+            del items[position]
+
+    def sync(self, db: Session):
+        """Load the catalogue on first use, then apply only the changes made since"""
+        # Courses inserted without a change row (e.g. by the seed script) still show up via MAX(id)
+        latest, max_course_id = db.query(
+            db.query(func.max(CourseChange.id)).scalar_subquery(),
+            db.query(func.max(Course.id)).scalar_subquery(),
+        ).one()
+        latest, max_course_id = latest or 0, max_course_id or 0
+        if latest == self.version and max_course_id <= self.max_course_id:
+            return
+        with self.lock:
+            if self.version is None or latest < self.version:
+                self._rebuild(db, latest)
+                return
+            changed = set()
+            if latest > self.version:
+                changed.update(
+                    row.course_id for row in db.query(CourseChange.course_id).filter(
+                        CourseChange.id > self.version,
+                        CourseChange.id <= latest
+                    )
+                )
+            rows = {
+                row.id: row for row in db.query(Course.id, Course.course_code, Course.course_name).filter(
+                    Course.id.in_(changed) | (Course.id > self.max_course_id)
+                )
+            }
+            for course_id in changed | rows.keys():
+                self.remove(course_id)
+                if course_id in rows:
+                    row = rows[course_id]
+                    self.add(make_entry(row.id, row.course_code, row.course_name))
+            self.version = latest
+            self.max_course_id = max(self.max_course_id, max_course_id, *rows.keys())
+
+    def _rebuild(self, db: Session, version: int):
+        self.entries, self.codes, self.terms, self.postings = {}, [], [], {}
+        for row in db.query(Course.id, Course.course_code, Course.course_name):
+            entry = make_entry(row.id, row.course_code, row.course_name)
+            self.entries[entry.id] = entry
+            self.codes.append((entry.compact_code, entry.id))
+            self.terms.extend((term, entry.id) for term in entry.terms)
+            for gram in entry.trigrams:
+                self.postings.setdefault(gram, set()).add(entry.id)
+        self.codes.sort()
+        self.terms.sort()
+        self.version = version
+        self.max_course_id = max(self.entries, default=0)
+
+    @staticmethod
+    def _prefix_range(items: List[Tuple[str, int]], prefix: str):
+        start = bisect.bisect_left(items, (prefix,))
+        for position in range(start, len(items)):
+            term, course_id = items[position]
+            if not term.startswith(prefix):
+                break
+            yield course_id
+
+    def search(self, query: str, limit: int = 10) -> List[CourseEntry]:
+        """Code prefix matches first, then courses matching every word by prefix, then fuzzy matches"""
+        query = query[:MAX_QUERY_LENGTH]
+        tokens = tokenize(query)
+        if not tokens:
+            return []
+        with self.lock:
+            results: List[int] = []
+            seen: Set[int] = set()
+
+            def take(ids):
+                for course_id in ids:
+                    if course_id not in seen:
+                        seen.add(course_id)
+                        results.append(course_id)
+                        if len(results) >= limit:
+                            return True
+                return False
+
+            # Codes come back in order from the sorted list, so no sort is needed
+            if take(self._prefix_range(self.codes, "".join(tokens))):
+                return [self.entries[i] for i in results]
+
+            matches: Optional[Set[int]] = None
+            for token in sorted(tokens, key=len, reverse=True):
+                ids = set(self._prefix_range(self.terms, token))
+                matches = ids if matches is None else matches & ids
+                if not matches:
+                    break
+            if matches and take(sorted(matches - seen, key=lambda i: self.entries[i].compact_code)):
+                return [self.entries[i] for i in results]
+
+            # Typo tolerance: share of the query's trigrams each course contains
+            query_grams = set()
+            for token in tokens:
+                query_grams |= trigrams(token)
+            if len(tokens) > 1:
+                query_grams |= trigrams("".join(tokens))
+            counts = Counter()
+            for gram in query_grams:
+                counts.update(self.postings.get(gram, ()))
+            fuzzy = [
+                (count / len(query_grams), course_id) for course_id, count in counts.items()
+                if course_id not in seen and count / len(query_grams) >= MIN_FUZZY_SCORE
+            ]
+            fuzzy.sort(key=lambda item: (-item[0], self.entries[item[1]].compact_code))
+            take(course_id for _, course_id in fuzzy)
+            return [self.entries[i] for i in results]
+
+
+def record_course_change(db: Session, course_id: int):
+    """Note that a course was created, renamed or deleted (call in the same transaction)"""
+    db.add(CourseChange(course_id=course_id))
+
+
+def warm_course_index():
+    """Build the index at startup so the first keystroke doesn't pay for it"""
+    db = SessionLocal()
+    try:
+        course_index.sync(db)
+    finally:
+        db.close()
+
+
+course_index = CourseIndex()
@@ -0,0 +1,514 @@
+"""
+Read-only snapshot mode for exam weeks
+
+Before exams the load is almost all reads of a course, its topics, a topic's
+notes and single notes. scripts/build_snapshot.py pre-renders those responses
+into WCAH_SNAPSHOT_DIR: one pack file per course holding every response body
+gzip-compressed, with an index of offsets at the end, plus a users file
+(identity and enrollments) and manifest.json naming the current files. Packs
+are named after a fingerprint of the course's rows, so a rebuild only
+re-renders courses that changed since the last one.
+
+With WCAH_SNAPSHOT_MODE=1, SnapshotMiddleware answers those four GET routes
+from memory-mapped packs, sending the stored gzip bytes as they are to
+clients that accept gzip. The caller is authenticated from the token and the
+snapshot's users file, so a served request never touches the database.
+Requests it can't answer fall through to the normal routes: users missing
+from the snapshot, and tokens hitting the revocation Bloom filter. Writes are
+rejected with 503, except logins and admin routes. A rebuilt manifest is
+picked up within WCAH_SNAPSHOT_RELOAD_SECONDS without a restart.
+"""
+import os
+import re
+import gzip
+import json
+import mmap
+import time
+import asyncio
+import hashlib
+import logging
+import threading
+from datetime import datetime
+from pathlib import Path
+from typing import Callable, Dict, FrozenSet, List, NamedTuple, Optional, Tuple
+from urllib.parse import parse_qs
+
+from fastapi.encoders import jsonable_encoder
+from sqlalchemy import func, select
+from sqlalchemy.orm import Session
+
+from .models import (
+    Course, Topic, StudyNote, NoteRanking, NoteFingerprint, NoteRevision, User, user_courses
+)
+from .schemas import CourseResponse, TopicResponse, StudyNoteResponse
+from .auth import decode_token
+from .revocation import revocation_list
+from .viewstats import record_view
+
+SNAPSHOT_MODE = os.getenv("WCAH_SNAPSHOT_MODE", "0") == "1"
+SNAPSHOT_DIR = Path(os.getenv("WCAH_SNAPSHOT_DIR", "./snapshot"))
+SNAPSHOT_RELOAD_SECONDS = float(os.getenv("WCAH_SNAPSHOT_RELOAD_SECONDS", "5"))
+# Bumped when the pack layout or rendering changes, so every course is rebuilt
+SNAPSHOT_FORMAT = 1
+MANIFEST_NAME = "manifest.json"
+
+WRITE_METHODS = {"POST", "PUT", "PATCH", "DELETE"}
+# Still writable in snapshot mode: sessions and operator endpoints
+WRITABLE_PREFIXES = ("/api/auth/login", "/api/auth/refresh", "/api/auth/logout", "/api/events/ticket", "/api/admin/")
+READ_ONLY_DETAIL = "The site is in read-only exam mode; changes are disabled until it ends"
+
+COURSE_PATH = re.compile(r"^/api/courses/(\d+)$")
+TOPICS_PATH = re.compile(r"^/api/topics/course/(\d+)$")
+NOTES_PATH = re.compile(r"^/api/notes/topic/(\d+)$")
+NOTE_PATH = re.compile(r"^/api/notes/(\d+)$")
+# Spellings pydantic accepts for a bool query parameter
+TRUE_VALUES = {"1", "t", "true", "on", "y", "yes"}
+FALSE_VALUES = {"0", "f", "false", "off", "n", "no"}
+
+logger = logging.getLogger(__name__)
+
+
+def render(value) -> bytes:
+    """JSON body exactly as FastAPI's JSONResponse would send it"""
+    return json.dumps(
+        jsonable_encoder(value), ensure_ascii=False, allow_nan=False, indent=None, separators=(",", ":")
+    ).encode("utf-8")
+
+
+def compress(body: bytes) -> bytes:
+    return gzip.compress(body, compresslevel=6, mtime=0)
+
+
+# Building
+
+def course_fingerprints(db: Session) -> Dict[int, str]:
+    """
+    Hash of everything a course's snapshot responses depend on, per course. Note
+    content is covered by its length and latest revision number (every edit adds
+    a revision), so the note bodies themselves aren't read.
+    """
+    hashes = {}
+    for row in db.query(
+        Course.id, Course.course_code, Course.course_name, Course.description, Course.creator_id, Course.created_at
+    ).order_by(Course.id):
+        hashes[row.id] = hashlib.sha256(repr((SNAPSHOT_FORMAT, tuple(row))).encode())
+    for row in db.query(
+        Topic.course_id, Topic.id, Topic.title, Topic.description, Topic.created_at
+    ).order_by(Topic.course_id, Topic.id):
+        if row.course_id in hashes:
+            hashes[row.course_id].update(repr(tuple(row)).encode())
+
+    latest_revision = select(
+        NoteRevision.note_id, func.max(NoteRevision.revision).label("revision")
+    ).group_by(NoteRevision.note_id).subquery()
+    notes = db.query(
+        Topic.course_id, StudyNote.id, StudyNote.topic_id, StudyNote.title, StudyNote.summary, StudyNote.note_type,
+        StudyNote.author_id, StudyNote.likes, StudyNote.created_at, func.length(StudyNote._content),
+        latest_revision.c.revision, NoteFingerprint.duplicate_of, NoteRanking.hot_score
+    ).join(Topic, Topic.id == StudyNote.topic_id).outerjoin(
+        latest_revision, latest_revision.c.note_id == StudyNote.id
+    ).outerjoin(NoteFingerprint, NoteFingerprint.note_id == StudyNote.id).outerjoin(
+        NoteRanking, NoteRanking.note_id == StudyNote.id
+    ).order_by(Topic.course_id, StudyNote.id).all()
+    hot_order: Dict[int, List[Tuple[float, int]]] = {}
+    for row in notes:
+        if row.course_id in hashes:
+            hashes[row.course_id].update(repr(tuple(row)[1:-1]).encode())
+            if row.hot_score is not None:
+                hot_order.setdefault(row.course_id, []).append((row.hot_score, row.id))
+    # Hot scores decay continuously, so only the resulting order is part of the fingerprint
+    for course_id, scored in hot_order.items():
+        hashes[course_id].update(repr([note_id for _, note_id in sorted(scored, reverse=True)]).encode())
+    return {course_id: digest.hexdigest() for course_id, digest in hashes.items()}
+
+
+def topic_orders(db: Session, topic_id: int) -> dict:
+    """Note ids of a topic in each listing order, and which of them are linked duplicates"""
+    hot = db.query(NoteRanking.note_id).join(StudyNote, StudyNote.id == NoteRanking.note_id).filter(
+        NoteRanking.topic_id == topic_id
+    ).order_by(NoteRanking.hot_score.desc(), NoteRanking.note_id.desc())
+    likes = db.query(StudyNote.id).filter(StudyNote.topic_id == topic_id).order_by(
+        StudyNote.likes.desc(), StudyNote.id.desc()
+    )
+    new = db.query(StudyNote.id).filter(StudyNote.topic_id == topic_id).order_by(
+        StudyNote.created_at.desc(), StudyNote.id.desc()
+    )
+    duplicates = db.query(NoteFingerprint.note_id).join(StudyNote, StudyNote.id == NoteFingerprint.note_id).filter(
+        StudyNote.topic_id == topic_id, NoteFingerprint.duplicate_of.isnot(None)
+    )
+    return {name: [row[0] for row in query] for name, query in (
+        ("hot", hot), ("likes", likes), ("new", new), ("duplicates", duplicates)
+    )}
+
+
+def write_course_pack(db: Session, course: Course, path: Path) -> int:
+    """Render a course's responses into a pack file; returns the number of notes"""
+    index: Dict[str, List[int]] = {}
+    note_topics: Dict[int, int] = {}
+    temporary = path.with_suffix(".tmp")
+    with open(temporary, "wb") as pack:
+        def add(key: str, body: bytes):
+            data = compress(body)
+            index[key] = [pack.tell(), len(data)]
+            pack.write(data)
+
+        course_dict = CourseResponse.from_orm(course).dict()
+        # is_enrolled is the only per-user field; the middleware picks the variant
+        add("course:1", render(CourseResponse(**{**course_dict, "is_enrolled": True})))
+        add("course:0", render(CourseResponse(**{**course_dict, "is_enrolled": False})))
+        topics = db.query(Topic).filter(Topic.course_id == course.id).all()
+        add("topics", render([TopicResponse.from_orm(topic) for topic in topics]))
+        for topic_id in [topic.id for topic in topics]:
+            bodies = {
+                note.id: render(StudyNoteResponse.from_orm(note))
+                for note in db.query(StudyNote).filter(StudyNote.topic_id == topic_id)
+            }
+            orders = topic_orders(db, topic_id)
+            duplicates = set(orders["duplicates"])
+            # The default listing (hottest first, duplicates hidden) is stored whole
+            add(f"notes:{topic_id}", b"[" + b",".join(
+                bodies[note_id] for note_id in orders["hot"] if note_id not in duplicates
+            ) + b"]")
+            add(f"order:{topic_id}", json.dumps(orders).encode())
+            for note_id, body in bodies.items():
+                add(f"note:{note_id}", body)
+                note_topics[note_id] = topic_id
+            db.expunge_all()
+        trailer = json.dumps({"entries": index, "note_topics": note_topics}).encode()
+        pack.write(trailer)
+        pack.write(len(trailer).to_bytes(8, "little"))
+    os.replace(temporary, path)
+    return len(note_topics)
+
+
+def write_users_file(db: Session, directory: Path) -> str:
+    """Identity and enrolled course ids of every user, named by content hash"""
+    enrollments: Dict[int, List[int]] = {}
+    for user_id, course_id in db.query(user_courses.c.user_id, user_courses.c.course_id).order_by(
+        user_courses.c.user_id, user_courses.c.course_id
+    ):
+        enrollments.setdefault(user_id, []).append(course_id)
+    users = {
+        username: [user_id, identity, enrollments.get(user_id, [])]
+        for user_id, username, identity in db.query(User.id, User.username, User.identity).order_by(User.id)
+    }
+    body = json.dumps(users, separators=(",", ":")).encode()
+    name = f"users-{hashlib.sha256(body).hexdigest()[:16]}.json.gz"
+    if not (directory / name).exists():
+        temporary = directory / f"{name}.tmp"
+        temporary.write_bytes(compress(body))
+        os.replace(temporary, directory / name)
+    return name
+
+
+def read_manifest(directory: Path) -> Optional[dict]:
+    try:
+        return json.loads((directory / MANIFEST_NAME).read_text())
+    except FileNotFoundError:
+        return None
+
+
+def build_snapshot(
+    db: Session,
+    directory: Path = SNAPSHOT_DIR,
+    full: bool = False,
+    progress: Callable[[str], None] = lambda _: None
+) -> dict:
+    """
+    Bring the snapshot up to date: re-render courses whose fingerprint changed
+    (or all of them with full=True), rewrite the users file, then swap in the
+    new manifest and delete files it no longer names
+    """
+    directory.mkdir(parents=True, exist_ok=True)
+    previous = (read_manifest(directory) or {}).get("courses", {})
+    fingerprints = course_fingerprints(db)
+    courses: Dict[str, dict] = {}
+    rebuilt = 0
+    for course_id, fingerprint in fingerprints.items():
+        name = f"course-{course_id}-{fingerprint[:16]}.pack"
+        entry = previous.get(str(course_id))
+        if full or entry is None or entry["file"] != name or not (directory / name).exists():
+            course = db.query(Course).filter(Course.id == course_id).first()
+            notes = write_course_pack(db, course, directory / name)
+            db.expunge_all()
+            rebuilt += 1
+            progress(f"course {course_id}: {notes} notes")
+        else:
+            notes = entry["notes"]
+        courses[str(course_id)] = {"file": name, "fingerprint": fingerprint, "notes": notes}
+
+    manifest = {
+        "format": SNAPSHOT_FORMAT,
+        "generated_at": datetime.utcnow().isoformat(),
+        "users": write_users_file(db, directory),
+        "courses": courses,
+    }
+    temporary = directory / f"{MANIFEST_NAME}.tmp"
+    temporary.write_text(json.dumps(manifest, indent=1))
+    os.replace(temporary, directory / MANIFEST_NAME)
+
+    # Workers still serving an old pack keep their mapping after the file is unlinked
+    keep = {MANIFEST_NAME, manifest["users"], *(entry["file"] for entry in courses.values())}
+    removed = 0
+    for path in directory.iterdir():
+        if path.name not in keep and (path.suffix in (".pack", ".tmp") or path.name.startswith("users-")):
+            path.unlink()
+            removed += 1
+    return {
+        "courses": len(courses),
+        "rebuilt": rebuilt,
+        "removed": removed,
+        "bytes": sum((directory / name).stat().st_size for name in keep),
+    }
+
+
+# Serving
+
+class SnapshotUser(NamedTuple):
+    id: int
+    identity: str
+    course_ids: FrozenSet[int]
+
+
+class CoursePack:
+    """A memory-mapped pack file: gzip bodies followed by their JSON index"""
+
+    def __init__(self, path: Path):
+        with open(path, "rb") as pack:
+            self.data = mmap.mmap(pack.fileno(), 0, access=mmap.ACCESS_READ)
+        trailer_length = int.from_bytes(self.data[-8:], "little")
+        trailer = json.loads(self.data[-8 - trailer_length:-8])
+        self.entries: Dict[str, List[int]] = trailer["entries"]
+        self.note_topics = {int(note_id): topic_id for note_id, topic_id in trailer["note_topics"].items()}
+        self.topic_ids = {int(key[len("notes:"):]) for key in self.entries if key.startswith("notes:")}
+
+    def get(self, key: str) -> Optional[bytes]:
+        entry = self.entries.get(key)
+        if entry is None:
+            return None
+        offset, length = entry
+        return self.data[offset:offset + length]
+
+    def body(self, key: str) -> Optional[bytes]:
+        data = self.get(key)
+        return None if data is None else gzip.decompress(data)
+
+
+class Snapshot:
+    """Everything loaded from one manifest"""
+
+    def __init__(self, directory: Path, manifest: dict, reuse: Dict[str, CoursePack]):
+        self.generated_at = manifest["generated_at"]
+        self.files: Dict[str, CoursePack] = {}
+        self.courses: Dict[int, CoursePack] = {}
+        self.topic_courses: Dict[int, int] = {}
+        self.note_courses: Dict[int, int] = {}
+        for course_id, entry in manifest["courses"].items():
+            pack = reuse.get(entry["file"]) or CoursePack(directory / entry["file"])
+            self.files[entry["file"]] = pack
+            self.courses[int(course_id)] = pack
+            for topic_id in pack.topic_ids:
+                self.topic_courses[topic_id] = int(course_id)
+            for note_id in pack.note_topics:
+                self.note_courses[note_id] = int(course_id)
+        users = json.loads(gzip.decompress((directory / manifest["users"]).read_bytes()))
+        self.users = {
+            username: SnapshotUser(user_id, identity, frozenset(course_ids))
+            for username, (user_id, identity, course_ids) in users.items()
+        }
+
+
+class SnapshotStore:
+    """The current snapshot of one worker, reloaded when the manifest is replaced"""
+
+    def __init__(self, directory: Path = SNAPSHOT_DIR):
+        self.directory = directory
+        self.snapshot: Optional[Snapshot] = None
+        self.manifest_mtime: Optional[float] = None
+        self.next_check = 0.0
+        self.lock = threading.Lock()
+
+    def refresh(self):
+        """Load the manifest if it changed since the last load (blocking; packs of unchanged courses are kept)"""
+        with self.lock:
+            try:
+                mtime = (self.directory / MANIFEST_NAME).stat().st_mtime
+            except FileNotFoundError:
+                if self.snapshot is not None or self.manifest_mtime is None:
+                    logger.warning("No snapshot in %s; reads go to the database", self.directory)
+                self.snapshot, self.manifest_mtime = None, -1.0
+                return
+            if mtime == self.manifest_mtime:
+                return
+            manifest = read_manifest(self.directory)
+            if manifest is None or manifest.get("format") != SNAPSHOT_FORMAT:
+                logger.warning("Snapshot in %s is missing or outdated; rebuild it", self.directory)
+                self.snapshot, self.manifest_mtime = None, mtime
+                return
+            self.snapshot = Snapshot(self.directory, manifest, self.snapshot.files if self.snapshot else {})
+            self.manifest_mtime = mtime
+            logger.info("Serving snapshot generated at %s (%s courses)", self.snapshot.generated_at, len(self.snapshot.courses))
+
+    async def current(self) -> Optional[Snapshot]:
+        now = time.monotonic()
+        if now >= self.next_check:
+            self.next_check = now + SNAPSHOT_RELOAD_SECONDS
+            try:
+                await asyncio.get_running_loop().run_in_executor(None, self.refresh)
+            except Exception:
+                # Keep serving the previous snapshot
+                logger.exception("Loading the snapshot failed")
+        return self.snapshot
+
+
+snapshot_store = SnapshotStore()
+
+
+def header(scope, name: bytes) -> str:
+    for key, value in scope.get("headers", []):
+        if key == name:
+            return value.decode("latin-1")
+    return ""
+
+
+def parse_bool(values: List[str]) -> Optional[bool]:
+    value = values[-1].lower()
+    return True if value in TRUE_VALUES else False if value in FALSE_VALUES else None
+
+
+class SnapshotMiddleware:
+    """ASGI middleware serving course, topic and note reads from the snapshot and rejecting writes"""
+
+    def __init__(self, app, store: SnapshotStore = snapshot_store):
+        self.app = app
+        self.store = store
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        method, path = scope["method"], scope["path"]
+        if method in WRITE_METHODS and path.startswith("/api/") and not path.startswith(WRITABLE_PREFIXES):
+            await self.send_json(send, 503, render({"detail": READ_ONLY_DETAIL}))
+            return
+        if method == "GET" and path.startswith(("/api/courses/", "/api/topics/", "/api/notes/")):
+            snapshot = await self.store.current()
+            if snapshot is not None and await self.serve(snapshot, scope, send):
+                return
+        await self.app(scope, receive, send)
+
+    def caller(self, snapshot: Snapshot, scope) -> Optional[SnapshotUser]:
+        """The authenticated user, or None to leave the request to the normal route"""
+        scheme, _, token = header(scope, b"authorization").partition(" ")
+        if scheme.lower() != "bearer" or not token:
+            return None
+        payload = decode_token(token)
+        # A Bloom filter hit needs the database to confirm, so the route handles it
+        if payload is None or payload["sid"] in revocation_list.filter:
+            return None
+        return snapshot.users.get(payload["sub"])
+
+    async def serve(self, snapshot: Snapshot, scope, send) -> bool:
+        """Answer from the snapshot; False if the request must go to the app"""
+        path = scope["path"].rstrip("/")
+        match = COURSE_PATH.match(path) or TOPICS_PATH.match(path) or NOTES_PATH.match(path) or NOTE_PATH.match(path)
+        if match is None:
+            return False
+        user = self.caller(snapshot, scope)
+        if user is None:
+            return False
+        item_id = int(match.group(1))
+        pattern = match.re
+
+        def allowed(course_id: int) -> bool:
+            return user.identity == "professor" or course_id in user.course_ids
+
+        if pattern is COURSE_PATH:
+            pack = snapshot.courses.get(item_id)
+            if pack is None:
+                return await self.not_found(send, "Course not found")
+            return await self.send_stored(scope, send, pack.get(f"course:{int(allowed(item_id))}"), snapshot.generated_at)
+        if pattern is TOPICS_PATH:
+            pack = snapshot.courses.get(item_id)
+            if pack is None:
+                return await self.not_found(send, "Course not found")
+            if not allowed(item_id):
+                return await self.forbidden(send)
+            return await self.send_stored(scope, send, pack.get("topics"), snapshot.generated_at)
+        if pattern is NOTES_PATH:
+            listing = self.listing_options(scope)
+            if listing is None:
+                return False  # Invalid parameters; the route reports them
+            course_id = snapshot.topic_courses.get(item_id)
+            if course_id is None:
+                return await self.not_found(send, "Topic not found")
+            if not allowed(course_id):
+                return await self.forbidden(send)
+            pack = snapshot.courses[course_id]
+            if listing == ("hot", None, 0, False):
+                return await self.send_stored(scope, send, pack.get(f"notes:{item_id}"), snapshot.generated_at)
+            sort, limit, offset, include_duplicates = listing
+            orders = json.loads(pack.body(f"order:{item_id}"))
+            duplicates = set() if include_duplicates else set(orders["duplicates"])
+            note_ids = [note_id for note_id in orders[sort] if note_id not in duplicates][offset:]
+            if limit is not None:
+                note_ids = note_ids[:limit]
+            body = b"[" + b",".join(pack.body(f"note:{note_id}") for note_id in note_ids) + b"]"
+            await self.send_json(send, 200, body, snapshot.generated_at)
+            return True
+        course_id = snapshot.note_courses.get(item_id)
+        if course_id is None:
+            return await self.not_found(send, "Study Note not found")
+        if not allowed(course_id):
+            return await self.forbidden(send)
+        pack = snapshot.courses[course_id]
+        record_view(item_id, pack.note_topics[item_id], course_id, user)
+        return await self.send_stored(scope, send, pack.get(f"note:{item_id}"), snapshot.generated_at)
+
+    @staticmethod
+    def listing_options(scope) -> Optional[Tuple[str, Optional[int], int, bool]]:
+        """sort, limit, offset and include_duplicates as list_notes_by_topic reads them, or None if invalid"""
+        query = parse_qs(scope.get("query_string", b"").decode("latin-1"), keep_blank_values=True)
+        try:
+            sort = query.get("sort", ["hot"])[-1]
+            limit = int(query["limit"][-1]) if "limit" in query else None
+            offset = int(query.get("offset", ["0"])[-1])
+        except ValueError:
+            return None
+        include_duplicates = parse_bool(query["include_duplicates"]) if "include_duplicates" in query else False
+        if sort not in ("hot", "likes", "new") or (limit is not None and not 1 <= limit <= 100) or offset < 0:
+            return None
+        if include_duplicates is None:
+            return None
+        return sort, limit, offset, include_duplicates
+
+    async def send_stored(self, scope, send, data: Optional[bytes], version: str) -> bool:
+        """Send a stored gzip body, decompressing it for clients that don't accept gzip"""
+        if data is None:
+            return False
+        if "gzip" in header(scope, b"accept-encoding"):
+            await self.send_json(send, 200, data, version, [(b"content-encoding", b"gzip")])
+        else:
+            await self.send_json(send, 200, gzip.decompress(data), version)
+        return True
+
+    async def not_found(self, send, detail: str) -> bool:
+        await self.send_json(send, 404, render({"detail": detail}))
+        return True
+
+    async def forbidden(self, send) -> bool:
+        await self.send_json(send, 403, render({"detail": "You must be enrolled in this course to view its content"}))
+        return True
+
+    @staticmethod
+    async def send_json(send, status_code: int, body: bytes, version: Optional[str] = None, extra_headers=()):
+        headers = [
+            (b"content-type", b"application/json"),
+            (b"content-length", str(len(body)).encode()),
+            (b"vary", b"Accept-Encoding"),
+            *extra_headers,
+        ]
+        if version is not None:
+            headers.append((b"x-snapshot", version.encode()))
+        await send({"type": "http.response.start", "status": status_code, "headers": headers})
+        await send({"type": "http.response.body", "body": body})
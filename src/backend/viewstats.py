@@ -0,0 +1,199 @@
+"""
+Note view analytics
+
+get_note is the hottest read endpoint, so recording a view must not write to
+the database. Views by students are aggregated in memory per note (a count
+and the set of viewer ids) and flushed every WCAH_VIEW_FLUSH_SECONDS in one
+transaction. Each note, topic and course keeps a row in view_sketches with
+its raw view count and a HyperLogLog sketch of its viewers: 2^12 one-byte
+registers (4 KB, about 1.6% standard error) that merge by taking the maximum
+register, so a flush folds new viewers into existing sketches without ever
+storing who viewed what. The estimate is computed at flush time, so reading
+a course's unique viewers is a primary-key lookup.
+"""
+import os
+import math
+import asyncio
+import hashlib
+import logging
+import threading
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy.orm import Session
+
+from .database import SessionLocal
+from .models import ViewSketch
+
+VIEW_TRACKING_ENABLED = os.getenv("WCAH_VIEW_TRACKING_ENABLED", "1") == "1"
+VIEW_FLUSH_SECONDS = float(os.getenv("WCAH_VIEW_FLUSH_SECONDS", "10"))
+
+HLL_PRECISION = 12
+HLL_REGISTERS = 1 << HLL_PRECISION
+HLL_ALPHA = 0.7213 / (1 + 1.079 / HLL_REGISTERS)
+RANK_BITS = 64 - HLL_PRECISION
+INVERSE_POWERS = [2.0 ** -rank for rank in range(RANK_BITS + 2)]
+# Byte-wise max over whole sketches as big-int arithmetic (registers never exceed 127)
+HIGH_BITS = int.from_bytes(b"\x80" * HLL_REGISTERS, "little")
+ALL_BITS = (1 << (8 * HLL_REGISTERS)) - 1
+
+logger = logging.getLogger(__name__)
+
+
+class HyperLogLog:
+    """Mergeable distinct-count sketch over integer ids"""
+
+    def __init__(self, registers: Optional[bytes] = None):
+        self.registers = bytearray(registers) if registers else bytearray(HLL_REGISTERS)
+
+    def add(self, value: int):
+        hashed = int.from_bytes(hashlib.blake2b(value.to_bytes(8, "little", signed=True), digest_size=8).digest(), "little")
+        index = hashed >> RANK_BITS
+        remainder = hashed & ((1 << RANK_BITS) - 1)
+        rank = RANK_BITS - remainder.bit_length() + 1  # Position of the first 1 bit
+        if rank > self.registers[index]:
+            self.registers[index] = rank
+
+    def merge(self, other: "HyperLogLog"):
+        a = int.from_bytes(self.registers, "little")
+        b = int.from_bytes(other.registers, "little")
+        # With the high bit set in every byte of a, a byte of the difference keeps it iff a >= b,
+        # and no byte borrows from its neighbour
+        a_wins = (((a | HIGH_BITS) - b) & HIGH_BITS) >> 7
+        mask = a_wins * 0xFF
+        self.registers = bytearray(((a & mask) | (b & ~mask & ALL_BITS)).to_bytes(HLL_REGISTERS, "little"))
+
+    def estimate(self) -> int:
+        raw = HLL_ALPHA * HLL_REGISTERS ** 2 / sum(map(INVERSE_POWERS.__getitem__, self.registers))
+        zeros = self.registers.count(0)
+        if raw <= 2.5 * HLL_REGISTERS and zeros:
+            # Linear counting is more accurate while many registers are still empty
+            return round(HLL_REGISTERS * math.log(HLL_REGISTERS / zeros))
+        return round(raw)
+
+    def to_bytes(self) -> bytes:
+        return bytes(self.registers)
+
+
+class ViewBuffer:
+    """Per-worker aggregate of views since the last flush"""
+
+    def __init__(self):
+        self.pending: Dict[int, list] = {}  # note id -> [topic id, course id, views, viewer ids]
+        self.lock = threading.Lock()
+
+    def record(self, note_id: int, topic_id: int, course_id: int, user_id: int):
+        with self.lock:
+            entry = self.pending.get(note_id)
+            if entry is None:
+                entry = self.pending[note_id] = [topic_id, course_id, 0, set()]
+            entry[2] += 1
+            entry[3].add(user_id)
+
+    def take(self) -> Dict[int, list]:
+        with self.lock:
+            pending, self.pending = self.pending, {}
+        return pending
+
+    def restore(self, pending: Dict[int, list]):
+        """Put back views whose flush failed, merging with anything recorded since"""
+        with self.lock:
+            for note_id, (topic_id, course_id, views, viewers) in pending.items():
+                entry = self.pending.setdefault(note_id, [topic_id, course_id, 0, set()])
+                entry[2] += views
+                entry[3] |= viewers
+
+    def flush(self, db: Session) -> int:
+        """Fold buffered views into the note, topic and course sketches; returns views written"""
+        pending = self.take()
+        if not pending:
+            return 0
+        updates: Dict[Tuple[str, int], list] = {}  # (scope, id) -> [views, viewer ids]
+        for note_id, (topic_id, course_id, views, viewers) in pending.items():
+            for key in (("note", note_id), ("topic", topic_id), ("course", course_id)):
+                entry = updates.setdefault(key, [0, set()])
+                entry[0] += views
+                entry[1] |= viewers
+        try:
+            existing = {}
+            for scope in ("note", "topic", "course"):
+                scope_ids = [scope_id for key_scope, scope_id in updates if key_scope == scope]
+                for row in db.query(ViewSketch).filter(ViewSketch.scope == scope, ViewSketch.scope_id.in_(scope_ids)):
+                    existing[(scope, row.scope_id)] = row
+            now = datetime.utcnow()
+            for (scope, scope_id), (views, viewers) in updates.items():
+                row = existing.get((scope, scope_id))
+                sketch = HyperLogLog(row.sketch if row is not None else None)
+                for user_id in viewers:
+                    sketch.add(user_id)
+                if row is None:
+                    row = ViewSketch(scope=scope, scope_id=scope_id, views=0)
+                    db.add(row)
+                row.views += views
+                row.sketch = sketch.to_bytes()
+                row.unique_viewers = sketch.estimate()
+                row.updated_at = now
+            db.commit()
+        except Exception:
+            db.rollback()
+            self.restore(pending)
+            raise
+        return sum(entry[2] for entry in pending.values())
+
+
+view_buffer = ViewBuffer()
+
+
+def record_view(note_id: int, topic_id: int, course_id: int, user):
+    """Count a student's view of a note; no database access"""
+    if VIEW_TRACKING_ENABLED and user.identity == "student":
+        view_buffer.record(note_id, topic_id, course_id, user.id)
+
+
+def view_stats(db: Session, scope: str, scope_ids: Iterable[int]) -> Dict[int, dict]:
+    """Stored views and unique viewers for some notes, topics or courses (unflushed views excluded)"""
+    scope_ids = list(scope_ids)
+    stats = {scope_id: {"views": 0, "unique_viewers": 0} for scope_id in scope_ids}
+    if scope_ids:
+        for row in db.query(ViewSketch.scope_id, ViewSketch.views, ViewSketch.unique_viewers).filter(
+            ViewSketch.scope == scope, ViewSketch.scope_id.in_(scope_ids)
+        ):
+            stats[row.scope_id] = {"views": row.views, "unique_viewers": row.unique_viewers}
+    return stats
+
+
+def merged_unique_viewers(db: Session, scope: str, scope_ids: List[int]) -> int:
+    """Distinct viewers across several notes, topics or courses, without double counting"""
+    merged = HyperLogLog()
+    for row in db.query(ViewSketch.sketch).filter(ViewSketch.scope == scope, ViewSketch.scope_id.in_(scope_ids)):
+        merged.merge(HyperLogLog(row.sketch))
+    return merged.estimate()
+
+
+def forget_views(db: Session, scope: str, scope_ids: Iterable[int]):
+    """Drop analytics for deleted content (call in the deleting transaction; ids can be reused)"""
+    scope_ids = list(scope_ids)
+    if scope_ids:
+        db.query(ViewSketch).filter(
+            ViewSketch.scope == scope, ViewSketch.scope_id.in_(scope_ids)
+        ).delete(synchronize_session=False)
+
+
+def run_view_flush():
+    db = SessionLocal()
+    try:
+        view_buffer.flush(db)
+    finally:
+        db.close()
+
+
+async def view_flush_loop():
+    """Periodic flush task started from main.lifespan"""
+    loop = asyncio.get_running_loop()
+    while True:
+        await asyncio.sleep(VIEW_FLUSH_SECONDS)
+        try:
+            await loop.run_in_executor(None, run_view_flush)
+        except Exception:
+            # The views were put back and go out with the next flush
+            logger.exception("View flush failed")
@@ -0,0 +1,160 @@
+"""
+Event loop lag watchdog
+
+Route handlers are `async def` but do blocking database and bcrypt work on
+the event loop thread, so one slow call stalls every request in the worker.
+A ticker task sleeps for a fixed interval and records how late it woke up
+in a histogram. A watcher thread checks that the ticker keeps ticking; when
+it falls more than the threshold behind, the loop is blocked right now, so
+the watcher captures the loop thread's stack and picks out the route, the
+request ID and the handler from it. The stall is logged and kept for the
+admin endpoint once the loop recovers and its full length is known.
+"""
+import os
+import sys
+import time
+import asyncio
+import logging
+import threading
+from bisect import bisect_left
+from collections import deque
+from typing import Optional
+
+LOOP_WATCHDOG_ENABLED = os.getenv("WCAH_LOOP_WATCHDOG_ENABLED", "1") == "1"
+LOOP_LAG_INTERVAL_MS = float(os.getenv("WCAH_LOOP_LAG_INTERVAL_MS", "100"))
+# Stalls longer than this get a stack capture
+LOOP_LAG_THRESHOLD_MS = float(os.getenv("WCAH_LOOP_LAG_THRESHOLD_MS", "200"))
+LOOP_STALL_BUFFER_SIZE = int(os.getenv("WCAH_LOOP_STALL_BUFFER_SIZE", "50"))
+
+LAG_BUCKETS_MS = (1, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000)
+MAX_STACK_DEPTH = 64
+ROUTES_PACKAGE = os.path.join("backend", "routes") + os.sep
+
+logger = logging.getLogger("wcah.loop")
+
+
+class LagHistogram:
+    """Cumulative-bucket histogram in the Prometheus style"""
+
+    def __init__(self, buckets=LAG_BUCKETS_MS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # The last slot is +Inf
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def observe(self, value_ms: float):
+        self.counts[bisect_left(self.buckets, value_ms)] += 1
+        self.count += 1
+        self.total += value_ms
+        self.max = max(self.max, value_ms)
+
+    def snapshot(self) -> dict:
+        cumulative = 0
+        buckets = []
+        for bound, count in zip([*self.buckets, "+Inf"], self.counts):
+            cumulative += count
+            buckets.append({"le": bound, "count": cumulative})
+        return {"buckets": buckets, "count": self.count, "sum_ms": round(self.total, 2), "max_ms": round(self.max, 2)}
+
+
+def describe_stack(frame) -> dict:
+    """The stack (innermost last) plus the route, request ID and handler it belongs to"""
+    stack = []
+    route = request_id = handler = None
+    while frame is not None and len(stack) < MAX_STACK_DEPTH:
+        code = frame.f_code
+        stack.append(f'File "{code.co_filename}", line {frame.f_lineno}, in {code.co_name}')
+        if ROUTES_PACKAGE in code.co_filename:
+            handler = f"{os.path.basename(code.co_filename)[:-3]}.{code.co_name}"
+        if route is None:
+            scope = frame.f_locals.get("scope")
+            if isinstance(scope, dict) and "path" in scope:
+                route = f"{scope.get('method', '')} {scope['path']}".strip()
+                request_id = scope.get("state", {}).get("request_id")
+        frame = frame.f_back
+    # Walking went innermost-first; the outermost route handler frame wins
+    return {"stack": stack[::-1], "route": route, "request_id": request_id, "handler": handler}
+
+
+class LoopWatchdog:
+    """Measures event loop lag and captures what is blocking it"""
+
+    def __init__(self, interval_ms: float = LOOP_LAG_INTERVAL_MS, threshold_ms: float = LOOP_LAG_THRESHOLD_MS):
+        self.interval = interval_ms / 1000
+        self.threshold = threshold_ms / 1000
+        self.histogram = LagHistogram()
+        self.stalls: deque = deque(maxlen=LOOP_STALL_BUFFER_SIZE)
+        self.lock = threading.Lock()
+        self.expected_tick = 0.0  # When the ticker should next wake up
+        self.pending: Optional[dict] = None  # Stall captured while the loop is still blocked
+        self.loop_thread_id: Optional[int] = None
+        self.task: Optional[asyncio.Task] = None
+        self.thread: Optional[threading.Thread] = None
+        self.stop_event = threading.Event()
+
+    def start(self):
+        """Call from the event loop"""
+        if self.task is not None:
+            return
+        self.loop_thread_id = threading.get_ident()
+        self.expected_tick = time.monotonic() + self.interval
+        self.stop_event.clear()
+        self.task = asyncio.create_task(self._tick())
+        self.thread = threading.Thread(target=self._watch, name="wcah-loop-watchdog", daemon=True)
+        self.thread.start()
+
+    async def stop(self):
+        if self.task is None:
+            return
+        self.stop_event.set()
+        self.task.cancel()
+        try:
+            await self.task
+        except asyncio.CancelledError:
+            pass
+        self.task = None
+
+    async def _tick(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            now = time.monotonic()
+            lag = max(0.0, now - self.expected_tick)
+            self.expected_tick = now + self.interval
+            self.histogram.observe(lag * 1000)
+            with self.lock:
+                stall, self.pending = self.pending, None
+            if stall is not None:
+                stall["lag_ms"] = round(lag * 1000, 1)
+                self.stalls.append(stall)
+                logger.warning(
+                    "Event loop blocked for %.0f ms in %s", stall["lag_ms"], stall["handler"] or stall["route"],
+                    extra={"request_id": stall["request_id"], "fields": stall}
+                )
+
+    def _watch(self):
+        captured_for = None
+        while not self.stop_event.wait(min(self.interval, self.threshold) / 2):
+            expected = self.expected_tick
+            if expected == captured_for or time.monotonic() - expected < self.threshold:
+                continue
+            frame = sys._current_frames().get(self.loop_thread_id)
+            if frame is None:
+                continue
+            stall = {"at": time.time(), **describe_stack(frame)}
+            del frame
+            captured_for = expected
+            with self.lock:
+                self.pending = stall
+
+    def snapshot(self, limit: int) -> dict:
+        """Lag histogram and the most recent stalls, newest first"""
+        return {
+            "interval_ms": self.interval * 1000,
+            "threshold_ms": self.threshold * 1000,
+            "lag": self.histogram.snapshot(),
+            "stalls": list(self.stalls)[::-1][:limit],
+        }
+
+
+loop_watchdog = LoopWatchdog()
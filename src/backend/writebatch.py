@@ -0,0 +1,158 @@
+"""
+Write coalescing for small, hot writes (likes and comments)
+
+When enabled, requests submit their write as a function of a session instead of
+committing themselves. A background task gathers pending writes for a few
+milliseconds (or until the batch is full) and applies them in one transaction.
+A request is answered only after the batch containing its write has committed.
+
+Ops validate before writing: an op that rejects its request raises HTTPException
+before touching the database, so the rest of the batch can still commit.
+Any other error rolls back and fails the whole batch.
+"""
+import os
+import asyncio
+from typing import Any, Callable, List, Optional, Tuple
+
+from fastapi import HTTPException, status
+from sqlalchemy.orm import Session
+
+from .database import SessionLocal
+
+WRITE_COALESCING_ENABLED = os.getenv("WCAH_WRITE_COALESCING", "0") == "1"
+BATCH_MAX_ITEMS = int(os.getenv("WCAH_WRITE_BATCH_SIZE", "200"))
+BATCH_MAX_DELAY_MS = float(os.getenv("WCAH_WRITE_BATCH_DELAY_MS", "5"))
+QUEUE_MAX_SIZE = int(os.getenv("WCAH_WRITE_QUEUE_MAX", "5000"))
+SUBMIT_TIMEOUT = float(os.getenv("WCAH_WRITE_SUBMIT_TIMEOUT", "2"))
+
+WriteOp = Callable[[Session], Any]
+
+
+class WriteCoalescer:
+    """Batches small writes into shared transactions"""
+
+    def __init__(
+        self,
+        session_factory=SessionLocal,
+        max_items: int = BATCH_MAX_ITEMS,
+        max_delay_ms: float = BATCH_MAX_DELAY_MS,
+        queue_size: int = QUEUE_MAX_SIZE,
+        submit_timeout: float = SUBMIT_TIMEOUT,
+    ):
+        self.session_factory = session_factory
+        self.max_items = max_items
+        self.max_delay = max_delay_ms / 1000
+        self.queue_size = queue_size
+        self.submit_timeout = submit_timeout
+        self.queue: Optional[asyncio.Queue] = None
+        self.task: Optional[asyncio.Task] = None
+
+    @property
+    def running(self) -> bool:
+        return self.task is not None and not self.task.done()
+
+    def start(self):
+        """Start the flush loop on the running event loop"""
+        self.queue = asyncio.Queue(maxsize=self.queue_size)
+        self.task = asyncio.create_task(self._flush_loop())
+
+    async def stop(self):
+        """Stop accepting writes and flush everything still queued"""
+        if not self.running:
+            return
+        await self.queue.put(None)
+        await self.task
+        self.task = None
+
+    async def submit(self, op: WriteOp) -> Any:
+        """Queue a write and wait until the batch containing it has committed"""
+        future = asyncio.get_running_loop().create_future()
+        try:
+            await asyncio.wait_for(self.queue.put((op, future)), timeout=self.submit_timeout)
+        except asyncio.TimeoutError:
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail="Write queue is full, please retry shortly",
+                headers={"Retry-After": "1"},
+            )
+        return await future
+
+    async def _flush_loop(self):
+        loop = asyncio.get_running_loop()
+        stopping = False
+        while not stopping:
+            item = await self.queue.get()
+            if item is None:
+                break
+            batch = [item]
+            deadline = loop.time() + self.max_delay
+            while len(batch) < self.max_items:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    item = await asyncio.wait_for(self.queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    break
+                if item is None:
+                    stopping = True
+                    break
+                batch.append(item)
+            await self._flush(batch)
+
+        # Drain anything queued behind the stop marker
+        remaining = []
+        while not self.queue.empty():
+            item = self.queue.get_nowait()
+            if item is not None:
+                remaining.append(item)
+        if remaining:
+            await self._flush(remaining)
+
+    async def _flush(self, batch: List[Tuple[WriteOp, asyncio.Future]]):
+        loop = asyncio.get_running_loop()
+        try:
+            outcomes = await loop.run_in_executor(None, self._apply_batch, [op for op, _ in batch])
+        except Exception as e:
+            # The commit itself failed: nothing in the batch was written
+            outcomes = [(False, e)] * len(batch)
+        for (_, future), (ok, value) in zip(batch, outcomes):
+            if future.done():
+                continue
+            if ok:
+                future.set_result(value)
+            else:
+                future.set_exception(value)
+
+    def _apply_batch(self, ops: List[WriteOp]) -> List[Tuple[bool, Any]]:
+        """Apply every op in one session, then commit once"""
+        db = self.session_factory()
+        outcomes = []
+        try:
+            for op in ops:
+                try:
+                    outcomes.append((True, op(db)))
+                except HTTPException as e:
+                    outcomes.append((False, e))
+            db.commit()
+            return outcomes
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
+
+write_coalescer = WriteCoalescer()
+
+
+async def run_write(db: Session, op: WriteOp) -> Any:
+    """
+    Apply a small write, batched with others when coalescing is running.
+    The op must compute its return value before commit and must not commit itself.
+    """
+    if write_coalescer.running:
+        return await write_coalescer.submit(op)
+    result = op(db)
+    db.commit()
+    return result
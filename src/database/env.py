@@ -23,7 +23,7 @@ from pathlib import Path
 sys.path.insert(0, str(Path(__file__).parent.parent.parent))
 
 from src.backend.database import Base
-from src.backend.models import User, Course, Assignment, Question, Testcase, Solution, Comment
+import src.backend.models  # noqa: F401  (registers every model on Base.metadata)
 
 target_metadata = Base.metadata
 
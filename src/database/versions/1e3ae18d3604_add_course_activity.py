@@ -0,0 +1,44 @@
+"""Add course_activity table
+
+Revision ID: 1e3ae18d3604
+Revises: 30e971d0b0b9
+Create Date: 2026-10-18 12:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '1e3ae18d3604'
+down_revision: Union[str, None] = '30e971d0b0b9'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # init_db() may have created these tables with create_all before this revision ran
+    existing = sa.inspect(op.get_bind()).get_table_names()
+    if 'course_activity' not in existing:
+        op.create_table('course_activity',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('course_id', sa.Integer(), nullable=False),
+        sa.Column('topic_id', sa.Integer(), nullable=False),
+        sa.Column('note_id', sa.Integer(), nullable=False),
+        sa.Column('comment_id', sa.Integer(), nullable=True),
+        sa.Column('kind', sa.String(length=20), nullable=False),
+        sa.Column('author_id', sa.Integer(), nullable=False),
+        sa.Column('title', sa.String(length=200), nullable=False),
+        sa.Column('excerpt', sa.String(length=300), nullable=True),
+        sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.func.now(), nullable=True),
+        sa.PrimaryKeyConstraint('id'),
+        sqlite_autoincrement=True
+        )
+        op.create_index('ix_course_activity_course_id_id', 'course_activity', ['course_id', 'id'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_course_activity_course_id_id', table_name='course_activity')
+    op.drop_table('course_activity')
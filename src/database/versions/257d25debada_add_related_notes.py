@@ -0,0 +1,58 @@
+"""Add note_terms, related_notes and related_state tables
+
+Revision ID: 257d25debada
+Revises: f8f2ee94d8b9
+Create Date: 2026-10-18 12:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '257d25debada'
+down_revision: Union[str, None] = 'f8f2ee94d8b9'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # init_db() may have created these tables with create_all before this revision ran
+    existing = sa.inspect(op.get_bind()).get_table_names()
+    if 'note_terms' not in existing:
+        op.create_table('note_terms',
+        sa.Column('note_id', sa.Integer(), nullable=False),
+        sa.Column('feature', sa.Integer(), nullable=False),
+        sa.Column('weight', sa.Float(), nullable=False),
+        sa.ForeignKeyConstraint(['note_id'], ['study_notes.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('note_id', 'feature')
+        )
+        op.create_index('ix_note_terms_feature', 'note_terms', ['feature'], unique=False)
+    if 'related_notes' not in existing:
+        op.create_table('related_notes',
+        sa.Column('note_id', sa.Integer(), nullable=False),
+        sa.Column('related_id', sa.Integer(), nullable=False),
+        sa.Column('score', sa.Float(), nullable=False),
+        sa.ForeignKeyConstraint(['note_id'], ['study_notes.id'], ondelete='CASCADE'),
+        sa.ForeignKeyConstraint(['related_id'], ['study_notes.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('note_id', 'related_id')
+        )
+        op.create_index('ix_related_notes_related', 'related_notes', ['related_id'], unique=False)
+    if 'related_state' not in existing:
+        op.create_table('related_state',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('document_count', sa.Integer(), nullable=False),
+        sa.Column('document_frequencies', sa.LargeBinary(), nullable=False),
+        sa.Column('updated_at', sa.DateTime(), nullable=False),
+        sa.PrimaryKeyConstraint('id')
+        )
+
+
+def downgrade() -> None:
+    op.drop_table('related_state')
+    op.drop_index('ix_related_notes_related', table_name='related_notes')
+    op.drop_table('related_notes')
+    op.drop_index('ix_note_terms_feature', table_name='note_terms')
+    op.drop_table('note_terms')
@@ -0,0 +1,49 @@
+"""Add note_rankings and ranking_state tables
+
+Revision ID: 30e971d0b0b9
+Revises: 1a0209554e78
+Create Date: 2026-10-18 12:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '30e971d0b0b9'
+down_revision: Union[str, None] = '1a0209554e78'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # init_db() may have created these tables with create_all before this revision ran
+    existing = sa.inspect(op.get_bind()).get_table_names()
+    if 'note_rankings' not in existing:
+        op.create_table('note_rankings',
+        sa.Column('note_id', sa.Integer(), nullable=False),
+        sa.Column('topic_id', sa.Integer(), nullable=False),
+        sa.Column('course_id', sa.Integer(), nullable=False),
+        sa.Column('hot_score', sa.Float(), nullable=False),
+        sa.ForeignKeyConstraint(['note_id'], ['study_notes.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('note_id')
+        )
+        op.create_index('ix_note_rankings_course_hot', 'note_rankings', ['course_id', 'hot_score'], unique=False)
+        op.create_index('ix_note_rankings_hot', 'note_rankings', ['hot_score'], unique=False)
+        op.create_index('ix_note_rankings_topic_hot', 'note_rankings', ['topic_id', 'hot_score'], unique=False)
+    if 'ranking_state' not in existing:
+        op.create_table('ranking_state',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('last_decay_at', sa.Float(), nullable=False),
+        sa.PrimaryKeyConstraint('id')
+        )
+
+
+def downgrade() -> None:
+    op.drop_table('ranking_state')
+    op.drop_index('ix_note_rankings_course_hot', table_name='note_rankings')
+    op.drop_index('ix_note_rankings_hot', table_name='note_rankings')
+    op.drop_index('ix_note_rankings_topic_hot', table_name='note_rankings')
+    op.drop_table('note_rankings')
@@ -0,0 +1,47 @@
+"""Add note_attachments table
+
+Revision ID: 5e80a522cad3
+Revises: 755004bb6558
+Create Date: 2026-10-18 12:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '5e80a522cad3'
+down_revision: Union[str, None] = '755004bb6558'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # init_db() may have created these tables with create_all before this revision ran
+    existing = sa.inspect(op.get_bind()).get_table_names()
+    if 'note_attachments' not in existing:
+        op.create_table('note_attachments',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('note_id', sa.Integer(), nullable=False),
+        sa.Column('filename', sa.String(length=255), nullable=False),
+        sa.Column('content_type', sa.String(length=100), nullable=False),
+        sa.Column('size', sa.Integer(), nullable=False),
+        sa.Column('sha256', sa.String(length=64), nullable=False),
+        sa.Column('uploader_id', sa.Integer(), nullable=False),
+        sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.func.now(), nullable=True),
+        sa.ForeignKeyConstraint(['note_id'], ['study_notes.id'], ondelete='CASCADE'),
+        sa.ForeignKeyConstraint(['uploader_id'], ['users.id'], ),
+        sa.PrimaryKeyConstraint('id')
+        )
+        op.create_index(op.f('ix_note_attachments_id'), 'note_attachments', ['id'], unique=False)
+        op.create_index(op.f('ix_note_attachments_note_id'), 'note_attachments', ['note_id'], unique=False)
+        op.create_index(op.f('ix_note_attachments_sha256'), 'note_attachments', ['sha256'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index(op.f('ix_note_attachments_id'), table_name='note_attachments')
+    op.drop_index(op.f('ix_note_attachments_note_id'), table_name='note_attachments')
+    op.drop_index(op.f('ix_note_attachments_sha256'), table_name='note_attachments')
+    op.drop_table('note_attachments')
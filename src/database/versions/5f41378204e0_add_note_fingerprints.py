@@ -0,0 +1,52 @@
+"""Add note_fingerprints and note_lsh_buckets tables
+
+Revision ID: 5f41378204e0
+Revises: 5e80a522cad3
+Create Date: 2026-10-18 12:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '5f41378204e0'
+down_revision: Union[str, None] = '5e80a522cad3'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # init_db() may have created these tables with create_all before this revision ran
+    existing = sa.inspect(op.get_bind()).get_table_names()
+    if 'note_fingerprints' not in existing:
+        op.create_table('note_fingerprints',
+        sa.Column('note_id', sa.Integer(), nullable=False),
+        sa.Column('topic_id', sa.Integer(), nullable=False),
+        sa.Column('content_hash', sa.String(length=64), nullable=False),
+        sa.Column('signature', sa.LargeBinary(), nullable=True),
+        sa.Column('duplicate_of', sa.Integer(), nullable=True),
+        sa.ForeignKeyConstraint(['note_id'], ['study_notes.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('note_id')
+        )
+        op.create_index(op.f('ix_note_fingerprints_duplicate_of'), 'note_fingerprints', ['duplicate_of'], unique=False)
+        op.create_index('ix_note_fingerprints_topic_hash', 'note_fingerprints', ['topic_id', 'content_hash'], unique=False)
+    if 'note_lsh_buckets' not in existing:
+        op.create_table('note_lsh_buckets',
+        sa.Column('note_id', sa.Integer(), nullable=False),
+        sa.Column('bucket', sa.BigInteger().with_variant(sa.Integer(), 'sqlite'), nullable=False),
+        sa.Column('topic_id', sa.Integer(), nullable=False),
+        sa.ForeignKeyConstraint(['note_id'], ['study_notes.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('note_id', 'bucket')
+        )
+        op.create_index('ix_note_lsh_buckets_topic_bucket', 'note_lsh_buckets', ['topic_id', 'bucket'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_note_lsh_buckets_topic_bucket', table_name='note_lsh_buckets')
+    op.drop_table('note_lsh_buckets')
+    op.drop_index(op.f('ix_note_fingerprints_duplicate_of'), table_name='note_fingerprints')
+    op.drop_index('ix_note_fingerprints_topic_hash', table_name='note_fingerprints')
+    op.drop_table('note_fingerprints')
@@ -0,0 +1,29 @@
+"""Never reuse topic ids
+
+Revision ID: 6035511363f1
+Revises: 9c4e1f2a7b30
+Create Date: 2026-10-19 15:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '6035511363f1'
+down_revision: Union[str, None] = '9c4e1f2a7b30'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # SQLite can only add AUTOINCREMENT by rebuilding the table
+    with op.batch_alter_table('topics', recreate='always', table_kwargs={'sqlite_autoincrement': True}):
+        pass
+
+
+def downgrade() -> None:
+    with op.batch_alter_table('topics', recreate='always', table_kwargs={'sqlite_autoincrement': False}):
+        pass
@@ -0,0 +1,51 @@
+"""Add jobs table
+
+Revision ID: 61fef48699e0
+Revises: fdd61b4ec198
+Create Date: 2026-10-18 12:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '61fef48699e0'
+down_revision: Union[str, None] = 'fdd61b4ec198'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # init_db() may have created these tables with create_all before this revision ran
+    existing = sa.inspect(op.get_bind()).get_table_names()
+    if 'jobs' not in existing:
+        op.create_table('jobs',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('job_type', sa.String(length=50), nullable=False),
+        sa.Column('payload', sa.Text(), nullable=False),
+        sa.Column('priority', sa.Integer(), nullable=False),
+        sa.Column('status', sa.String(length=20), nullable=False),
+        sa.Column('idempotency_key', sa.String(length=200), nullable=True),
+        sa.Column('attempts', sa.Integer(), nullable=False),
+        sa.Column('max_attempts', sa.Integer(), nullable=False),
+        sa.Column('run_after', sa.DateTime(), nullable=False),
+        sa.Column('locked_by', sa.String(length=64), nullable=True),
+        sa.Column('locked_at', sa.DateTime(), nullable=True),
+        sa.Column('last_error', sa.Text(), nullable=True),
+        sa.Column('created_at', sa.DateTime(), nullable=False),
+        sa.Column('finished_at', sa.DateTime(), nullable=True),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('idempotency_key'),
+        sqlite_autoincrement=True
+        )
+        op.create_index('ix_jobs_status_priority', 'jobs', ['status', 'priority', 'id'], unique=False)
+        op.create_index('ix_jobs_type_status', 'jobs', ['job_type', 'status'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_jobs_status_priority', table_name='jobs')
+    op.drop_index('ix_jobs_type_status', table_name='jobs')
+    op.drop_table('jobs')
@@ -0,0 +1,45 @@
+"""Add note_revisions table
+
+Revision ID: 755004bb6558
+Revises: 1e3ae18d3604
+Create Date: 2026-10-18 12:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '755004bb6558'
+down_revision: Union[str, None] = '1e3ae18d3604'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # init_db() may have created these tables with create_all before this revision ran
+    existing = sa.inspect(op.get_bind()).get_table_names()
+    if 'note_revisions' not in existing:
+        op.create_table('note_revisions',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('note_id', sa.Integer(), nullable=False),
+        sa.Column('revision', sa.Integer(), nullable=False),
+        sa.Column('is_snapshot', sa.Boolean(), nullable=False),
+        sa.Column('data', sa.LargeBinary(), nullable=False),
+        sa.Column('content_size', sa.Integer(), nullable=False),
+        sa.Column('title', sa.String(length=200), nullable=False),
+        sa.Column('summary', sa.String(length=500), nullable=True),
+        sa.Column('note_type', sa.Enum('Summary', 'Lecture', 'Code', 'Other', name='notetype'), nullable=False),
+        sa.Column('editor_id', sa.Integer(), nullable=False),
+        sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.func.now(), nullable=True),
+        sa.ForeignKeyConstraint(['editor_id'], ['users.id'], ),
+        sa.ForeignKeyConstraint(['note_id'], ['study_notes.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('note_id', 'revision', name='uq_note_revisions_note_revision')
+        )
+
+
+def downgrade() -> None:
+    op.drop_table('note_revisions')
@@ -0,0 +1,36 @@
+"""Add used_refresh_tokens table
+
+Revision ID: 9c4e1f2a7b30
+Revises: 257d25debada
+Create Date: 2026-10-19 12:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '9c4e1f2a7b30'
+down_revision: Union[str, None] = '257d25debada'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # init_db() may have created these tables with create_all before this revision ran
+    existing = sa.inspect(op.get_bind()).get_table_names()
+    if 'used_refresh_tokens' not in existing:
+        op.create_table('used_refresh_tokens',
+        sa.Column('jti', sa.String(length=32), nullable=False),
+        sa.Column('session_id', sa.String(length=32), nullable=False),
+        sa.Column('expires_at', sa.DateTime(), nullable=False),
+        sa.PrimaryKeyConstraint('jti')
+        )
+        op.create_index(op.f('ix_used_refresh_tokens_expires_at'), 'used_refresh_tokens', ['expires_at'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index(op.f('ix_used_refresh_tokens_expires_at'), table_name='used_refresh_tokens')
+    op.drop_table('used_refresh_tokens')
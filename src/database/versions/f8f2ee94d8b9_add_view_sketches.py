@@ -0,0 +1,37 @@
+"""Add view_sketches table
+
+Revision ID: f8f2ee94d8b9
+Revises: 61fef48699e0
+Create Date: 2026-10-18 12:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'f8f2ee94d8b9'
+down_revision: Union[str, None] = '61fef48699e0'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # init_db() may have created these tables with create_all before this revision ran
+    existing = sa.inspect(op.get_bind()).get_table_names()
+    if 'view_sketches' not in existing:
+        op.create_table('view_sketches',
+        sa.Column('scope', sa.String(length=10), nullable=False),
+        sa.Column('scope_id', sa.Integer(), nullable=False),
+        sa.Column('views', sa.Integer(), nullable=False),
+        sa.Column('unique_viewers', sa.Integer(), nullable=False),
+        sa.Column('sketch', sa.LargeBinary(), nullable=False),
+        sa.Column('updated_at', sa.DateTime(), nullable=False),
+        sa.PrimaryKeyConstraint('scope', 'scope_id')
+        )
+
+
+def downgrade() -> None:
+    op.drop_table('view_sketches')
@@ -0,0 +1,40 @@
+"""Add revoked_sessions table
+
+Revision ID: fdd61b4ec198
+Revises: 803d04ff5913
+Create Date: 2026-10-18 12:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'fdd61b4ec198'
+down_revision: Union[str, None] = '803d04ff5913'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # init_db() may have created these tables with create_all before this revision ran
+    existing = sa.inspect(op.get_bind()).get_table_names()
+    if 'revoked_sessions' not in existing:
+        op.create_table('revoked_sessions',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('session_id', sa.String(length=32), nullable=False),
+        sa.Column('expires_at', sa.DateTime(), nullable=False),
+        sa.Column('revoked_at', sa.DateTime(timezone=True), server_default=sa.func.now(), nullable=True),
+        sa.PrimaryKeyConstraint('id'),
+        sqlite_autoincrement=True
+        )
+        op.create_index(op.f('ix_revoked_sessions_expires_at'), 'revoked_sessions', ['expires_at'], unique=False)
+        op.create_index(op.f('ix_revoked_sessions_session_id'), 'revoked_sessions', ['session_id'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index(op.f('ix_revoked_sessions_expires_at'), table_name='revoked_sessions')
+    op.drop_index(op.f('ix_revoked_sessions_session_id'), table_name='revoked_sessions')
+    op.drop_table('revoked_sessions')
@@ -28,7 +28,7 @@ export const AuthProvider: React.FC<{ children: ReactNode }> = ({ children }) =>
         .catch((error) => {
           // Clear invalid token
           console.log('Token validation failed:', error.message);
-          localStorage.removeItem('token');
+          apiClient.clearTokens();
         })
         .finally(() => setLoading(false));
     } else {
@@ -38,18 +38,19 @@ export const AuthProvider: React.FC<{ children: ReactNode }> = ({ children }) =>
 
   const login = async (credentials: LoginRequest) => {
     const response = await apiClient.login(credentials);
-    localStorage.setItem('token', response.access_token);
+    apiClient.storeTokens(response);
     setUser(response.user);
   };
 
   const signup = async (data: SignupRequest) => {
     const response = await apiClient.signup(data);
-    localStorage.setItem('token', response.access_token);
+    apiClient.storeTokens(response);
     setUser(response.user);
   };
 
   const logout = () => {
-    localStorage.removeItem('token');
+    // Revokes the session server-side; the local tokens are cleared immediately
+    apiClient.logout();
     setUser(null);
   };
 
@@ -6,6 +6,8 @@ import type {
   SignupRequest,
   User,
   Course,
+  CourseSuggestion,
+  RosterReport,
   CourseCreate,
   Topic,
   TopicCreate,
@@ -13,9 +15,13 @@ import type {
   StudyNoteCreate,
   Comment,
   CommentCreate,
+  LiveEvent,
+  StreamTicket,
 } from './types';
 
 const API_BASE_URL = 'http://localhost:8000/api';
+// A 401 from these means bad credentials, not an expired access token
+const NO_REFRESH_ENDPOINTS = ['/auth/login', '/auth/signup', '/auth/refresh', '/auth/logout'];
 
 class ApiClient {
   private getAuthHeader(): HeadersInit {
@@ -23,9 +29,46 @@ class ApiClient {
     return token ? { Authorization: `Bearer ${token}` } : {};
   }
 
+  // Shared by concurrent requests that hit an expired access token at the same time
+  private refreshing: Promise<boolean> | null = null;
+
+  storeTokens(response: AuthResponse) {
+    localStorage.setItem('token', response.access_token);
+    localStorage.setItem('refreshToken', response.refresh_token);
+  }
+
+  clearTokens() {
+    localStorage.removeItem('token');
+    localStorage.removeItem('refreshToken');
+  }
+
+  // Access tokens are short-lived; swap the refresh token for a new pair
+  private refreshTokens(): Promise<boolean> {
+    const refreshToken = localStorage.getItem('refreshToken');
+    if (!refreshToken) return Promise.resolve(false);
+    if (!this.refreshing) {
+      this.refreshing = fetch(`${API_BASE_URL}/auth/refresh`, {
+        method: 'POST',
+        headers: { 'Content-Type': 'application/json' },
+        body: JSON.stringify({ refresh_token: refreshToken }),
+      })
+        .then(async (response) => {
+          if (!response.ok) return false;
+          this.storeTokens(await response.json());
+          return true;
+        })
+        .catch(() => false)
+        .finally(() => {
+          this.refreshing = null;
+        });
+    }
+    return this.refreshing;
+  }
+
   private async request<T>(
     endpoint: string,
-    options: RequestInit = {}
+    options: RequestInit = {},
+    retried = false
   ): Promise<T> {
     try {
       const response = await fetch(`${API_BASE_URL}${endpoint}`, {
@@ -37,6 +80,10 @@ class ApiClient {
         },
       });
 
+      if (response.status === 401 && !retried && !NO_REFRESH_ENDPOINTS.includes(endpoint) && (await this.refreshTokens())) {
+        return this.request<T>(endpoint, options, true);
+      }
+
       if (!response.ok) {
         const error = await response.json().catch(() => ({ detail: 'Request failed' }));
         throw new Error(error.detail || `HTTP ${response.status}`);
@@ -71,11 +118,27 @@ class ApiClient {
     return this.request<User>('/auth/me');
   }
 
+  async logout(): Promise<void> {
+    const refreshToken = localStorage.getItem('refreshToken');
+    this.clearTokens();
+    if (refreshToken) {
+      await this.request('/auth/logout', {
+        method: 'POST',
+        body: JSON.stringify({ refresh_token: refreshToken }),
+      }).catch(() => undefined);
+    }
+  }
+
   // Courses
   async getCourses(): Promise<Course[]> {
     return this.request<Course[]>('/courses/');
   }
 
+  async searchCourses(query: string, limit = 10): Promise<CourseSuggestion[]> {
+    const params = new URLSearchParams({ q: query, limit: String(limit) });
+    return this.request<CourseSuggestion[]>(`/courses/search?${params}`);
+  }
+
   async getCourse(id: number): Promise<Course> {
     return this.request<Course>(`/courses/${id}`);
   }
@@ -91,6 +154,15 @@ class ApiClient {
     return this.request(`/courses/${courseId}/enroll`, { method: 'POST' });
   }
 
+  // Roster file: CSV with one username or email per row, or a JSON list
+  async uploadRoster(courseId: number, roster: File): Promise<RosterReport> {
+    return this.request<RosterReport>(`/courses/${courseId}/roster`, {
+      method: 'POST',
+      headers: { 'Content-Type': roster.type === 'application/json' ? 'application/json' : 'text/csv' },
+      body: roster,
+    });
+  }
+
   async updateCourse(id: number, data: Partial<CourseCreate>): Promise<Course> {
     return this.request<Course>(`/courses/${id}`, {
       method: 'PUT',
@@ -164,6 +236,53 @@ class ApiClient {
       body: JSON.stringify(data),
     });
   }
+
+  // Real-time updates (Server-Sent Events)
+  // Returns a function that closes the stream
+  subscribe(
+    targets: { note?: number; topic?: number; course?: number },
+    onEvent: (event: LiveEvent) => void,
+    onResync?: () => void
+  ): () => void {
+    const params = new URLSearchParams();
+    Object.entries(targets).forEach(([key, value]) => {
+      if (value !== undefined) params.append(key, String(value));
+    });
+    let source: EventSource | null = null;
+    let closed = false;
+
+    // EventSource can't send headers, so each connection opens with a
+    // short-lived stream ticket instead of the access token
+    const open = async () => {
+      try {
+        const { ticket } = await this.request<StreamTicket>('/events/ticket', { method: 'POST' });
+        if (closed) return;
+        params.set('ticket', ticket);
+        source = new EventSource(`${API_BASE_URL}/events/?${params}`);
+      } catch {
+        if (!closed) setTimeout(open, 3000);
+        return;
+      }
+      source.onmessage = (message) => onEvent(JSON.parse(message.data));
+      // Sent when this client fell behind and missed events
+      if (onResync) source.addEventListener('resync', onResync);
+      source.onerror = () => {
+        // The browser's own retry reuses the expired ticket, so reconnect with a new one
+        if (source?.readyState !== EventSource.CLOSED || closed) return;
+        setTimeout(() => {
+          if (closed) return;
+          onResync?.();
+          open();
+        }, 3000);
+      };
+    };
+    open();
+
+    return () => {
+      closed = true;
+      source?.close();
+    };
+  }
 }
 
 export const apiClient = new ApiClient();
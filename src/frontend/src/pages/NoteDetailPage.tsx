@@ -21,6 +21,27 @@ export const NoteDetailPage = () => {
     }
   }, [noteId]);
 
+  // Live edits, likes and comments from other users
+  useEffect(() => {
+    if (!noteId) return;
+    const id = parseInt(noteId);
+    return apiClient.subscribe(
+      { note: id },
+      (event) => {
+        if (event.type === 'note_liked') {
+          setNote((current) => current && { ...current, likes: event.data.likes });
+        } else if (event.type === 'note_updated') {
+          setNote(event.data);
+        } else if (event.type === 'comment_added') {
+          setComments((current) =>
+            current.some((c) => c.id === event.data.id) ? current : [...current, event.data]
+          );
+        }
+      },
+      () => loadNoteData(id)
+    );
+  }, [noteId]);
+
   useEffect(() => {
     if (note) {
       // Simple regex-based ToC generator
@@ -76,7 +97,9 @@ export const NoteDetailPage = () => {
         note_id: note.id,
         content: newComment,
       });
-      setComments([...comments, comment]);
+      setComments((current) =>
+        current.some((c) => c.id === comment.id) ? current : [...current, comment]
+      );
       setNewComment('');
     } catch (err) {
       alert(err instanceof Error ? err.message : 'Failed to add comment');
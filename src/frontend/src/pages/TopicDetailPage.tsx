@@ -28,6 +28,29 @@ export const TopicDetailPage = () => {
     }
   }, [topicId]);
 
+  // Live note activity in this topic
+  useEffect(() => {
+    if (!topicId) return;
+    const id = parseInt(topicId);
+    return apiClient.subscribe(
+      { topic: id },
+      (event) => {
+        if (event.type === 'note_created') {
+          setNotes((current) =>
+            current.some((n) => n.id === event.data.id) ? current : [...current, event.data]
+          );
+        } else if (event.type === 'note_deleted') {
+          setNotes((current) => current.filter((n) => n.id !== event.data.note_id));
+        } else if (event.type === 'note_liked') {
+          setNotes((current) =>
+            current.map((n) => (n.id === event.data.note_id ? { ...n, likes: event.data.likes } : n))
+          );
+        }
+      },
+      () => loadTopicData(id)
+    );
+  }, [topicId]);
+
   const loadTopicData = async (id: number) => {
     try {
       const [topicData, notesData] = await Promise.all([
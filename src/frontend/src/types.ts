@@ -22,7 +22,9 @@ export interface SignupRequest {
 
 export interface AuthResponse {
   access_token: string;
+  refresh_token: string;
   token_type: string;
+  expires_in: number;
   user: User;
 }
 
@@ -36,6 +38,27 @@ export interface Course {
   is_enrolled?: boolean;
 }
 
+export interface CourseSuggestion {
+  id: number;
+  course_code: string;
+  course_name: string;
+}
+
+export type RosterRowStatus =
+  | 'enrolled'
+  | 'already_enrolled'
+  | 'not_found'
+  | 'duplicate'
+  | 'not_a_student'
+  | 'invalid';
+
+export interface RosterReport {
+  course_id: number;
+  total: number;
+  counts: Partial<Record<RosterRowStatus, number>>;
+  rows: { row: number; identifier: string; status: RosterRowStatus; user_id?: number }[];
+}
+
 export interface CourseCreate {
   course_code: string;
   course_name: string;
@@ -90,3 +113,17 @@ export interface CommentCreate {
   note_id: number;
   content: string;
 }
+
+// Short-lived credential for opening /api/events from an EventSource
+export interface StreamTicket {
+  ticket: string;
+  expires_in: number;
+}
+
+// Real-time update pushed over /api/events
+export type LiveEvent =
+  | { type: 'note_created'; channels: string[]; data: StudyNote }
+  | { type: 'note_updated'; channels: string[]; data: StudyNote }
+  | { type: 'note_liked'; channels: string[]; data: { note_id: number; likes: number } }
+  | { type: 'comment_added'; channels: string[]; data: Comment }
+  | { type: 'note_deleted'; channels: string[]; data: { note_id: number } };
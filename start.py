@@ -6,12 +6,19 @@ This script will:
 2. Clean up old processes and files
 3. Rebuild frontend
 4. Restart everything fresh
+
+Pass --production to serve the backend with multiple gunicorn/uvicorn workers.
 """
 
+import argparse
+import json
+import multiprocessing
+import shutil
 import subprocess
 import os
 import sys
 import time
+import urllib.request
 
 class Colors:
     GREEN = '\033[92m'
@@ -42,7 +49,60 @@ def run_command(cmd, description, ignore_errors=False):
         print(f"    Error: {e}")
         return False
 
+def backend_command(production, workers):
+    """Build the backend server command line"""
+    if not production:
+        return [".venv/bin/uvicorn", "src.backend.main:app", "--host", "0.0.0.0", "--port", "8000", "--no-access-log"]
+    if os.path.exists(".venv/bin/gunicorn") or shutil.which("gunicorn"):
+        gunicorn = ".venv/bin/gunicorn" if os.path.exists(".venv/bin/gunicorn") else "gunicorn"
+        return [gunicorn, "-c", "gunicorn.conf.py", "--workers", str(workers), "src.backend.main:app"]
+    # Fallback when gunicorn is unavailable: no preload or HUP reload, but still multi-core
+    return [
+        ".venv/bin/uvicorn", "src.backend.main:app", "--host", "0.0.0.0", "--port", "8000",
+        "--workers", str(workers), "--loop", "uvloop", "--http", "httptools",
+        "--backlog", "2048", "--timeout-keep-alive", "5", "--no-access-log",
+    ]
+
+
+def start_background(cmd, log_path, description):
+    """Start a long-running process detached from this script, logging to a file"""
+    print(f"  → {description}...", end=" ")
+    try:
+        with open(log_path, "w") as log_file:
+            subprocess.Popen(cmd, stdout=log_file, stderr=subprocess.STDOUT, start_new_session=True)
+        print(f"{Colors.GREEN}✓{Colors.END}")
+        return True
+    except OSError as e:
+        print(f"{Colors.RED}✗{Colors.END}")
+        print(f"    Error: {e}")
+        return False
+
+
+def wait_for_ready(url, timeout_seconds=30):
+    """Poll a readiness endpoint until it answers 200 with status "ready" """
+    deadline = time.monotonic() + timeout_seconds
+    while time.monotonic() < deadline:
+        try:
+            with urllib.request.urlopen(url, timeout=1) as response:
+                if response.status == 200 and json.load(response).get("status") == "ready":
+                    return True
+        except (OSError, ValueError):
+            pass
+        time.sleep(0.25)
+    return False
+
+
 def main():
+    parser = argparse.ArgumentParser(description="Start the SE-StudyCenter backend and frontend")
+    parser.add_argument("--production", action="store_true", help="run the backend with multiple workers")
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=int(os.getenv("WCAH_WORKERS", multiprocessing.cpu_count())),
+        help="backend worker processes in production mode (default: CPU count)",
+    )
+    args = parser.parse_args()
+
     print(f"{Colors.BOLD}{Colors.BLUE}")
     print(f"  {Colors.BOLD}SE-StudyCenter - Startup Script                             ║")
     print(f"║         Starting Backend and Frontend Services                  ║")
@@ -55,6 +115,7 @@ def main():
     
     print_step(1, "Stopping existing servers")
     run_command("pkill -f 'uvicorn.*8000'", "Stopping backend", ignore_errors=True)
+    run_command("pkill -f 'gunicorn.*src.backend.main'", "Stopping production backend", ignore_errors=True)
     run_command("pkill -f 'vite'", "Stopping frontend", ignore_errors=True)
     time.sleep(2)
     
@@ -86,25 +147,14 @@ def main():
     run_command("cd src/frontend && npm install --legacy-peer-deps --silent", "Installing npm packages")
     
     print_step(8, "Starting backend server")
-    backend_cmd = ".venv/bin/uvicorn src.backend.main:app --host 0.0.0.0 --port 8000 > /tmp/wcah-backend.log 2>&1 &"
-    run_command(backend_cmd, "Starting backend")
+    mode = f"{args.workers} workers" if args.production else "development"
+    if not start_background(backend_command(args.production, args.workers), "/tmp/wcah-backend.log", f"Starting backend ({mode})"):
+        sys.exit(1)
     
     print_step(9, "Waiting for backend to be ready")
-    print(f"  → Checking backend health...", end=" ")
-    for i in range(20):
-        try:
-            result = subprocess.run(
-                ["curl", "-s", "http://localhost:8000/api/health"],
-                capture_output=True,
-                text=True,
-                timeout=1
-            )
-            if '"status":"healthy"' in result.stdout:
-                print(f"{Colors.GREEN}✓{Colors.END}")
-                break
-        except:
-            pass
-        time.sleep(0.5)
+    print(f"  → Checking backend readiness...", end=" ")
+    if wait_for_ready("http://localhost:8000/api/ready"):
+        print(f"{Colors.GREEN}✓{Colors.END}")
     else:
         print(f"{Colors.RED}✗ Backend didn't start{Colors.END}")
         print(f"{Colors.YELLOW}Check logs: tail -f /tmp/wcah-backend.log{Colors.END}")
@@ -158,8 +208,15 @@ def main():
     print(f"  Backend:  tail -f /tmp/wcah-backend.log")
     print(f"  Frontend: tail -f /tmp/wcah-frontend.log")
     
+    if args.production:
+        print(f"\n{Colors.BOLD}🔄 Deploy new backend code without downtime:{Colors.END}")
+        print(f"  OLD=$(cat /tmp/wcah-backend.pid)")
+        print(f"  kill -USR2 $OLD")
+        print(f"  kill -TERM $OLD   # once the new workers are up")
+        print(f"  (kill -HUP only restarts workers on the preloaded code)")
+    
     print(f"\n{Colors.BOLD}🛑 To stop servers:{Colors.END}")
-    print(f"  pkill -f uvicorn && pkill -f vite")
+    print(f"  pkill -f uvicorn && pkill -f gunicorn && pkill -f vite")
     
     print(f"\n{Colors.GREEN}✓ Setup complete! Open http://localhost:5173 in your browser{Colors.END}\n")
 